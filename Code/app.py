@@ -1,26 +1,33 @@
 """
 app.py
 Servidor Flask local que orquesta el pipeline:
-  PDF → pdf_extractor → llm_extractor → normalizer → generar_modelo211 → descarga
+  PDF → pdf_extractor → llm_extractor → normalizer → generar_modelo211_from_dict → descarga
 
 Rutas:
   GET  /          → landing publica (landing.html)
   GET  /app       → interfaz web autenticada (generic.html)
-  POST /process   → ejecuta el pipeline completo, devuelve JSON con preview
-  GET  /download  → descarga Output/211.txt
+  POST /process   → encola el pipeline completo, devuelve 202 {job_id}
+  GET  /jobs/<job_id> → estado del trabajo y, al terminar, JSON con preview
+  GET  /diagnostics/<job_id> → diagnóstico completo campo a campo (solo su dueño)
+  GET  /download/<job_id> → descarga el 211.txt de ese job
+  GET  /admin/budget → gasto en OpenAI agrupado por día/endpoint/modelo/usuario (admin)
+  GET  /metrics      → métricas Prometheus (Bearer METRICS_TOKEN o admin)
+  GET  /admin/profiles[/<id>] → perfiles de peticiones con X-Profile: 1 (admin)
 """
 
+import hmac
 import json
+import time
 import os
+import re
 import sys
-import tempfile
-import time
 import threading
+from concurrent.futures import FIRST_EXCEPTION, CancelledError, ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 
 from dotenv import load_dotenv
-from flask import Flask, jsonify, render_template, request, send_file
+from flask import Flask, g, jsonify, render_template, request, send_file
 
 # ── Rutas del proyecto ────────────────────────────────────────────────────────
 
@@ -32,9 +39,12 @@ if env_file.exists():
     load_dotenv(env_file, override=False)
 
 from llm_extractor import extraer_campos_llm          # noqa: E402
-from modelo211_generator import generar_modelo211     # noqa: E402
+from modelo211_generator import (                     # noqa: E402
+    generar_modelo211_from_dict, guardar_trazabilidad, precargar_layouts,
+)
 from normalizer import normalizar_datos               # noqa: E402
-from pdf_extractor import extraer_texto_pdf           # noqa: E402
+from pdf_extractor import unir_paginas                 # noqa: E402
+from pdf_ingest import PdfInvalido, leer_subida       # noqa: E402
 from comprobacion_extractor import (                  # noqa: E402
     extraer_datos_escritura, extraer_datos_211, extraer_datos_600,
 )
@@ -43,7 +53,17 @@ from hoja_extractor import (                                   # noqa: E402
     extraer_datos_hoja, verificar_hoja,
     extraer_datos_hoja_por_pagina, emparejar_hojas,
 )
+from artifact_store import store as artifact_store              # noqa: E402
+from job_queue import JobError, queue as job_queue              # noqa: E402
+from rate_limiter import limiter as rate_limiter                # noqa: E402
+import enrutador_paginas                                        # noqa: E402
+import metrics                                                  # noqa: E402
+import profiler                                                 # noqa: E402
+from budget_ledger import (                                     # noqa: E402
+    AGRUPACIONES, fijar_contexto, ledger as budget, restaurar_contexto,
+)
 from auth import (                                              # noqa: E402
+    require_admin,
     require_auth,
     cleanup_orphan_user,
     SUPABASE_URL as _SUPABASE_URL,
@@ -67,51 +87,97 @@ try:
     logging.info("[MODELIA] chatbot blueprint registered")
 except Exception as exc:
     logging.warning(f"[MODELIA] chatbot disabled ({type(exc).__name__}: {exc})")
+
+# Compilar los diseños de registro del 211 una sola vez por worker
+precargar_layouts()
+
+# /metrics agrega las métricas de todos los workers de gunicorn
+metrics.activar_compartido()
+
+
+@app.before_request
+def _metrics_inicio():
+    g.metrics_t0 = time.perf_counter()
+
+
+@app.after_request
+def _metrics_fin(response):
+    t0 = g.pop("metrics_t0", None)
+    if t0 is not None:
+        ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+        metrics.observar("modelia_http_peticion_segundos", time.perf_counter() - t0,
+                         ruta=ruta, metodo=request.method, estado=response.status_code)
+        if response.status_code >= 500:
+            metrics.incrementar("modelia_errores_total", etapa="http")
+    profile_id = g.pop("profile_id", None)
+    if profile_id is not None:
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+# Escrituras de trazabilidad (JSON de entrada, diagnósticos) fuera del
+# camino crítico de /process. Un solo hilo: conserva el orden de escritura.
+_persist_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persist")
+
+
+def _guardar_trazabilidad_async(*args) -> None:
+    def _run():
+        try:
+            guardar_trazabilidad(*args)
+        except Exception as exc:
+            logging.warning(f"[PERSIST] trazabilidad no guardada ({type(exc).__name__}: {exc})")
+    _persist_pool.submit(_run)
+
+
+def _usar_cache() -> bool:
+    """
+    False si la petición pide saltarse la caché de resultados LLM
+    (campo/parámetro nocache=1 o cabecera Cache-Control: no-cache).
+    El resultado nuevo sustituye al cacheado.
+    """
+    flag = (request.form.get("nocache") or request.args.get("nocache") or "").lower()
+    if flag in ("1", "true", "yes"):
+        return False
+    return "no-cache" not in request.headers.get("Cache-Control", "").lower()
+
+
 _key = os.environ.get("OPENAI_API_KEY", "")
 logging.info(f"[MODELIA] OPENAI_API_KEY present: {bool(_key.strip())}")
 
 # ── Security: Rate limiter & daily budget ─────────────────────────────────────
 
 MAX_PDF_PAGES = 30          # Max pages per PDF to prevent runaway costs
-MAX_REQUESTS_PER_MINUTE = 5 # Per-IP rate limit
-MAX_DAILY_API_CALLS = 200   # Daily cap on OpenAI API calls
-
-_rate_lock = threading.Lock()
-_ip_requests: dict[str, list[float]] = {}   # ip -> list of timestamps
-_daily_api_calls = 0
-_daily_api_reset = time.time()
 
 
 def _check_rate_limit() -> bool:
-    """Return True if the request should be allowed, False if rate-limited."""
-    ip = request.remote_addr or "unknown"
-    now = time.time()
-    with _rate_lock:
-        timestamps = _ip_requests.get(ip, [])
-        # Keep only last 60 seconds
-        timestamps = [t for t in timestamps if now - t < 60]
-        if len(timestamps) >= MAX_REQUESTS_PER_MINUTE:
-            _ip_requests[ip] = timestamps
-            return False
-        timestamps.append(now)
-        _ip_requests[ip] = timestamps
-        return True
-
-
-def _track_api_call(count: int = 1) -> bool:
-    """Track an API call. Returns False if daily budget exceeded."""
-    global _daily_api_calls, _daily_api_reset
-    now = time.time()
-    with _rate_lock:
-        # Reset daily counter every 24h
-        if now - _daily_api_reset > 86400:
-            _daily_api_calls = 0
-            _daily_api_reset = now
-        if _daily_api_calls + count > MAX_DAILY_API_CALLS:
-            return False
-        _daily_api_calls += count
-        logging.info(f"[BUDGET] API calls today: {_daily_api_calls}/{MAX_DAILY_API_CALLS}")
-        return True
+    """Return True if the request should be allowed, False if rate-limited.
+
+    One token bucket per IP and one per authenticated user (see
+    rate_limiter); both must have a token. Public routes only use the IP.
+    """
+    claves = [f"ip:{request.remote_addr or 'unknown'}"]
+    user = getattr(g, "user", None)
+    if user and user.get("id"):
+        claves.append(f"user:{user['id']}")
+    return rate_limiter.permitir(*claves)
+
+
+def _check_budget() -> bool:
+    """Return False if today's euro budget (global or per user) is spent.
+
+    Also attributes the LLM calls made while serving this request, including
+    the ones run in worker pools, to its endpoint and user in the budget
+    ledger (see budget_ledger).
+    """
+    user_id = (getattr(g, "user", None) or {}).get("id")
+    g.budget_token = fijar_contexto(request.path, user_id)
+    return budget.permitir(user_id)
+
+
+@app.teardown_request
+def _reset_budget_context(exc):
+    token = g.pop("budget_token", None)
+    if token is not None:
+        restaurar_contexto(token)
 
 
 @app.route("/")
@@ -164,7 +230,7 @@ def api_config():
 def process():
     if not _check_rate_limit():
         return jsonify({"error": "Demasiadas peticiones. Espera un momento."}), 429
-    if not _track_api_call(1):
+    if not _check_budget():
         return jsonify({"error": "Límite diario de uso alcanzado."}), 429
 
     # Validar que se recibe un PDF
@@ -185,59 +251,112 @@ def process():
         except Exception:
             return jsonify({"error": "API Key no configurada en el servidor."}), 500
 
-    # Guardar PDF en fichero temporal
-    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    # Leer el PDF una sola vez (en memoria): el trabajo lo procesa y lo cierra
     try:
-        pdf_file.save(tmp.name)
-        tmp.close()
-        pdf_path = Path(tmp.name)
+        pdf = leer_subida(pdf_file)
+    except PdfInvalido as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    logging.info(f"[AUDIT] /process called from IP: {request.remote_addr} "
+                 f"({pdf.paginas} páginas, sha256 {pdf.sha256[:12]})")
+
+    owner = g.user.get("id")
+    try:
+        job_id = job_queue.submit("211", _pipeline_211, pdf, api_key, owner,
+                                  _usar_cache(), owner=owner)
+    except Exception as exc:
+        pdf.close()
+        return jsonify({"error": str(exc)}), 500
+    return jsonify({"ok": True, "job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
 
-        logging.info(f"[AUDIT] /process called from IP: {request.remote_addr}")
 
+# Con menos texto (capa de texto + páginas leídas con visión) no hay nada que extraer
+MIN_CARACTERES_TEXTO = 100
+
+_MENSAJE_ILEGIBLE = (
+    "Puede ser un escaneado de más de "
+    f"{enrutador_paginas.VISION_MAX_PAGINAS} páginas (no se transcriben con visión), "
+    "uno cuya transcripción no cabe en el presupuesto del día o un documento ilegible."
+)
+
+
+def _leer_texto_pdf(pdf, api_key: str, usar_cache: bool = True,
+                    paginas_info: list | None = None,
+                    cancelado: threading.Event | None = None) -> str:
+    """
+    Texto del PDF para el LLM. Cada página se lee por su capa de texto o,
+    si es escaneada, con visión (ver enrutador_paginas); deja de leer si
+    `cancelado` se activa.
+    """
+    return unir_paginas(enrutador_paginas.leer_paginas(
+        pdf, api_key, usar_cache, paginas_info, cancelado))
+
+
+def _pipeline_211(job, pdf, api_key: str, owner: str | None,
+                  usar_cache: bool = True) -> dict:
+    """PDF → texto → LLM → normalizar → 211. Corre en la cola de trabajos."""
+    try:
         # Paso 1: Extraer texto del PDF
-        texto = extraer_texto_pdf(pdf_path)
-        if len(texto.strip()) < 100:
-            return jsonify({
-                "error": (
-                    "El PDF tiene muy poco texto extraíble. "
-                    "Puede ser un documento escaneado (imagen). "
-                    f"Texto obtenido: '{texto[:300]}'"
-                )
-            }), 422
+        job.etapa("Extrayendo texto del PDF...")
+        paginas_texto = []      # ruta, motor y tiempo por página
+        texto = _leer_texto_pdf(pdf, api_key, usar_cache, paginas_texto)
+        if len(texto.strip()) < MIN_CARACTERES_TEXTO:
+            raise JobError(
+                f"El PDF tiene muy poco texto extraíble. {_MENSAJE_ILEGIBLE} "
+                f"Texto obtenido: '{texto[:300]}'",
+                http_status=422,
+            )
 
         # Paso 2: LLM → dict raw
-        raw_data = extraer_campos_llm(texto, api_key)
+        job.etapa("Identificando campos con IA...")
+        poda = {}
+        raw_data = extraer_campos_llm(texto, api_key, usar_cache=usar_cache, poda_info=poda)
 
         # Paso 3: Normalizar
-        datos_limpios = normalizar_datos(raw_data)
+        job.etapa("Normalizando datos...")
+        with metrics.cronometro("modelia_normalizacion_segundos"):
+            datos_limpios = normalizar_datos(raw_data)
 
-        # Paso 4: Guardar JSON de entrada con timestamp (trazabilidad)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        input_dir = MODELIA_DIR / "Input"
-        input_dir.mkdir(exist_ok=True)
-        json_path = input_dir / f"datos_211_{ts}.json"
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(datos_limpios, f, ensure_ascii=False, indent=2)
+        # Paso 4: Generar 211 en memoria
+        job.etapa("Generando archivo...")
+        with metrics.cronometro("modelia_generacion_segundos"):
+            contenido, diagnosticos = generar_modelo211_from_dict(datos_limpios)
 
-        # Paso 5: Generar 211.txt
-        output_dir = MODELIA_DIR / "Output"
-        output_dir.mkdir(exist_ok=True)
-        generar_modelo211(json_path, output_dir)
+        # Paso 5: 211.txt al almacén con el mismo id que el trabajo (lo sirve
+        # /download/<job_id>); JSON de entrada y diagnósticos en segundo plano
+        artifact_store.put(contenido, owner=owner, job_id=job.id)
 
-        return jsonify({
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        json_path = MODELIA_DIR / "Input" / f"datos_211_{ts}_{job.id[:8]}.json"
+        _guardar_trazabilidad_async(
+            datos_limpios, diagnosticos, json_path,
+            MODELIA_DIR / "Output" / "diagnosticos" / job.id, owner,
+        )
+
+        return {
             "ok": True,
+            "job_id": job.id,
             "json_preview": datos_limpios,
             "json_guardado": json_path.name,
-        })
-
-    except Exception as exc:
-        return jsonify({"error": str(exc)}), 500
+            "paginas_texto": paginas_texto,
+            "poda": poda,
+            "campos_error": [
+                dict(c, pagina=d["pagina"]) for d in diagnosticos for c in d["campos"]
+            ],
+        }
 
     finally:
-        try:
-            Path(tmp.name).unlink(missing_ok=True)
-        except Exception:
-            pass
+        pdf.close()
+
+
+@app.route("/jobs/<job_id>")
+@require_auth
+def job_status(job_id):
+    """Estado de un trabajo de la cola: queued | running | done | error."""
+    job = job_queue.get(job_id, owner=g.user.get("id"))
+    if job is None:
+        return jsonify({"error": "El trabajo no existe o ha caducado."}), 404
+    return jsonify(job)
 
 
 @app.route("/comprobacion", methods=["POST"])
@@ -245,7 +364,7 @@ def process():
 def comprobacion():
     if not _check_rate_limit():
         return jsonify({"error": "Demasiadas peticiones. Espera un momento."}), 429
-    if not _track_api_call(3):
+    if not _check_budget():
         return jsonify({"error": "Límite diario de uso alcanzado."}), 429
 
     # Validar que se reciben los 3 PDFs
@@ -265,33 +384,29 @@ def comprobacion():
         except Exception:
             return jsonify({"error": "API Key no configurada en el servidor."}), 500
 
-    tmp_paths = []
+    pdfs = {}
     try:
-        # Guardar los 3 PDFs en temporales
-        textos = {}
-        for key in ("escritura", "modelo211", "modelo600"):
-            tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
-            request.files[key].save(tmp.name)
-            tmp.close()
-            tmp_paths.append(tmp.name)
-
-            texto = extraer_texto_pdf(Path(tmp.name))
-            if len(texto.strip()) < 100:
-                return jsonify({
-                    "error": f"El PDF '{key}' tiene muy poco texto extraíble. "
-                             f"Puede ser un documento escaneado."
-                }), 422
-            textos[key] = texto
+        # Leer los 3 PDFs a memoria (request.files solo es legible desde el
+        # hilo de la petición)
+        try:
+            for key in _EXTRACTORES_COMPROBACION:
+                pdfs[key] = leer_subida(request.files[key])
+        except PdfInvalido as exc:
+            return jsonify({"error": str(exc)}), 400
 
         logging.info(f"[AUDIT] /comprobacion called from IP: {request.remote_addr}")
 
-        # 3 llamadas GPT-4o para extracción estructurada
-        datos_escritura = extraer_datos_escritura(textos["escritura"], api_key)
-        datos_211 = extraer_datos_211(textos["modelo211"], api_key)
-        datos_600 = extraer_datos_600(textos["modelo600"], api_key)
+        # Texto + GPT-4o de los 3 documentos en paralelo
+        try:
+            datos = _extraer_documentos_comprobacion(pdfs, api_key, _usar_cache())
+        except _DocumentoIlegible as exc:
+            return jsonify({
+                "error": f"El PDF '{exc.key}' tiene muy poco texto extraíble. "
+                         f"{_MENSAJE_ILEGIBLE}"
+            }), 422
 
         # Comparación determinista
-        resultado = comparar_documentos(datos_escritura, datos_211, datos_600)
+        resultado = comparar_documentos(datos["escritura"], datos["modelo211"], datos["modelo600"])
 
         return jsonify({
             "ok": True,
@@ -302,11 +417,69 @@ def comprobacion():
         return jsonify({"error": str(exc)}), 500
 
     finally:
-        for p in tmp_paths:
-            try:
-                Path(p).unlink(missing_ok=True)
-            except Exception:
-                pass
+        for pdf in pdfs.values():
+            pdf.close()
+
+
+# ── /comprobacion: extracción concurrente de los 3 documentos ─────────────────
+
+COMPROBACION_WORKERS = int(os.environ.get("COMPROBACION_WORKERS", 6))
+
+_EXTRACTORES_COMPROBACION = {
+    "escritura": extraer_datos_escritura,
+    "modelo211": extraer_datos_211,
+    "modelo600": extraer_datos_600,
+}
+
+# Pool compartido por todas las peticiones del proceso: acota las
+# extracciones (y las llamadas a OpenAI) simultáneas por worker.
+_comprobacion_pool = ThreadPoolExecutor(max_workers=COMPROBACION_WORKERS,
+                                        thread_name_prefix="comprobacion")
+
+
+class _DocumentoIlegible(Exception):
+    def __init__(self, key: str):
+        super().__init__(key)
+        self.key = key
+
+
+def _extraer_documento(key: str, pdf, api_key: str,
+                       cancelado: threading.Event, usar_cache: bool = True) -> dict:
+    """Texto del PDF (capa de texto o visión por página) → GPT-4o. Si un
+    hermano ya falló deja de leer páginas y no llama al LLM."""
+    texto = _leer_texto_pdf(pdf, api_key, usar_cache, cancelado=cancelado)
+    if cancelado.is_set():
+        raise CancelledError(key)
+    if len(texto.strip()) < MIN_CARACTERES_TEXTO:
+        raise _DocumentoIlegible(key)
+    return _EXTRACTORES_COMPROBACION[key](texto, api_key, usar_cache=usar_cache)
+
+
+def _extraer_documentos_comprobacion(pdfs: dict, api_key: str,
+                                     usar_cache: bool = True) -> dict:
+    """
+    Lanza los 3 documentos a la vez y devuelve {key: datos}. Al primer fallo
+    cancela los que aún no han empezado, evita las llamadas a GPT-4o de los
+    que siguen extrayendo texto y relanza ese primer error cuando esos han
+    terminado: el llamante cierra los PDFs y no pueden seguir leyéndolos.
+    """
+    cancelado = threading.Event()
+    futuros = {
+        profiler.encolar(_comprobacion_pool, _extraer_documento,
+                         key, pdf, api_key, cancelado, usar_cache): key
+        for key, pdf in pdfs.items()
+    }
+    hechos, pendientes = wait(futuros, return_when=FIRST_EXCEPTION)
+    fallidos = [f for f in hechos if f.exception() is not None]
+    if fallidos:
+        cancelado.set()
+        for f in pendientes:
+            f.cancel()
+        logging.warning(f"[COMPROBACION] '{futuros[fallidos[0]]}' falló; "
+                        f"{len(pendientes)} extracción(es) cancelada(s)")
+        wait(pendientes)    # los ya en marcha paran en la siguiente página
+        raise fallidos[0].exception()
+    return {key: f.result() for f, key in futuros.items()}
 
 
 @app.route("/verify-hoja", methods=["POST"])
@@ -315,7 +488,7 @@ def verify_hoja():
     """Receive a hoja de visita PDF + expected visit data, verify they match."""
     if not _check_rate_limit():
         return jsonify({"error": "Demasiadas peticiones. Espera un momento."}), 429
-    if not _track_api_call(1):
+    if not _check_budget():
         return jsonify({"error": "Límite diario de uso alcanzado."}), 429
 
     if "pdf" not in request.files:
@@ -346,12 +519,13 @@ def verify_hoja():
         except Exception:
             return jsonify({"error": "API Key no configurada en el servidor."}), 500
 
-    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
     try:
-        pdf_file.save(tmp.name)
-        tmp.close()
+        pdf = leer_subida(pdf_file)
+    except PdfInvalido as exc:
+        return jsonify({"error": str(exc), "match": False}), 400
 
-        extracted = extraer_datos_hoja(Path(tmp.name), api_key)
+    try:
+        extracted = extraer_datos_hoja(pdf.documento, api_key, usar_cache=_usar_cache())
         result = verificar_hoja(extracted, expected)
 
         return jsonify({"ok": True, **result})
@@ -360,10 +534,7 @@ def verify_hoja():
         return jsonify({"error": str(exc), "match": False}), 500
 
     finally:
-        try:
-            Path(tmp.name).unlink(missing_ok=True)
-        except Exception:
-            pass
+        pdf.close()
 
 
 @app.route("/verify-hojas-batch", methods=["POST"])
@@ -398,30 +569,33 @@ def verify_hojas_batch():
         except Exception:
             return jsonify({"error": "API Key no configurada en el servidor."}), 500
 
-    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    # Read once: page count comes from the same open document that is rendered
     try:
-        pdf_file.save(tmp.name)
-        tmp.close()
+        pdf = leer_subida(pdf_file)
+    except PdfInvalido as exc:
+        return jsonify({"error": str(exc)}), 400
 
+    try:
         # Check page count BEFORE making expensive API calls
-        import fitz as _fitz
-        _doc = _fitz.open(tmp.name)
-        _page_count = len(_doc)
-        _doc.close()
+        _page_count = pdf.paginas
         if _page_count > MAX_PDF_PAGES:
             return jsonify({
                 "error": f"El PDF tiene {_page_count} páginas. "
                          f"Máximo permitido: {MAX_PDF_PAGES}."
             }), 400
 
-        if not _track_api_call(_page_count):
+        if not _check_budget():
             return jsonify({"error": "Límite diario de uso alcanzado."}), 429
 
         logging.info(f"[AUDIT] Processing batch PDF with {_page_count} pages "
-                     f"(IP: {request.remote_addr})")
+                     f"(sha256 {pdf.sha256[:12]}, IP: {request.remote_addr})")
 
-        # Extract data from each page independently
-        extractions = extraer_datos_hoja_por_pagina(Path(tmp.name), api_key)
+        # Extract data from each page independently (pages run concurrently;
+        # a failed page is reported instead of failing the batch)
+        failed_pages = []
+        extractions = extraer_datos_hoja_por_pagina(pdf.documento, api_key,
+                                                    failed_pages=failed_pages,
+                                                    usar_cache=_usar_cache())
 
         logging.info(f"[AUDIT] Extracted {len(extractions)} pages with data from PDF")
         for i, ext in enumerate(extractions):
@@ -452,6 +626,7 @@ def verify_hojas_batch():
             "ok": True,
             "results": results,
             "total_pages": len(extractions),
+            "failed_pages": failed_pages,
             "extractions_debug": [
                 {
                     "page": ext.get("_page"),
@@ -469,23 +644,114 @@ def verify_hojas_batch():
         return jsonify({"error": str(exc)}), 500
 
     finally:
-        try:
-            Path(tmp.name).unlink(missing_ok=True)
-        except Exception:
-            pass
+        pdf.close()
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus: Bearer METRICS_TOKEN (scraper) o sesión de administrador."""
+    auth_header = request.headers.get("Authorization", "")
+    if metrics.METRICS_TOKEN and hmac.compare_digest(
+        auth_header.encode(), f"Bearer {metrics.METRICS_TOKEN}".encode()
+    ):
+        return _metrics_response()
+    return _metrics_admin()
+
+
+@require_admin
+def _metrics_admin():
+    return _metrics_response()
+
+
+def _metrics_response():
+    return app.response_class(metrics.exponer(),
+                              content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/admin/budget")
+@require_admin
+def admin_budget():
+    """Gasto en OpenAI de los últimos días, agrupado (?dias=7&por=dia,endpoint)."""
+    try:
+        dias = max(1, min(int(request.args.get("dias", 7)), 366))
+    except ValueError:
+        return jsonify({"error": "dias debe ser un entero."}), 400
+    por = [c for c in request.args.get("por", "dia,endpoint").split(",") if c in AGRUPACIONES]
+    return jsonify({
+        "hoy_eur": round(budget.gastado_hoy(), 4),
+        "limite_diario_eur": budget.diario_eur,
+        "limite_usuario_eur": budget.usuario_eur or None,
+        "por": por or ["dia"],
+        "filas": budget.resumen(dias, por),
+    })
+
+
+@app.route("/admin/profiles")
+@require_admin
+def admin_profiles():
+    """Últimos perfiles guardados (sin las pilas)."""
+    return jsonify({"perfiles": profiler.almacen.listar()})
+
+
+@app.route("/admin/profiles/<profile_id>")
+@require_admin
+def admin_profile(profile_id):
+    """Un perfil: árbol de llamadas en JSON o, con ?formato=folded, pilas
+    plegadas para flamegraph.pl / speedscope."""
+    perfil = profiler.almacen.obtener(profile_id)
+    if perfil is None:
+        return jsonify({"error": "Perfil no encontrado (puede seguir en curso)."}), 404
+    pilas = perfil.pop("pilas")
+    if request.args.get("formato") == "folded":
+        return app.response_class(pilas + "\n", content_type="text/plain; charset=utf-8")
+    return jsonify({**perfil, "arbol": profiler.arbol(pilas)})
+
+
+@app.route("/diagnostics/<job_id>")
+@require_auth
+def diagnostics(job_id):
+    """Diagnóstico completo (campo a campo) de una generación anterior.
+
+    /process solo registra los campos con error; el detalle completo se
+    reconstruye aquí a partir del JSON de entrada guardado por el trabajo.
+    Como /jobs y /download, otro usuario recibe 404.
+    """
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id):
+        return jsonify({"error": "Identificador de trabajo no valido."}), 400
+    no_existe = jsonify({"error": "No existe la entrada de ese trabajo."}), 404
+    try:
+        with open(MODELIA_DIR / "Output" / "diagnosticos" / job_id / "entrada.json",
+                  encoding="utf-8") as f:
+            entrada = json.load(f)
+    except (OSError, ValueError):
+        return no_existe
+    if entrada.get("owner") is not None and entrada["owner"] != g.user.get("id"):
+        return no_existe
+    json_path = MODELIA_DIR / "Input" / entrada["json_guardado"]
+    if not json_path.exists():
+        return no_existe
+    try:
+        with open(json_path, encoding="utf-8") as f:
+            datos = json.load(f)
+        _, diagnosticos = generar_modelo211_from_dict(datos, diagnostico_completo=True)
+        return jsonify({"ok": True, "diagnosticos": diagnosticos})
+    except Exception as exc:
+        return jsonify({"error": str(exc)}), 500
 
 
-@app.route("/download")
+@app.route("/download/<job_id>")
 @require_auth
-def download():
-    txt_path = MODELIA_DIR / "Output" / "211.txt"
-    if not txt_path.exists():
-        return jsonify({"error": "El fichero 211.txt no se ha generado todavía."}), 404
+def download(job_id):
+    found = artifact_store.get(job_id, owner=g.user.get("id"))
+    if found is None:
+        return jsonify({"error": "El fichero 211.txt no existe o ha caducado."}), 404
+    blob_path, meta = found
     return send_file(
-        txt_path,
+        blob_path,
         as_attachment=True,
-        download_name="211.txt",
+        download_name=meta.get("nombre", "211.txt"),
         mimetype="text/plain",
+        etag=meta["sha256"],
     )
 
 
@@ -0,0 +1,167 @@
+"""
+artifact_store.py
+Almacén de ficheros generados (211.txt) por job.
+
+Cada /process guarda su resultado bajo un job_id propio en lugar de
+sobreescribir Output/211.txt, así que varios usuarios y varios workers de
+gunicorn pueden generar y descargar a la vez sin pisarse.
+
+Estructura en disco (compartida entre workers):
+    <root>/blobs/<sha256>       contenido, deduplicado por hash
+    <root>/jobs/<job_id>.json   {sha256, owner, nombre, size, created}
+
+Desalojo: TTL por antigüedad del último acceso (mtime del .json, que se
+refresca en cada descarga) y, por encima del tope de tamaño, LRU.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+log = logging.getLogger("artifact_store")
+
+MODELIA_DIR = Path(__file__).resolve().parent.parent
+
+ARTIFACT_DIR       = Path(os.environ.get("ARTIFACT_DIR", MODELIA_DIR / "Output" / "artifacts"))
+ARTIFACT_TTL       = int(os.environ.get("ARTIFACT_TTL_SECONDS", 24 * 3600))
+ARTIFACT_MAX_BYTES = int(os.environ.get("ARTIFACT_MAX_BYTES", 200 * 1024 * 1024))
+
+_JOB_ID_RE       = re.compile(r"[0-9a-f]{32}")
+_EVICT_INTERVAL  = 60     # s entre barridos de desalojo por proceso
+_BLOB_GRACE      = 60     # s: no borrar blobs recién escritos sin job todavía
+
+
+class ArtifactStore:
+    def __init__(self, root: Path, ttl: int = ARTIFACT_TTL,
+                 max_bytes: int = ARTIFACT_MAX_BYTES):
+        self.root      = Path(root)
+        self.ttl       = ttl
+        self.max_bytes = max_bytes
+        self._blobs    = self.root / "blobs"
+        self._jobs     = self.root / "jobs"
+        self._lock     = threading.Lock()
+        self._last_evict = 0.0
+
+    # ── Escritura ────────────────────────────────────────────────────────────
+
+    def put(self, contenido: bytes, owner: str | None = None,
+            nombre: str = "211.txt", job_id: str | None = None) -> str:
+        """
+        Guarda el contenido y devuelve su job_id (uno nuevo, o el de la
+        cola de trabajos si se pasa, para que descarga y estado compartan id).
+        """
+        self._blobs.mkdir(parents=True, exist_ok=True)
+        self._jobs.mkdir(parents=True, exist_ok=True)
+
+        sha = hashlib.sha256(contenido).hexdigest()
+        blob = self._blobs / sha
+        if blob.exists():
+            os.utime(blob)      # lo protege del barrido de blobs huérfanos
+        else:
+            _write_atomic(blob, contenido)
+
+        if job_id is None:
+            job_id = uuid.uuid4().hex
+        elif not _JOB_ID_RE.fullmatch(job_id):
+            raise ValueError(f"job_id no válido: {job_id!r}")
+        meta = {
+            "sha256":  sha,
+            "owner":   owner,
+            "nombre":  nombre,
+            "size":    len(contenido),
+            "created": time.time(),
+        }
+        _write_atomic(self._jobs / f"{job_id}.json", json.dumps(meta).encode("utf-8"))
+
+        self.maybe_evict()
+        return job_id
+
+    # ── Lectura ──────────────────────────────────────────────────────────────
+
+    def get(self, job_id: str, owner: str | None = None):
+        """
+        Devuelve (ruta_blob, meta) o None si no existe, ha caducado o
+        pertenece a otro usuario. Cada acceso refresca su posición LRU.
+        """
+        if not _JOB_ID_RE.fullmatch(job_id or ""):
+            return None
+        meta_path = self._jobs / f"{job_id}.json"
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if time.time() - meta_path.stat().st_mtime > self.ttl:
+                return None
+        except (OSError, ValueError):
+            return None
+        if meta.get("owner") is not None and meta["owner"] != owner:
+            return None
+        blob = self._blobs / meta["sha256"]
+        if not blob.exists():
+            return None
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return blob, meta
+
+    # ── Desalojo ─────────────────────────────────────────────────────────────
+
+    def maybe_evict(self) -> None:
+        """Barrido como mucho una vez cada _EVICT_INTERVAL s por proceso."""
+        now = time.time()
+        with self._lock:
+            if now - self._last_evict < _EVICT_INTERVAL:
+                return
+            self._last_evict = now
+        try:
+            self.evict()
+        except OSError as exc:
+            log.warning(f"[ARTIFACTS] desalojo fallido: {exc}")
+
+    def evict(self) -> None:
+        """TTL + tope de tamaño (LRU) + blobs sin ningún job que los use."""
+        now = time.time()
+        jobs = []   # (mtime, path, sha, size)
+        for p in self._jobs.glob("*.json"):
+            try:
+                mtime = p.stat().st_mtime
+                meta = json.loads(p.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            if now - mtime > self.ttl:
+                p.unlink(missing_ok=True)
+                continue
+            jobs.append((mtime, p, meta.get("sha256"), meta.get("size", 0)))
+
+        # LRU: el más antiguo primero hasta quedar bajo el tope
+        jobs.sort()
+        total = sum(size for _, _, sha, size in {j[2]: j for j in jobs}.values())
+        while jobs and total > self.max_bytes:
+            _, p, sha, size = jobs.pop(0)
+            p.unlink(missing_ok=True)
+            if all(j[2] != sha for j in jobs):
+                total -= size
+
+        vivos = {j[2] for j in jobs}
+        for blob in self._blobs.iterdir():
+            if blob.name in vivos or blob.name.startswith("."):
+                continue
+            try:
+                if now - blob.stat().st_mtime > _BLOB_GRACE:
+                    blob.unlink(missing_ok=True)
+            except OSError:
+                continue
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+store = ArtifactStore(ARTIFACT_DIR)
@@ -18,6 +18,9 @@ import os
 from flask import g, jsonify, request
 from supabase import create_client
 
+import metrics
+import profiler
+
 log = logging.getLogger("auth")
 
 SUPABASE_URL = os.environ.get(
@@ -30,6 +33,12 @@ SUPABASE_SERVICE_ROLE_KEY = os.environ.get(
 ALLOWED_EMAIL_DOMAIN = os.environ.get(
     "ALLOWED_EMAIL_DOMAIN", "cardenas-grancanaria.com"
 ).strip().lower()
+# Emails (separados por comas) con acceso a los endpoints /admin/*
+ADMIN_EMAILS = {
+    e.strip().lower()
+    for e in os.environ.get("ADMIN_EMAILS", "").split(",")
+    if e.strip()
+}
 
 
 class _LazyAdminClient:
@@ -63,7 +72,8 @@ def _extract_token(req) -> str | None:
 def verify_token(token: str):
     """Valida el JWT contra Supabase. Devuelve dict de usuario o None."""
     try:
-        result = _admin.auth.get_user(token)
+        with metrics.cronometro("modelia_supabase_segundos", operacion="auth.get_user"):
+            result = _admin.auth.get_user(token)
         user = getattr(result, "user", None)
         if user is None:
             return None
@@ -107,10 +117,32 @@ def require_auth(fn):
         if user is None:
             return jsonify({"error": "Sesion invalida o expirada."}), 401
         g.user = user
+        if profiler.pedido(request) and es_admin(user):
+            # Perfilado bajo demanda (X-Profile: 1); ver profiler.py
+            with profiler.perfilar(request.path, user.get("email")) as perfil:
+                g.profile_id = perfil.id
+                return fn(*args, **kwargs)
         return fn(*args, **kwargs)
     return wrapper
 
 
+def es_admin(user) -> bool:
+    return bool(user) and (user.get("email") or "").strip().lower() in ADMIN_EMAILS
+
+
+def require_admin(fn):
+    """Decorator: como require_auth y, ademas, 403 si el email no esta en
+    ADMIN_EMAILS."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not es_admin(g.user):
+            log.warning(f"[AUTH] acceso admin denegado: {g.user.get('email')}")
+            return jsonify({"error": "Acceso restringido a administradores."}), 403
+        return fn(*args, **kwargs)
+    return require_auth(wrapper)
+
+
+@metrics.cronometrado("modelia_supabase_segundos", operacion="auth.cleanup_orphan_user")
 def cleanup_orphan_user(email: str) -> dict:
     """Borra un usuario "huerfano" si existe.
 
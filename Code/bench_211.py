@@ -0,0 +1,603 @@
+"""
+bench_211.py
+Benchmark del generador del Modelo 211.
+
+Funciona sin red ni ficheros de entrada: solo necesita los CSVs de KB/.
+Las declaraciones se generan sintéticamente (1-3 adquirentes, 1-5
+transmitentes, nombres largos, campos ausentes) con semilla fija, así que
+dos ejecuciones sobre el mismo commit miden exactamente el mismo trabajo.
+
+Mide:
+  · latencia por etapa (parse_csv_page, formatear_campo,
+    generar_json_formateado, json_a_registro, generar_registros,
+    generar_modelo211, lector)
+  · declaraciones/s y memoria (tracemalloc) para lotes de 1 a 10k
+  · diferenciales: formateadores compilados y lector (ida y vuelta)
+
+Los resultados se guardan en JSON (Output/bench/) para comparar entre
+commits con --comparar.
+
+Uso (desde la raíz del proyecto MODELIA/):
+    python3 Code/bench_211.py
+    python3 Code/bench_211.py -n 5000 --tamanos 1 100 10000
+    python3 Code/bench_211.py --comparar Output/bench/bench_211_<anterior>.json
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from modelo211_generator import (
+    MODELIA_DIR,
+    _build_valores_010,
+    _build_valores_020,
+    _build_valores_030,
+    ensamblar_registro,
+    formatear_campo,
+    formatear_pagina,
+    generar_json_formateado,
+    generar_modelo211,
+    generar_registros,
+    get_layout,
+    json_a_registro,
+    parse_csv_page,
+    precargar_layouts,
+)
+from modelo211_reader import leer_bytes
+
+
+# ─────────────────────────────────────────────────────────────
+#  DECLARACIÓN SINTÉTICA (formato de normalizar_datos)
+# ─────────────────────────────────────────────────────────────
+
+def declaracion_sintetica() -> dict:
+    dir_ext = {"domicilio": "10 MAIN STREET", "ciudad": "DUBLIN", "codigo_pais": "IE"}
+    return {
+        "pagina_010": {
+            "header": {"tipo_declaracion": "I", "fecha_devengo": "18092025"},
+            "adquirente": {
+                "nif": "Y5732237F", "apellidos_nombre": "POULSEN JENS", "fj": "F",
+                "num_adquirentes": 1,
+                "domicilio_espana": {"tipo_via": "CL", "nombre_via": "GRAN VIA",
+                                     "num_casa": 7, "codigo_postal": 35100},
+            },
+            "transmitente": {
+                "nif": "Y2755912C", "apellidos_nombre": "PERKINS MARY", "fj": "F",
+                "num_transmitentes": 1, "fecha_nacimiento": "30081982",
+                "residencia_fiscal_codigo_pais": "IE", "direccion_extranjero": dir_ext,
+            },
+            "inmueble": {"tipo_via": "AV", "nombre_via": "TIRAJANA", "num_casa": 12,
+                         "codigo_postal": 35100, "referencia_catastral": "1234567AB1234C0001XY",
+                         "tipo_documento": "P", "num_protocolo": 2914},
+            "liquidacion": {"importe_transmision": 102000.0, "porcentaje_retencion": 3.0,
+                            "retencion_ingreso_cuenta": 3060.0, "resultados_anteriores": 0.0,
+                            "resultado_ingresar": 3060.0},
+            "complementaria": {"es_complementaria": False, "num_justificante_anterior": 0},
+            "pago": {"forma_pago": "1", "iban": "ES9121000418450200051332"},
+        },
+        "pagina_020": {"adquirentes": [
+            {"nif": "Y5732237F", "fj": "F", "apellidos_nombre": "POULSEN JENS",
+             "tipo_cuota": "C", "coef_part_centesimas": 10000},
+        ]},
+        "pagina_030": {"transmitentes": [
+            {"nif": "Y2755912C", "fj": "F", "apellidos_nombre": "PERKINS MARY",
+             "tipo_cuota": "C", "coef_part_centesimas": 10000,
+             "fecha_nacimiento": "30081982", "residencia_fiscal_codigo_pais": "IE",
+             "direccion_extranjero": dir_ext},
+        ]},
+    }
+
+
+_NOMBRES   = ["GARCIA LOPEZ MARIA", "SMITH JOHN", "MULLER HANS PETER", "O'BRIEN SEAN",
+              "VAN DER BERG ANNA", "ROSSI GIOVANNI", "NIELSEN LARS"]
+_PAISES    = ["IE", "GB", "DE", "NL", "IT", "DK", "NO", "SE", "FR", "US"]
+_VIAS      = ["CL", "AV", "PZ", "CM", "CR"]
+_AUSENTE   = 0.15       # probabilidad de omitir cada campo opcional
+
+
+def _nif(rnd: random.Random) -> str:
+    return rnd.choice("XYZ") + f"{rnd.randint(0, 9999999):07d}" + rnd.choice("ABCDEFGHJK")
+
+
+def _nombre(rnd: random.Random) -> str:
+    """Nombres normales y, a veces, más largos que el campo (se truncan)."""
+    if rnd.random() < 0.2:
+        return " ".join(rnd.choice(_NOMBRES) for _ in range(rnd.randint(4, 12)))
+    return rnd.choice(_NOMBRES)
+
+
+def _quitar_campos(rnd: random.Random, d: dict, opcionales: tuple) -> dict:
+    for clave in opcionales:
+        if rnd.random() < _AUSENTE:
+            d.pop(clave, None)
+    return d
+
+
+def _dir_extranjero(rnd: random.Random) -> dict:
+    return _quitar_campos(rnd, {
+        "domicilio":         f"{rnd.randint(1, 999)} " + rnd.choice(_NOMBRES) + " ROAD",
+        "ciudad":            rnd.choice(["DUBLIN", "LONDON", "BERLIN", "OSLO", "ROMA"]),
+        "codigo_postal_zip": f"{rnd.randint(1000, 99999)}",
+        "codigo_pais":       rnd.choice(_PAISES),
+    }, ("domicilio", "ciudad", "codigo_postal_zip"))
+
+
+def _dir_espana(rnd: random.Random) -> dict:
+    return _quitar_campos(rnd, {
+        "tipo_via":      rnd.choice(_VIAS),
+        "nombre_via":    _nombre(rnd),
+        "num_casa":      rnd.randint(1, 300),
+        "codigo_postal": rnd.randint(1000, 52999),
+        "municipio":     "SAN BARTOLOME DE TIRAJANA",
+        "codigo_ine":    rnd.randint(1000, 99999),
+        "provincia":     rnd.randint(1, 52),
+    }, ("num_casa", "municipio", "codigo_ine", "provincia"))
+
+
+def _reparto(rnd: random.Random, n: int) -> list:
+    """Coeficientes en centésimas que suman 10000."""
+    cortes = sorted(rnd.sample(range(1, 10000), n - 1)) if n > 1 else []
+    bordes = [0] + cortes + [10000]
+    return [b - a for a, b in zip(bordes, bordes[1:])]
+
+
+def generar_declaracion(rnd: random.Random, n_adquirentes: int | None = None,
+                        n_transmitentes: int | None = None) -> dict:
+    """
+    Declaración sintética en formato normalizar_datos con 1-3 adquirentes,
+    1-5 transmitentes, nombres largos y campos opcionales ausentes.
+    """
+    n_adq   = n_adquirentes or rnd.randint(1, 3)
+    n_trans = n_transmitentes or rnd.randint(1, 5)
+    importe = round(rnd.uniform(50_000, 2_500_000), 2)
+    retencion = round(importe * 0.03, 2)
+
+    adquirentes = []
+    for coef in _reparto(rnd, n_adq):
+        adq = {"nif": _nif(rnd), "fj": "F", "apellidos_nombre": _nombre(rnd),
+               "tipo_cuota": "C", "coef_part_centesimas": coef}
+        if rnd.random() < 0.6:
+            adq["domicilio_espana"] = _dir_espana(rnd)
+        else:
+            adq["direccion_extranjero"] = _dir_extranjero(rnd)
+        adquirentes.append(_quitar_campos(rnd, adq, ("fj", "tipo_cuota")))
+
+    transmitentes = []
+    for coef in _reparto(rnd, n_trans):
+        t = {"nif": _nif(rnd), "fj": "F", "apellidos_nombre": _nombre(rnd),
+             "tipo_cuota": "C", "coef_part_centesimas": coef,
+             "fecha_nacimiento": f"{rnd.randint(1, 28):02d}{rnd.randint(1, 12):02d}"
+                                 f"{rnd.randint(1930, 2000)}",
+             "lugar_nacimiento_ciudad": rnd.choice(["DUBLIN", "LONDON", "BERLIN"]),
+             "residencia_fiscal_codigo_pais": rnd.choice(_PAISES),
+             "direccion_extranjero": _dir_extranjero(rnd)}
+        transmitentes.append(_quitar_campos(
+            rnd, t, ("fecha_nacimiento", "lugar_nacimiento_ciudad", "direccion_extranjero")))
+
+    p010 = {
+        "header": {"tipo_declaracion": "I",
+                   "fecha_devengo": f"{rnd.randint(1, 28):02d}{rnd.randint(1, 12):02d}2025"},
+        "adquirente": dict(adquirentes[0], num_adquirentes=n_adq),
+        "transmitente": dict(transmitentes[0], num_transmitentes=n_trans),
+        "inmueble": _quitar_campos(rnd, {
+            **_dir_espana(rnd), "referencia_catastral": f"{rnd.randint(0, 10**7):07d}AB1234C0001XY",
+            "tipo_documento": "P", "num_protocolo": rnd.randint(1, 9999),
+        }, ("referencia_catastral", "num_protocolo")),
+        "liquidacion": {"importe_transmision": importe, "porcentaje_retencion": 3.0,
+                        "retencion_ingreso_cuenta": retencion, "resultados_anteriores": 0.0,
+                        "resultado_ingresar": retencion},
+        "complementaria": {"es_complementaria": False, "num_justificante_anterior": 0},
+        "pago": _quitar_campos(rnd, {"forma_pago": "1", "iban": "ES9121000418450200051332"},
+                               ("iban",)),
+    }
+    return {
+        "pagina_010": p010,
+        "pagina_020": {"adquirentes": adquirentes},
+        "pagina_030": {"transmitentes": transmitentes},
+    }
+
+
+def lote_sintetico(n: int, semilla: int = 211) -> list:
+    rnd = random.Random(semilla)
+    return [generar_declaracion(rnd) for _ in range(n)]
+
+
+def _valores_por_pagina(datos: dict) -> dict:
+    return {
+        "010": _build_valores_010(datos["pagina_010"]),
+        "020": _build_valores_020(datos["pagina_020"]["adquirentes"]),
+        "030": _build_valores_030(datos["pagina_030"]["transmitentes"]),
+    }
+
+
+def _medir(fn, n: int, rondas: int = 3) -> float:
+    """
+    Segundos por llamada: media de n ejecuciones, la mejor de `rondas`
+    (el mínimo es lo más estable frente al ruido de la máquina).
+    """
+    fn()    # calentamiento
+    mejor = float("inf")
+    for _ in range(rondas):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        mejor = min(mejor, (time.perf_counter() - t0) / n)
+    return mejor
+
+
+# ─────────────────────────────────────────────────────────────
+#  BENCHMARKS
+# ─────────────────────────────────────────────────────────────
+
+def bench_diagnosticos(n: int) -> dict:
+    """Diagnóstico completo vs modo rápido (solo campos con error)."""
+    datos = declaracion_sintetica()
+    precargar_layouts()
+    completo = _medir(lambda: generar_registros(datos, diagnostico_completo=True), n)
+    rapido   = _medir(lambda: generar_registros(datos), n)
+    return {
+        "completo_us": completo * 1e6,
+        "rapido_us":   rapido * 1e6,
+        "ahorro_us":   (completo - rapido) * 1e6,
+        "speedup":     completo / rapido,
+    }
+
+
+_VALORES_RAROS = [
+    None, "", " ", 0, -1, 7, 10**25, 3.14159, -0.005, 0.125, 1e15, "42", " 42 ",
+    "12.5", "abc", "ÑANDÚ", "X" * 500, True, [], {}, "1e3", float("inf"), float("nan"),
+]
+
+
+def _valor_aleatorio(rnd: random.Random):
+    r = rnd.random()
+    if r < 0.4:
+        return rnd.choice(_VALORES_RAROS)
+    if r < 0.6:
+        return rnd.randint(-10**6, 10**12)
+    if r < 0.8:
+        return round(rnd.uniform(-1e6, 1e9), rnd.randint(0, 4))
+    return "".join(rnd.choice("ABCDEFGHIJ 0123456789-/.éü") for _ in range(rnd.randint(0, 150)))
+
+
+def diferencial_formateadores(n: int, semilla: int = 211,
+                              caidas: list | None = None) -> int:
+    """
+    Compara el formateador compilado de cada página con el camino genérico
+    (formatear_campo vía formatear_pagina + ensamblar_registro) sobre n
+    juegos de valores aleatorios y sobre declaraciones sintéticas válidas.
+    Devuelve el nº de discrepancias.
+
+    Si el compilado lanza, el generador cae al camino genérico: solo es
+    aceptable cuando el genérico también da algún campo por erróneo. Un
+    compilado que lanza con valores válidos cuenta como discrepancia (en
+    producción se perdería el camino rápido sin que nadie lo note).
+
+    Args:
+        caidas: Si se pasa una lista, se le añade (página, excepción) de
+                cada caída aceptable al camino genérico.
+    """
+    rnd = random.Random(semilla)
+    juegos = [(pagina, valores)
+              for datos in lote_sintetico(20, semilla)
+              for pagina, valores in _valores_por_pagina(datos).items()]
+    for pagina in ("010", "020", "030"):
+        layout = get_layout(pagina)
+        for _ in range(n):
+            juegos.append((pagina, {c.num: _valor_aleatorio(rnd) for c in layout.variables
+                                    if rnd.random() < 0.9}))
+
+    discrepancias = 0
+    for pagina, valores in juegos:
+        layout = get_layout(pagina)
+        formateados, diag = formatear_pagina(layout, valores)
+        esperado = ensamblar_registro(layout, formateados)
+        try:
+            obtenido = layout.formateador(valores)
+        except Exception as exc:
+            if not diag["todos_ok"]:
+                if caidas is not None:
+                    caidas.append((pagina, type(exc).__name__))
+                continue
+            obtenido = f"{type(exc).__name__}: {exc}"
+        if obtenido != esperado:
+            discrepancias += 1
+            if discrepancias <= 5:
+                print(f"  [✗] Pág {pagina}: discrepancia ({obtenido!r:.80}) "
+                      f"con valores={valores!r:.200}")
+    return discrepancias
+
+
+def bench_formateadores(n: int) -> dict:
+    """Throughput por página: genérico vs compilado (registros/s)."""
+    valores = _valores_por_pagina(declaracion_sintetica())
+    resultado = {}
+    for pagina, vals in valores.items():
+        layout = get_layout(pagina)
+        generico = _medir(
+            lambda: ensamblar_registro(layout, formatear_pagina(layout, vals)[0]), n
+        )
+        compilado = _medir(lambda: layout.formateador(vals), n)
+        resultado[pagina] = {
+            "generico_rps":  1 / generico,
+            "compilado_rps": 1 / compilado,
+            "speedup":       generico / compilado,
+        }
+    return resultado
+
+
+def bench_lector(n: int, semilla: int = 211) -> dict:
+    """
+    Ida y vuelta JSON → 211 → JSON → 211 sobre un lote sintético y
+    throughput del lector.
+    """
+    contenidos = ["".join(generar_registros(d)[0]).encode("ascii")
+                  for d in lote_sintetico(200, semilla)]
+    fallos = sum(
+        "".join(generar_registros(leer_bytes(c))[0]).encode("ascii") != c
+        for c in contenidos
+    )
+    return {
+        "ida_y_vuelta_fallos": fallos,
+        "lector_us":           _medir(lambda: leer_bytes(contenidos[0]), n) * 1e6,
+    }
+
+
+def bench_etapas(n: int, semilla: int = 211) -> dict:
+    """
+    Latencia media por etapa (µs por llamada) sobre un lote sintético.
+    formatear_campo se mide por campo; el resto, por página o declaración.
+    """
+    lote = lote_sintetico(max(1, min(n, 200)), semilla)
+    precargar_layouts()
+    layouts = {p: get_layout(p) for p in ("010", "020", "030")}
+
+    valores = [_valores_por_pagina(d) for d in lote]
+    diags = [
+        {p: generar_json_formateado(p, layouts[p].definiciones, v[p], layouts[p].raw_int_fields)
+         for p in layouts}
+        for v in valores
+    ]
+
+    # formatear_campo: todos los campos variables de una declaración
+    defs_variables = [
+        (dict(f, es_decimal=False) if c.es_raw_int else f, p, c.num)
+        for p, layout in layouts.items()
+        for c, f in zip(layout.campos, layout.definiciones)
+        if c.num not in layout.nums_fijos
+    ]
+    v0 = valores[0]
+    campos_por_decl = len(defs_variables)
+    t_campo = _medir(lambda: [formatear_campo(f, v0[p].get(num)) for f, p, num in defs_variables],
+                     max(1, n // 10)) / campos_por_decl
+
+    def json_formateado(v):
+        for p, layout in layouts.items():
+            generar_json_formateado(p, layout.definiciones, v[p], layout.raw_int_fields)
+
+    def a_registro(d):
+        for p in layouts:
+            json_a_registro(d[p])
+
+    registros_txt = ["".join(generar_registros(d)[0]).encode("ascii") for d in lote]
+    it_v, it_d, it_l, it_r = map(itertools.cycle, (valores, diags, lote, registros_txt))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rutas = []
+        for i, d in enumerate(lote[:20]):
+            ruta = Path(tmp) / f"datos_{i}.json"
+            ruta.write_text(json.dumps(d), encoding="utf-8")
+            rutas.append(ruta)
+        it_f = itertools.cycle(rutas)
+        nivel = logging.getLogger("modelo211").level
+        logging.getLogger("modelo211").setLevel(logging.WARNING)
+        try:
+            t_modelo = _medir(lambda: generar_modelo211(next(it_f), Path(tmp) / "out"),
+                              max(1, n // 10))
+        finally:
+            logging.getLogger("modelo211").setLevel(nivel)
+
+    return {
+        "parse_csv_page_us":          _medir(lambda: [parse_csv_page(p) for p in layouts],
+                                             max(1, n // 100)) * 1e6 / 3,
+        "formatear_campo_us":         t_campo * 1e6,
+        "generar_json_formateado_us": _medir(lambda: json_formateado(next(it_v)), n) * 1e6 / 3,
+        "json_a_registro_us":         _medir(lambda: a_registro(next(it_d)), n) * 1e6 / 3,
+        "generar_registros_us":       _medir(lambda: generar_registros(next(it_l)), n) * 1e6,
+        "generar_registros_completo_us":
+            _medir(lambda: generar_registros(next(it_l), diagnostico_completo=True), n) * 1e6,
+        "generar_modelo211_us":       t_modelo * 1e6,
+        "lector_us":                  _medir(lambda: leer_bytes(next(it_r)), n) * 1e6,
+    }
+
+
+MUESTRA_MEMORIA = 100     # declaraciones medidas bajo tracemalloc
+
+
+def bench_escala(tamanos: list, semilla: int = 211) -> list:
+    """
+    Para cada tamaño de lote: declaraciones/s (sin tracemalloc) y, en una
+    segunda pasada bajo tracemalloc, pico de memoria y bytes retenidos por
+    declaración.
+
+    tracemalloc resuelve la línea de cada asignación y los formateadores
+    compilados son funciones de cientos de líneas, así que bajo tracemalloc
+    van dos órdenes de magnitud más lentos: la memoria se mide sobre una
+    muestra de hasta MUESTRA_MEMORIA declaraciones y se extrapola al lote.
+    """
+    precargar_layouts()
+    resultados = []
+    for n in tamanos:
+        lote = lote_sintetico(n, semilla)
+        segundos = _medir(lambda: [generar_registros(datos) for datos in lote], 1,
+                          rondas=3 if n <= 1000 else 1)
+
+        muestra = lote[:MUESTRA_MEMORIA]
+        tracemalloc.start()
+        try:
+            base, _ = tracemalloc.get_traced_memory()
+            salida = [generar_registros(datos)[0] for datos in muestra]
+            actual, pico = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del salida
+        escala = n / len(muestra)
+
+        resultados.append({
+            "declaraciones":         n,
+            "segundos":              segundos,
+            "declaraciones_s":       n / segundos,
+            "us_por_declaracion":    segundos / n * 1e6,
+            "muestra_memoria":       len(muestra),
+            "pico_memoria_kib":      (pico - base) * escala / 1024,
+            "bytes_por_declaracion": (actual - base) / len(muestra),
+        })
+    return resultados
+
+
+# ─────────────────────────────────────────────────────────────
+#  RESULTADOS EN JSON Y COMPARACIÓN ENTRE COMMITS
+# ─────────────────────────────────────────────────────────────
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=MODELIA_DIR,
+            capture_output=True, text=True, timeout=5, check=True,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def guardar_resultados(resultados: dict, ruta=None) -> Path:
+    if ruta is None:
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        ruta = MODELIA_DIR / "Output" / "bench" / f"bench_211_{ts}_{resultados['commit'] or 'nogit'}.json"
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, ensure_ascii=False, indent=2)
+    return ruta
+
+
+def comparar(actual: dict, anterior: dict, umbral: float) -> list:
+    """
+    Compara latencias por etapa y µs/declaración por tamaño. Devuelve la
+    lista de métricas que empeoran más de `umbral` (0.2 = +20 %).
+    """
+    regresiones = []
+    print(f"\n  Comparación con {anterior.get('commit') or '?'} ({anterior.get('fecha', '?')}):")
+
+    def linea(nombre, antes, ahora):
+        if not antes:
+            return
+        delta = ahora / antes - 1
+        marca = "✗" if delta > umbral else "✓"
+        print(f"  [{marca}] {nombre:34s} {antes:10.1f} → {ahora:10.1f}  ({delta:+.1%})")
+        if delta > umbral:
+            regresiones.append(nombre)
+
+    for etapa, ahora in actual["etapas"].items():
+        linea(etapa, anterior.get("etapas", {}).get(etapa), ahora)
+    previos = {r["declaraciones"]: r for r in anterior.get("escala", [])}
+    for r in actual["escala"]:
+        p = previos.get(r["declaraciones"])
+        if p:
+            linea(f"lote_{r['declaraciones']}_us_por_decl", p["us_por_declaracion"],
+                  r["us_por_declaracion"])
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del generador del Modelo 211")
+    parser.add_argument("-n", type=int, default=2000, help="repeticiones por medición de etapa")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1, 10, 100, 1000, 10000],
+                        metavar="N", help="tamaños de lote para declaraciones/s y memoria")
+    parser.add_argument("--semilla", type=int, default=211)
+    parser.add_argument("--json", type=Path, default=None, metavar="RUTA",
+                        help="dónde guardar los resultados (por defecto Output/bench/)")
+    parser.add_argument("--comparar", type=Path, default=None, metavar="ANTERIOR",
+                        help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--umbral", type=float, default=0.20,
+                        help="empeoramiento relativo que cuenta como regresión (0.20 = +20%%)")
+    args = parser.parse_args()
+
+    print("\n" + "=" * 60)
+    print(f"  BENCHMARK MODELO 211  (n={args.n}, semilla={args.semilla})")
+    print("=" * 60)
+
+    caidas = []
+    discrepancias = diferencial_formateadores(max(200, args.n // 4), args.semilla, caidas)
+    estado = "✓" if discrepancias == 0 else "✗"
+    print(f"\n  [{estado}] Formateadores compilados vs formatear_campo: "
+          f"{discrepancias} discrepancia(s), {len(caidas)} caída(s) al genérico "
+          f"con valores erróneos")
+
+    lector = bench_lector(args.n, args.semilla)
+    estado = "✓" if lector["ida_y_vuelta_fallos"] == 0 else "✗"
+    print(f"  [{estado}] Lector 211 → JSON: ida y vuelta byte a byte "
+          f"({lector['ida_y_vuelta_fallos']} fallo(s))")
+
+    etapas = bench_etapas(args.n, args.semilla)
+    print(f"\n  Latencia por etapa (µs):")
+    for etapa, us in etapas.items():
+        print(f"    {etapa:34s} {us:10.1f}")
+
+    r = bench_diagnosticos(args.n)
+    print(f"\n  Diagnóstico completo : {r['completo_us']:8.1f} µs/declaración")
+    print(f"  Modo rápido          : {r['rapido_us']:8.1f} µs/declaración")
+    print(f"  Ahorro               : {r['ahorro_us']:8.1f} µs/declaración  (x{r['speedup']:.2f})")
+
+    formateadores = bench_formateadores(args.n)
+    print(f"\n  Formateo por página (registros/s):")
+    for pagina, f in formateadores.items():
+        print(f"  Pág {pagina}: genérico {f['generico_rps']:9.0f}  "
+              f"compilado {f['compilado_rps']:9.0f}  (x{f['speedup']:.1f})")
+
+    escala = bench_escala(args.tamanos, args.semilla)
+    print(f"\n  Lotes sintéticos (generar_registros):")
+    print(f"    {'N':>6s} {'decl/s':>10s} {'µs/decl':>9s} {'pico KiB':>10s} {'B/decl':>8s}")
+    for e in escala:
+        print(f"    {e['declaraciones']:6d} {e['declaraciones_s']:10.0f} "
+              f"{e['us_por_declaracion']:9.1f} {e['pico_memoria_kib']:10.1f} "
+              f"{e['bytes_por_declaracion']:8.0f}")
+
+    resultados = {
+        "commit":        _commit(),
+        "fecha":         datetime.now().isoformat(timespec="seconds"),
+        "python":        platform.python_version(),
+        "plataforma":    platform.platform(),
+        "parametros":    {"n": args.n, "tamanos": args.tamanos, "semilla": args.semilla},
+        "diferenciales": {"formateadores_discrepancias": discrepancias,
+                          "formateadores_caidas": len(caidas),
+                          "lector_fallos": lector["ida_y_vuelta_fallos"]},
+        "etapas":        etapas,
+        "diagnosticos":  r,
+        "formateadores": formateadores,
+        "escala":        escala,
+    }
+    ruta = guardar_resultados(resultados, args.json)
+    print(f"\n  Resultados: {ruta}")
+
+    regresiones = []
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(resultados, json.load(f), args.umbral)
+    print("=" * 60)
+
+    if discrepancias or lector["ida_y_vuelta_fallos"] or regresiones:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
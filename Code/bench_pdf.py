@@ -0,0 +1,188 @@
+"""
+bench_pdf.py
+Benchmark de la extracción de texto (pdf_extractor.extraer_texto_pdf).
+
+Funciona sin ficheros de entrada: genera con PyMuPDF escrituras
+sintéticas de N páginas de texto notarial y las extrae con cada motor en
+secuencial (PDF_WORKERS=1) y repartidas en el pool de procesos.
+
+Mide:
+  · segundos por documento por motor (pdfplumber, pymupdf) y speedup
+    paralelo/secuencial
+  · bloqueo del GIL: el mayor hueco que sufre un hilo que debería
+    despertar cada milisegundo mientras dura la extracción
+  · diferencial: los dos modos devuelven exactamente el mismo texto
+
+Los resultados se guardan en JSON (Output/bench/) igual que bench_211.
+
+Uso (desde la raíz del proyecto MODELIA/):
+    python3 Code/bench_pdf.py
+    python3 Code/bench_pdf.py --paginas 10 30 60 --workers 4 --rondas 3
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import fitz  # PyMuPDF
+
+import pdf_extractor
+from bench_211 import MODELIA_DIR, _commit
+
+_FRASES = (
+    "En Las Palmas de Gran Canaria, mi residencia, a quince de marzo de dos mil veinticuatro.",
+    "Ante mí, Notario del Ilustre Colegio de las Islas Canarias, COMPARECEN:",
+    "DE UNA PARTE, DON {n}, mayor de edad, casado, vecino de Maspalomas, con NIE X{d}.",
+    "DE OTRA PARTE, DOÑA {n}, mayor de edad, de nacionalidad alemana, con pasaporte número C{d}.",
+    "Tienen, a mi juicio, la capacidad legal necesaria para formalizar la presente escritura.",
+    "URBANA: Número {d} de la propiedad horizontal. Vivienda situada en la planta primera.",
+    "Referencia catastral: {d}DS4{d}N0001XY. Inscrita en el Registro de la Propiedad.",
+    "PRECIO.- El precio de la compraventa es de {d} euros, que la parte compradora paga.",
+    "La parte vendedora declara haber recibido dicha cantidad mediante transferencia bancaria.",
+    "Se advierte a los comparecientes de las obligaciones fiscales derivadas de este otorgamiento.",
+)
+
+
+def escritura_sintetica(paginas: int, semilla: int = 211) -> bytes:
+    """PDF de `paginas` páginas A4 con ~40 líneas de texto notarial cada una."""
+    rnd = random.Random(semilla)
+    doc = fitz.open()
+    for _ in range(paginas):
+        page = doc.new_page(width=595, height=842)
+        lineas = [
+            rnd.choice(_FRASES).format(n=rnd.choice(("HANS MÜLLER", "ANNA SCHMIDT", "LARS NIELSEN")),
+                                       d=rnd.randint(10000, 99999999))
+            for _ in range(40)
+        ]
+        page.insert_textbox(fitz.Rect(50, 50, 545, 800), "\n".join(lineas), fontsize=9)
+    datos = doc.tobytes()
+    doc.close()
+    return datos
+
+
+class _SondaGil:
+    """Hilo que intenta despertar cada 1 ms y anota el mayor retraso."""
+
+    def __init__(self):
+        self.max_hueco = 0.0
+        self._fin = threading.Event()
+        self._hilo = threading.Thread(target=self._latir, daemon=True)
+
+    def _latir(self):
+        anterior = time.perf_counter()
+        while not self._fin.is_set():
+            time.sleep(0.001)
+            ahora = time.perf_counter()
+            self.max_hueco = max(self.max_hueco, ahora - anterior - 0.001)
+            anterior = ahora
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._fin.set()
+        self._hilo.join()
+
+
+def _medir(datos: bytes, motor: str, workers: int, rondas: int) -> tuple[float, float, str]:
+    """Mejor tiempo de `rondas`, peor hueco del GIL y texto extraído."""
+    pdf_extractor.PDF_TEXT_ENGINE = motor
+    pdf_extractor.PDF_WORKERS = workers
+    mejor, hueco, texto = float("inf"), 0.0, ""
+    for _ in range(rondas):
+        with _SondaGil() as sonda:
+            t0 = time.perf_counter()
+            texto = pdf_extractor.extraer_texto_pdf(io.BytesIO(datos))
+            mejor = min(mejor, time.perf_counter() - t0)
+        hueco = max(hueco, sonda.max_hueco)
+    return mejor, hueco, texto
+
+
+def bench_paginas(paginas: list, workers: int, rondas: int, semilla: int) -> list:
+    pdf_extractor.PDF_PARALLEL_MIN_PAGES = 1      # se compara el reparto en todos los tamaños
+    # Calentar el pool: el arranque de procesos es de una vez por worker
+    _medir(escritura_sintetica(workers * 2, semilla), "pdfplumber", workers, 1)
+
+    resultados = []
+    for n in paginas:
+        datos = escritura_sintetica(n, semilla)
+        fila = {"paginas": n}
+        for motor in pdf_extractor.MOTORES:
+            seq, hueco_seq, texto_seq = _medir(datos, motor, 1, rondas)
+            par, hueco_par, texto_par = _medir(datos, motor, workers, rondas)
+            fila[motor] = {
+                "secuencial_s":     round(seq, 4),
+                "paralelo_s":       round(par, 4),
+                "speedup":          round(seq / par, 2),
+                "gil_hueco_seq_ms": round(hueco_seq * 1000, 1),
+                "gil_hueco_par_ms": round(hueco_par * 1000, 1),
+                "texto_identico":   texto_seq == texto_par,
+            }
+        fila["pymupdf_vs_pdfplumber"] = round(
+            fila["pdfplumber"]["secuencial_s"] / fila["pymupdf"]["secuencial_s"], 1)
+        resultados.append(fila)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extracción de texto de PDFs")
+    parser.add_argument("--paginas", type=int, nargs="+", default=[8, 16, 30, 60], metavar="N",
+                        help="tamaños de escritura sintética")
+    parser.add_argument("--workers", type=int, default=max(2, min(4, os.cpu_count() or 1)))
+    parser.add_argument("--rondas", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=211)
+    parser.add_argument("--json", type=Path, default=None, metavar="RUTA",
+                        help="dónde guardar los resultados (por defecto Output/bench/)")
+    args = parser.parse_args()
+
+    print("\n" + "=" * 60)
+    print(f"  BENCHMARK EXTRACCIÓN PDF  (workers={args.workers}, CPUs={os.cpu_count()})")
+    print("=" * 60)
+
+    filas = bench_paginas(args.paginas, args.workers, args.rondas, args.semilla)
+    print(f"\n    {'págs':>5s} {'motor':>11s} {'secuencial':>11s} {'paralelo':>9s} {'speedup':>8s} "
+          f"{'GIL seq ms':>11s} {'GIL par ms':>11s}")
+    for f in filas:
+        for motor in pdf_extractor.MOTORES:
+            m = f[motor]
+            marca = "✓" if m["texto_identico"] else "✗"
+            print(f"  {marca} {f['paginas']:5d} {motor:>11s} {m['secuencial_s']:10.3f}s "
+                  f"{m['paralelo_s']:8.3f}s {m['speedup']:7.2f}x "
+                  f"{m['gil_hueco_seq_ms']:11.1f} {m['gil_hueco_par_ms']:11.1f}")
+        print(f"    {'':5s} pymupdf x{f['pymupdf_vs_pdfplumber']} más rápido que pdfplumber")
+
+    resultados = {
+        "commit":     _commit(),
+        "fecha":      datetime.now().isoformat(timespec="seconds"),
+        "python":     platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus":       os.cpu_count(),
+        "parametros": {"paginas": args.paginas, "workers": args.workers,
+                       "rondas": args.rondas, "semilla": args.semilla},
+        "extraccion": filas,
+    }
+    ruta = args.json
+    if ruta is None:
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        ruta = MODELIA_DIR / "Output" / "bench" / f"bench_pdf_{ts}_{resultados['commit'] or 'nogit'}.json"
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    with open(ruta, "w", encoding="utf-8") as fh:
+        json.dump(resultados, fh, ensure_ascii=False, indent=2)
+    print(f"\n  Resultados: {ruta}")
+    print("=" * 60)
+
+    if not all(f[m]["texto_identico"] for f in filas for m in pdf_extractor.MOTORES):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
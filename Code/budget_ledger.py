@@ -0,0 +1,257 @@
+"""
+budget_ledger.py
+Contabilidad del gasto en OpenAI a partir de response.usage.
+
+Cada respuesta del LLM se anota con sus tokens (prompt, completion y
+cacheados) y su coste en euros, agregada por día, modelo, endpoint y
+usuario. La tabla es SQLite (WAL) compartida por todos los workers y
+sobrevive a los despliegues; el límite diario se aplica sobre el gasto
+real, no sobre el número de llamadas.
+
+Tabla consumo (una fila por dia/modelo/endpoint/usuario):
+    llamadas, prompt_tokens, completion_tokens, cached_tokens, coste_eur
+
+El endpoint y el usuario no viajan por las firmas de los extractores: la
+ruta los fija con contexto() (un ContextVar) y los pools que lanzan
+llamadas al LLM encolan en una copia del contexto (profiler.encolar).
+
+Configuración:
+    BUDGET_DB                    ruta de la base (Output/budget.sqlite3)
+    PRESUPUESTO_DIARIO_EUR       límite global por día (25)
+    PRESUPUESTO_USUARIO_EUR      límite por usuario y día (0 = sin límite)
+    LLM_PRECIOS_EUR              JSON {modelo: {input, cached, output}} en
+                                 € por millón de tokens; sustituye a PRECIOS
+"""
+
+import contextvars
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import metrics
+
+log = logging.getLogger("budget_ledger")
+
+MODELIA_DIR = Path(__file__).resolve().parent.parent
+
+BUDGET_DB               = Path(os.environ.get("BUDGET_DB", MODELIA_DIR / "Output" / "budget.sqlite3"))
+PRESUPUESTO_DIARIO_EUR  = float(os.environ.get("PRESUPUESTO_DIARIO_EUR", 25))
+PRESUPUESTO_USUARIO_EUR = float(os.environ.get("PRESUPUESTO_USUARIO_EUR", 0))
+
+# € por millón de tokens (tarifa pública en USD convertida a EUR)
+PRECIOS = {
+    "gpt-4o":       {"input": 2.30, "cached": 1.15, "output": 9.20},
+    "gpt-4.1-mini": {"input": 0.37, "cached": 0.09, "output": 1.47},
+}
+if os.environ.get("LLM_PRECIOS_EUR"):
+    PRECIOS = json.loads(os.environ["LLM_PRECIOS_EUR"])
+
+AGRUPACIONES = ("dia", "modelo", "endpoint", "usuario")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS consumo (
+    dia               TEXT NOT NULL,
+    modelo            TEXT NOT NULL,
+    endpoint          TEXT NOT NULL,
+    usuario           TEXT NOT NULL,
+    llamadas          INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens     INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens     INTEGER NOT NULL DEFAULT 0,
+    coste_eur         REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (dia, modelo, endpoint, usuario)
+);
+"""
+
+_contexto: contextvars.ContextVar = contextvars.ContextVar(
+    "budget_contexto", default=("desconocido", "")
+)
+
+
+@contextmanager
+def contexto(endpoint: str, usuario: str | None):
+    """Atribuye al endpoint/usuario las llamadas al LLM hechas dentro."""
+    token = _contexto.set((endpoint, usuario or ""))
+    try:
+        yield
+    finally:
+        _contexto.reset(token)
+
+
+def fijar_contexto(endpoint: str, usuario: str | None):
+    """Como contexto(), para rutas: devuelve el token para restaurarlo."""
+    return _contexto.set((endpoint, usuario or ""))
+
+
+def restaurar_contexto(token) -> None:
+    _contexto.reset(token)
+
+
+def usuario_actual() -> str | None:
+    """Usuario fijado con contexto()/fijar_contexto(), o None."""
+    return _contexto.get()[1] or None
+
+
+def _precio(modelo: str) -> dict | None:
+    """Precio del modelo; admite el nombre con fecha (gpt-4o-2024-08-06)."""
+    if modelo in PRECIOS:
+        return PRECIOS[modelo]
+    candidatos = [m for m in PRECIOS if modelo.startswith(m + "-")]
+    return PRECIOS[max(candidatos, key=len)] if candidatos else None
+
+
+def coste_eur(modelo: str, prompt: int, completion: int, cached: int = 0) -> float:
+    precio = _precio(modelo)
+    if precio is None:
+        log.warning(f"[BUDGET] sin precio para {modelo!r}; coste 0")
+        return 0.0
+    return ((prompt - cached) * precio["input"]
+            + cached * precio["cached"]
+            + completion * precio["output"]) / 1_000_000
+
+
+def _dia(ts: float | None = None) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+
+class BudgetLedger:
+    def __init__(self, db_path: Path, diario_eur: float = PRESUPUESTO_DIARIO_EUR,
+                 usuario_eur: float = PRESUPUESTO_USUARIO_EUR):
+        self.db_path     = Path(db_path)
+        self.diario_eur  = diario_eur
+        self.usuario_eur = usuario_eur
+        self._schema_ok = False
+
+    @contextmanager
+    def _conn(self):
+        if not self._schema_ok:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ok:
+                conn.executescript(_SCHEMA)
+                self._schema_ok = True
+            yield conn
+        finally:
+            conn.close()
+
+    # ── Anotación ────────────────────────────────────────────────────────────
+
+    def registrar(self, response, modelo: str | None = None) -> float:
+        """
+        Anota el usage de una respuesta (o chunk final de un stream) de
+        chat.completions. Devuelve el coste en €. Nunca lanza: la
+        contabilidad no debe romper una extracción ya pagada.
+        """
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return 0.0
+        modelo = getattr(response, "model", None) or modelo or "desconocido"
+        prompt     = usage.prompt_tokens or 0
+        completion = usage.completion_tokens or 0
+        detalles   = getattr(usage, "prompt_tokens_details", None)
+        cached     = (getattr(detalles, "cached_tokens", 0) or 0) if detalles else 0
+        coste = coste_eur(modelo, prompt, completion, cached)
+        endpoint, usuario = _contexto.get()
+        metrics.incrementar("modelia_llm_tokens_total", prompt - cached, modelo=modelo, clase="prompt")
+        metrics.incrementar("modelia_llm_tokens_total", cached, modelo=modelo, clase="cached")
+        metrics.incrementar("modelia_llm_tokens_total", completion, modelo=modelo, clase="completion")
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT INTO consumo (dia, modelo, endpoint, usuario, llamadas, "
+                    "prompt_tokens, completion_tokens, cached_tokens, coste_eur) "
+                    "VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?) "
+                    "ON CONFLICT(dia, modelo, endpoint, usuario) DO UPDATE SET "
+                    "llamadas = llamadas + 1, "
+                    "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                    "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                    "cached_tokens = cached_tokens + excluded.cached_tokens, "
+                    "coste_eur = coste_eur + excluded.coste_eur",
+                    (_dia(), modelo, endpoint, usuario, prompt, completion, cached, coste),
+                )
+        except sqlite3.Error as exc:
+            log.warning(f"[BUDGET] consumo no anotado ({exc})")
+        return coste
+
+    # ── Límites ──────────────────────────────────────────────────────────────
+
+    def gastado_hoy(self, usuario: str | None = None) -> float:
+        sql, args = "SELECT COALESCE(SUM(coste_eur), 0) FROM consumo WHERE dia = ?", [_dia()]
+        if usuario is not None:
+            sql += " AND usuario = ?"
+            args.append(usuario)
+        with self._conn() as conn:
+            return conn.execute(sql, args).fetchone()[0]
+
+    def permitir(self, usuario: str | None = None) -> bool:
+        """
+        False si hoy ya se alcanzó el límite global o el del usuario. El
+        coste de una petición solo se conoce al terminar, así que una
+        petición admitida puede rebasar el límite; la siguiente se rechaza.
+        """
+        try:
+            total = self.gastado_hoy()
+            if total >= self.diario_eur:
+                log.warning(f"[BUDGET] límite diario alcanzado: {total:.2f}/{self.diario_eur:.2f} €")
+                metrics.incrementar("modelia_presupuesto_rechazos_total", limite="global")
+                return False
+            if usuario and self.usuario_eur > 0:
+                propio = self.gastado_hoy(usuario)
+                if propio >= self.usuario_eur:
+                    log.warning(f"[BUDGET] límite de {usuario} alcanzado: "
+                                f"{propio:.2f}/{self.usuario_eur:.2f} €")
+                    metrics.incrementar("modelia_presupuesto_rechazos_total", limite="usuario")
+                    return False
+            log.info(f"[BUDGET] gasto hoy: {total:.2f}/{self.diario_eur:.2f} €")
+        except sqlite3.Error as exc:
+            log.warning(f"[BUDGET] ledger no disponible ({exc}); petición permitida")
+        return True
+
+    def disponible(self, usuario: str | None = None) -> float:
+        """
+        € que quedan hoy antes de tocar el límite global o el del usuario
+        (el menor de los dos). Para decidir antes de lanzar una tanda de
+        llamadas caras; si el ledger no responde, sin límite, como
+        permitir().
+        """
+        try:
+            margen = self.diario_eur - self.gastado_hoy()
+            if usuario and self.usuario_eur > 0:
+                margen = min(margen, self.usuario_eur - self.gastado_hoy(usuario))
+        except sqlite3.Error as exc:
+            log.warning(f"[BUDGET] ledger no disponible ({exc}); sin límite")
+            return float("inf")
+        return max(0.0, margen)
+
+    # ── Informes ─────────────────────────────────────────────────────────────
+
+    def resumen(self, dias: int = 7, por=("dia", "endpoint")) -> list[dict]:
+        """
+        Totales de los últimos `dias` días agrupados por las columnas de
+        `por` (subconjunto de AGRUPACIONES), de mayor a menor coste.
+        """
+        por = [c for c in por if c in AGRUPACIONES] or ["dia"]
+        columnas = ", ".join(por)
+        desde = _dia(time.time() - (dias - 1) * 86400)
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"SELECT {columnas}, SUM(llamadas) AS llamadas, "
+                f"SUM(prompt_tokens) AS prompt_tokens, "
+                f"SUM(completion_tokens) AS completion_tokens, "
+                f"SUM(cached_tokens) AS cached_tokens, SUM(coste_eur) AS coste_eur "
+                f"FROM consumo WHERE dia >= ? GROUP BY {columnas} "
+                f"ORDER BY coste_eur DESC",
+                (desde,),
+            ).fetchall()
+        return [dict(r, coste_eur=round(r["coste_eur"], 4)) for r in rows]
+
+
+ledger = BudgetLedger(BUDGET_DB)
@@ -6,8 +6,11 @@ OpenAI GPT-4o agent with function calling for Cárdenas Real Estate chatbot.
 import json
 import logging
 import re
+import time
 from pathlib import Path
-from openai import OpenAI
+from budget_ledger import ledger as budget  # Code/ esta en sys.path via app.py
+import metrics  # Code/ esta en sys.path via app.py
+from openai_clients import get_client  # Code/ esta en sys.path via app.py
 
 from . import property_sync, database
 
@@ -378,6 +381,11 @@ def _load_kb_sections(topic: str) -> str:
 
 def _execute_tool(tool_name: str, args: dict, chat_id: str) -> str:
     """Execute a tool call and return the result as a string."""
+    with metrics.cronometro("modelia_chatbot_tool_segundos", tool=tool_name):
+        return _run_tool(tool_name, args, chat_id)
+
+
+def _run_tool(tool_name: str, args: dict, chat_id: str) -> str:
     if tool_name == "get_agency_info":
         topic = args.get("topic", "all")
         info = _load_kb_sections(topic)
@@ -500,16 +508,18 @@ def _execute_tool(tool_name: str, args: dict, chat_id: str) -> str:
 
 def chat(api_key: str, chat_id: str, messages: list[dict]) -> str:
     """Non-streaming chat. Returns the assistant's full response text."""
-    client = OpenAI(api_key=api_key)
+    client = get_client(api_key, "chat")
 
     full_messages = [{"role": "system", "content": SYSTEM_PROMPT}] + messages
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=full_messages,
-        tools=TOOLS,
-        max_completion_tokens=1024,
-    )
+    with metrics.cronometro("modelia_llm_llamada_segundos", modelo="gpt-4.1-mini", tipo="chat"):
+        response = client.chat.completions.create(
+            model="gpt-4.1-mini",
+            messages=full_messages,
+            tools=TOOLS,
+            max_completion_tokens=1024,
+        )
+    budget.registrar(response)
 
     message = response.choices[0].message
 
@@ -525,12 +535,14 @@ def chat(api_key: str, chat_id: str, messages: list[dict]) -> str:
                 "content": result,
             })
 
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=full_messages,
-            tools=TOOLS,
-            max_completion_tokens=1024,
-        )
+        with metrics.cronometro("modelia_llm_llamada_segundos", modelo="gpt-4.1-mini", tipo="chat"):
+            response = client.chat.completions.create(
+                model="gpt-4.1-mini",
+                messages=full_messages,
+                tools=TOOLS,
+                max_completion_tokens=1024,
+            )
+        budget.registrar(response)
         message = response.choices[0].message
 
     return message.content or ""
@@ -544,17 +556,19 @@ def chat_stream(api_key: str, chat_id: str, messages: list[dict]):
       {"type": "properties", "data": [...]}  (when properties are found)
       {"type": "done"}
     """
-    client = OpenAI(api_key=api_key)
+    client = get_client(api_key, "chat")
     full_messages = [{"role": "system", "content": SYSTEM_PROMPT}] + messages
     last_search_results = []
 
     while True:
+        llm_t0 = time.perf_counter()
         stream = client.chat.completions.create(
             model="gpt-4.1-mini",
             messages=full_messages,
             tools=TOOLS,
             max_completion_tokens=1024,
             stream=True,
+            stream_options={"include_usage": True},
         )
 
         # Collect the streamed response
@@ -562,6 +576,9 @@ def chat_stream(api_key: str, chat_id: str, messages: list[dict]):
         collected_tool_calls = {}
 
         for chunk in stream:
+            if chunk.usage:
+                # Last chunk (include_usage): no choices, only token counts
+                budget.registrar(chunk)
             delta = chunk.choices[0].delta if chunk.choices else None
             if not delta:
                 continue
@@ -589,6 +606,9 @@ def chat_stream(api_key: str, chat_id: str, messages: list[dict]):
                         if tc.function.arguments:
                             collected_tool_calls[idx]["arguments"] += tc.function.arguments
 
+        metrics.observar("modelia_llm_llamada_segundos", time.perf_counter() - llm_t0,
+                         modelo="gpt-4.1-mini", tipo="chat_stream")
+
         # If no tool calls, we're done
         if not collected_tool_calls:
             break
@@ -623,12 +643,14 @@ def chat_stream(api_key: str, chat_id: str, messages: list[dict]):
         # After tool execution, get the bot's response WITHOUT streaming
         # so we can extract mentioned REFs and send matching cards FIRST
         if last_search_results:
-            response = client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=full_messages,
-                tools=TOOLS,
-                max_completion_tokens=1024,
-            )
+            with metrics.cronometro("modelia_llm_llamada_segundos", modelo="gpt-4.1-mini", tipo="chat"):
+                response = client.chat.completions.create(
+                    model="gpt-4.1-mini",
+                    messages=full_messages,
+                    tools=TOOLS,
+                    max_completion_tokens=1024,
+                )
+            budget.registrar(response)
             message = response.choices[0].message
 
             # Handle any follow-up tool calls (rare but possible)
@@ -642,12 +664,14 @@ def chat_stream(api_key: str, chat_id: str, messages: list[dict]):
                         "tool_call_id": tool_call.id,
                         "content": tc_result,
                     })
-                response = client.chat.completions.create(
-                    model="gpt-4.1-mini",
-                    messages=full_messages,
-                    tools=TOOLS,
-                    max_completion_tokens=1024,
-                )
+                with metrics.cronometro("modelia_llm_llamada_segundos", modelo="gpt-4.1-mini", tipo="chat"):
+                    response = client.chat.completions.create(
+                        model="gpt-4.1-mini",
+                        messages=full_messages,
+                        tools=TOOLS,
+                        max_completion_tokens=1024,
+                    )
+                budget.registrar(response)
                 message = response.choices[0].message
 
             bot_text = message.content or ""
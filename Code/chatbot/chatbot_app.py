@@ -11,10 +11,11 @@ import logging
 import os
 import uuid
 
-from flask import Blueprint, Response, jsonify, request
+from flask import Blueprint, Response, g, jsonify, request
 
 from . import agent, database, property_sync
 from auth import require_auth  # noqa: E402 — Code/ esta en sys.path via app.py
+from budget_ledger import contexto, ledger as budget  # noqa: E402
 
 log = logging.getLogger("chatbot")
 
@@ -37,6 +38,10 @@ def api_chat():
     if not data or "message" not in data:
         return jsonify({"error": "Missing 'message' field"}), 400
 
+    user_id = g.user.get("id")
+    if not budget.permitir(user_id):
+        return jsonify({"error": "Daily usage limit reached."}), 429
+
     chat_id = data.get("chat_id", str(uuid.uuid4()))
     user_message = data["message"]
     history = data.get("history", [])
@@ -53,16 +58,19 @@ def api_chat():
     def generate():
         full_response = ""
         try:
-            for event in agent.chat_stream(api_key, chat_id, messages):
-                if event["type"] == "text":
-                    full_response += event["content"]
-                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
-                elif event["type"] == "properties":
-                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
-                elif event["type"] == "done":
-                    if full_response:
-                        database.log_message(chat_id, "assistant", full_response)
-                    yield f"data: {json.dumps({'type': 'done', 'chat_id': chat_id}, ensure_ascii=False)}\n\n"
+            # The body streams after the view has returned, so LLM usage is
+            # attributed here rather than from the request context
+            with contexto("/chatbot/api/chat", user_id):
+                for event in agent.chat_stream(api_key, chat_id, messages):
+                    if event["type"] == "text":
+                        full_response += event["content"]
+                        yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    elif event["type"] == "properties":
+                        yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                    elif event["type"] == "done":
+                        if full_response:
+                            database.log_message(chat_id, "assistant", full_response)
+                        yield f"data: {json.dumps({'type': 'done', 'chat_id': chat_id}, ensure_ascii=False)}\n\n"
         except Exception as e:
             log.error(f"Chat error: {e}", exc_info=True)
             yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
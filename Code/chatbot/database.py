@@ -9,6 +9,8 @@ from datetime import datetime
 
 from supabase import create_client
 
+import metrics  # Code/ esta en sys.path via app.py
+
 # Las credenciales se leen de env vars (Railway). Si por accidente no
 # estuvieran definidas, caemos al valor publico actual para no romper el
 # arranque, pero hay que dejarlas configuradas en Railway.
@@ -36,6 +38,7 @@ class _LazyClient:
 _client = _LazyClient()
 
 
+@metrics.cronometrado("modelia_supabase_segundos", operacion="leads.insert")
 def save_lead(
     chat_id: str,
     name: str = "",
@@ -71,6 +74,7 @@ def save_lead(
     return lead_id
 
 
+@metrics.cronometrado("modelia_supabase_segundos", operacion="chat_logs.insert")
 def log_message(chat_id: str, role: str, content: str):
     """Append a message to the chat log."""
     _client.table("chat_logs").insert({
@@ -81,6 +85,7 @@ def log_message(chat_id: str, role: str, content: str):
     }).execute()
 
 
+@metrics.cronometrado("modelia_supabase_segundos", operacion="chat_logs.select")
 def get_chat_history(chat_id: str) -> list[dict]:
     """Get all messages for a chat session."""
     result = (
@@ -93,6 +98,7 @@ def get_chat_history(chat_id: str) -> list[dict]:
     return result.data
 
 
+@metrics.cronometrado("modelia_supabase_segundos", operacion="leads.select")
 def get_all_leads() -> list[dict]:
     """Get all leads, most recent first."""
     result = (
@@ -10,6 +10,8 @@ from datetime import datetime
 import requests
 from supabase import create_client
 
+import metrics  # Code/ esta en sys.path via app.py
+
 SUPABASE_URL = os.environ.get(
     "SUPABASE_URL",
     "https://pntipdspiivffvxfyshg.supabase.co",
@@ -186,13 +188,14 @@ def _sync_xml_content(xml_bytes: bytes, source: str) -> dict:
         if prop["active"] and prop["ref"]:
             properties.append(prop)
 
-    # Delete all existing properties
-    _client.table("properties").delete().neq("ref", "").execute()
+    with metrics.cronometro("modelia_supabase_segundos", operacion="properties.replace"):
+        # Delete all existing properties
+        _client.table("properties").delete().neq("ref", "").execute()
 
-    # Insert all new properties in batches of 50
-    for i in range(0, len(properties), 50):
-        batch = properties[i:i + 50]
-        _client.table("properties").insert(batch).execute()
+        # Insert all new properties in batches of 50
+        for i in range(0, len(properties), 50):
+            batch = properties[i:i + 50]
+            _client.table("properties").insert(batch).execute()
 
     return {
         "last_sync": datetime.now().isoformat(),
@@ -201,12 +204,14 @@ def _sync_xml_content(xml_bytes: bytes, source: str) -> dict:
     }
 
 
+@metrics.cronometrado("modelia_supabase_segundos", operacion="properties.load")
 def load_properties() -> list[dict]:
     """Load all active properties from Supabase."""
     result = _client.table("properties").select("*").eq("active", True).execute()
     return result.data
 
 
+@metrics.cronometrado("modelia_supabase_segundos", operacion="properties.sync_meta")
 def load_sync_meta() -> dict | None:
     """Get sync status from the most recently synced property."""
     result = (
@@ -252,7 +257,8 @@ def search_properties(
     if price_min:
         query = query.gte("price", price_min)
 
-    result = query.execute()
+    with metrics.cronometro("modelia_supabase_segundos", operacion="properties.search"):
+        result = query.execute()
     properties = result.data
 
     # Client-side filtering for fuzzy matches (type, location, features)
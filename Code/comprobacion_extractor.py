@@ -5,7 +5,12 @@ con function calling, para la verificación cruzada (comprobación).
 """
 
 import json
-from openai import OpenAI
+
+import budget_ledger
+import llm_cache
+import metrics
+import texto_relevante
+from openai_clients import get_client
 
 
 # ── Schemas comunes ──────────────────────────────────────────────────────────
@@ -177,52 +182,72 @@ Instrucciones:
 # ── Función genérica de extracción ───────────────────────────────────────────
 
 def _extraer_con_llm(texto: str, api_key: str, system_prompt: str,
-                     tool_schema: dict, user_prompt: str) -> dict:
-    """Llama a GPT-4o con function calling y devuelve el dict extraído."""
-    client = OpenAI(api_key=api_key)
-
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        temperature=0,
-        max_tokens=4096,
-        messages=[
+                     tool_schema: dict, user_prompt: str, usar_cache: bool = True) -> dict:
+    """
+    Llama a GPT-4o con function calling y devuelve el dict extraído.
+    Cacheado en llm_cache por petición completa (prompt, schema y texto).
+    """
+    nombre = tool_schema["function"]["name"]
+    tipo = "comprobacion_" + nombre.removeprefix("extract_")
+    peticion = {
+        "model": "gpt-4o",
+        "temperature": 0,
+        "max_tokens": 4096,
+        "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ],
-        tools=[tool_schema],
-        tool_choice={"type": "function", "function": {"name": tool_schema["function"]["name"]}},
+        "tools": [tool_schema],
+        "tool_choice": {"type": "function", "function": {"name": nombre}},
+    }
+
+    def llamar() -> dict:
+        client = get_client(api_key, "extraccion")
+        with metrics.cronometro("modelia_llm_llamada_segundos",
+                                modelo=peticion["model"], tipo=tipo):
+            response = client.chat.completions.create(**peticion)
+        budget_ledger.ledger.registrar(response, peticion["model"])
+
+        message = response.choices[0].message
+        if message.tool_calls:
+            for tool_call in message.tool_calls:
+                if tool_call.function.name == nombre:
+                    return json.loads(tool_call.function.arguments)
+
+        raise RuntimeError("El modelo no devolvió ningún function call.")
+
+    return llm_cache.cache.obtener_o_calcular(
+        tipo, llm_cache.clave(peticion["model"], peticion), llamar,
+        bypass=not usar_cache,
     )
 
-    message = response.choices[0].message
-    if message.tool_calls:
-        for tool_call in message.tool_calls:
-            if tool_call.function.name == tool_schema["function"]["name"]:
-                return json.loads(tool_call.function.arguments)
-
-    raise RuntimeError("El modelo no devolvió ningún function call.")
-
 
 # ── Funciones públicas ───────────────────────────────────────────────────────
 
-def extraer_datos_escritura(texto: str, api_key: str) -> dict:
-    """Extrae datos de una escritura notarial de compraventa."""
+def extraer_datos_escritura(texto: str, api_key: str, usar_cache: bool = True) -> dict:
+    """Extrae datos de una escritura notarial de compraventa (solo las
+    páginas con datos, ver texto_relevante)."""
+    texto, _ = texto_relevante.podar(texto, "comprobacion_escritura")
     return _extraer_con_llm(
         texto, api_key, SYSTEM_ESCRITURA, EXTRACT_ESCRITURA,
-        f"Extrae los datos de la siguiente escritura notarial de compraventa:\n\n{texto}"
+        f"Extrae los datos de la siguiente escritura notarial de compraventa:\n\n{texto}",
+        usar_cache=usar_cache,
     )
 
 
-def extraer_datos_211(texto: str, api_key: str) -> dict:
+def extraer_datos_211(texto: str, api_key: str, usar_cache: bool = True) -> dict:
     """Extrae datos de un Modelo 211 ya cumplimentado."""
     return _extraer_con_llm(
         texto, api_key, SYSTEM_211, EXTRACT_211,
-        f"Extrae los datos del siguiente Modelo 211 cumplimentado:\n\n{texto}"
+        f"Extrae los datos del siguiente Modelo 211 cumplimentado:\n\n{texto}",
+        usar_cache=usar_cache,
     )
 
 
-def extraer_datos_600(texto: str, api_key: str) -> dict:
+def extraer_datos_600(texto: str, api_key: str, usar_cache: bool = True) -> dict:
     """Extrae datos de un Modelo 600 de Canarias ya cumplimentado."""
     return _extraer_con_llm(
         texto, api_key, SYSTEM_600, EXTRACT_600,
-        f"Extrae los datos del siguiente Modelo 600 cumplimentado:\n\n{texto}"
+        f"Extrae los datos del siguiente Modelo 600 cumplimentado:\n\n{texto}",
+        usar_cache=usar_cache,
     )
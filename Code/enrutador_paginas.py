@@ -0,0 +1,296 @@
+"""
+enrutador_paginas.py
+Decide, página a página, si un PDF se lee por su capa de texto o con visión.
+
+Muchas subidas son mixtas: una escritura digital con anexos escaneados, o
+un lote de hojas de visita en el que unas salen del CRM y otras del
+escáner. Con PyMuPDF se clasifica cada página sin renderizarla:
+
+    texto   tiene capa de texto utilizable → pdf_extractor (barato)
+    imagen  escaneada o sin texto pero con imágenes/trazos → GPT-4o visión
+    vacia   ni texto ni imágenes → no se envía a ningún sitio
+
+Una página cubierta por una imagen (ENRUTADOR_COBERTURA_IMAGEN) cuenta
+como escaneada salvo que traiga una capa OCR de al menos
+ENRUTADOR_CARACTERES_OCR caracteres: el sello o la cabecera digital que
+algunos escáneres añaden no es el contenido de la página.
+
+/process y /comprobacion usan leer_paginas(): las páginas de texto pasan
+por pdf_extractor y las de imagen se transcriben con visión (una llamada
+por página, cacheada en llm_cache) y se insertan en su sitio, así que el
+LLM de extracción recibe el documento completo. Las hojas de visita usan
+clasificar_pagina() y renderizar_zona_firma() en hoja_extractor.
+
+Configuración:
+    ENRUTADOR_COBERTURA_IMAGEN   fracción de página cubierta por imágenes para
+                                 considerarla escaneada (0.5)
+    ENRUTADOR_CARACTERES_OCR     caracteres a partir de los que una página
+                                 escaneada se lee por su capa OCR (200)
+    VISION_MAX_PAGINAS           páginas de imagen por documento que se
+                                 transcriben como máximo (30; si hay más,
+                                 ninguna; tampoco si su coste estimado no
+                                 cabe en el presupuesto del día)
+    VISION_CONCURRENCY           transcripciones simultáneas por documento (4)
+    VISION_DPI                   resolución del render (200)
+"""
+
+import base64
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import fitz  # PyMuPDF
+
+import budget_ledger
+import llm_cache
+import metrics
+import profiler
+from openai_clients import get_client
+from pdf_extractor import PDF_MIN_CHARS_PAGINA, iter_texto_pdf
+
+log = logging.getLogger("enrutador_paginas")
+
+ENRUTADOR_COBERTURA_IMAGEN = float(os.environ.get("ENRUTADOR_COBERTURA_IMAGEN", 0.5))
+ENRUTADOR_CARACTERES_OCR   = int(os.environ.get("ENRUTADOR_CARACTERES_OCR", 200))
+VISION_MAX_PAGINAS         = int(os.environ.get("VISION_MAX_PAGINAS", 30))
+VISION_CONCURRENCY         = int(os.environ.get("VISION_CONCURRENCY", 4))
+VISION_DPI                 = int(os.environ.get("VISION_DPI", 200))
+
+TEXTO, IMAGEN, VACIA = "texto", "imagen", "vacia"
+
+# Sin texto: por debajo de esta cobertura una imagen es un logo, y con
+# menos trazos vectoriales la página no es texto convertido a curvas
+_COBERTURA_MINIMA = 0.05
+_TRAZOS_MINIMOS   = 50
+
+# Tokens de una transcripción para estimar su coste antes de lanzarla: un A4
+# a 200 ppp con detail "high" son 6 teselas (85 + 6·170) más el prompt, y
+# una página densa transcrita ronda los 1000 de salida
+_TOKENS_ENTRADA_PAGINA = 1300
+_TOKENS_SALIDA_PAGINA  = 1000
+
+SYSTEM_OCR = """Eres un transcriptor de documentos notariales y fiscales españoles escaneados.
+Transcribe literalmente todo el texto legible de la página, en orden de lectura,
+sin resumir, traducir ni corregir. Conserva números, fechas, NIF/NIE, referencias
+catastrales e importes exactamente como aparecen. Las tablas, línea a línea con
+sus celdas separadas por " | ". Si un fragmento es ilegible escribe [ilegible].
+Devuelve solo la transcripción."""
+
+
+# ── Clasificación ─────────────────────────────────────────────────────────────
+
+def clasificar_pagina(page) -> dict:
+    """
+    {pagina, ruta, caracteres, cobertura, texto} de una página de PyMuPDF.
+    `texto` es su capa de texto tal cual (vacía si no tiene).
+    """
+    texto = page.get_text("text")
+    caracteres = len(texto.strip())
+    area = abs(page.rect) or 1.0
+    cubierta = 0.0
+    for info in page.get_image_info():
+        visible = fitz.Rect(info["bbox"]) & page.rect
+        if not visible.is_empty:
+            cubierta += abs(visible)
+    cobertura = min(1.0, cubierta / area)
+
+    if cobertura >= ENRUTADOR_COBERTURA_IMAGEN and caracteres < ENRUTADOR_CARACTERES_OCR:
+        ruta = IMAGEN
+    elif caracteres >= PDF_MIN_CHARS_PAGINA:
+        ruta = TEXTO
+    elif cobertura >= _COBERTURA_MINIMA or len(page.get_cdrawings()) >= _TRAZOS_MINIMOS:
+        ruta = IMAGEN
+    elif caracteres:
+        ruta = TEXTO
+    else:
+        ruta = VACIA
+    metrics.incrementar("modelia_paginas_ruta_total", ruta=ruta)
+    return {"pagina": page.number + 1, "ruta": ruta, "caracteres": caracteres,
+            "cobertura": round(cobertura, 3), "texto": texto}
+
+
+def clasificar(doc) -> list[dict]:
+    """clasificar_pagina() de cada página de un fitz.Document, en orden."""
+    return [clasificar_pagina(page) for page in doc]
+
+
+# ── Visión ────────────────────────────────────────────────────────────────────
+
+def renderizar_pagina(page, dpi: int = VISION_DPI) -> str:
+    """Página de PyMuPDF → PNG en base64."""
+    with metrics.cronometro("modelia_render_pagina_segundos"):
+        zoom = dpi / 72.0
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        return base64.b64encode(pix.tobytes("png")).decode("utf-8")
+
+
+def renderizar_zona_firma(page, dpi: int = 100) -> str:
+    """
+    El 40 % inferior de la página (donde van las firmas) → PNG en base64.
+    Para que visión juzgue la firma de una página leída por su texto.
+    """
+    rect = page.rect
+    zona = fitz.Rect(rect.x0, rect.y0 + rect.height * 0.6, rect.x1, rect.y1)
+    with metrics.cronometro("modelia_render_pagina_segundos"):
+        zoom = dpi / 72.0
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=zona)
+        return base64.b64encode(pix.tobytes("png")).decode("utf-8")
+
+
+def transcribir_pagina(client, img_b64: str, usar_cache: bool = True) -> str:
+    """Texto de una página escaneada con GPT-4o visión (cacheado por imagen)."""
+    peticion = {
+        "model": "gpt-4o",
+        "temperature": 0,
+        "max_tokens": 4096,
+        "messages": [
+            {"role": "system", "content": SYSTEM_OCR},
+            {"role": "user", "content": [
+                {"type": "text", "text": "Transcribe esta página:"},
+                {"type": "image_url", "image_url": {
+                    "url": f"data:image/png;base64,{img_b64}",
+                    "detail": "high",
+                }},
+            ]},
+        ],
+    }
+
+    def llamar() -> str:
+        with metrics.cronometro("modelia_llm_llamada_segundos",
+                                modelo=peticion["model"], tipo="ocr_pagina"):
+            response = client.chat.completions.create(**peticion)
+        budget_ledger.ledger.registrar(response, peticion["model"])
+        return response.choices[0].message.content or ""
+
+    return llm_cache.cache.obtener_o_calcular(
+        "ocr_pagina", llm_cache.clave(peticion["model"], peticion), llamar,
+        bypass=not usar_cache,
+    )
+
+
+def _transcribir(client, documento, n: int, render: threading.Lock,
+                parar: threading.Event, usar_cache: bool) -> tuple[str, float] | None:
+    """
+    Renderiza la página `n` y la transcribe. El render va en el hilo del
+    pool (solo hay VISION_CONCURRENCY imágenes en memoria a la vez) pero
+    bajo `render`: un fitz.Document no se comparte entre hilos. None si se
+    paró antes de empezar.
+    """
+    t0 = time.perf_counter()
+    with render:
+        if parar.is_set():
+            return None
+        img_b64 = renderizar_pagina(documento[n - 1])
+    texto = transcribir_pagina(client, img_b64, usar_cache)
+    return texto, time.perf_counter() - t0
+
+
+def _coste_vision(paginas: int) -> float:
+    """€ estimados de transcribir `paginas` páginas (A4 a VISION_DPI, detail high)."""
+    return paginas * budget_ledger.coste_eur("gpt-4o", _TOKENS_ENTRADA_PAGINA,
+                                             _TOKENS_SALIDA_PAGINA)
+
+
+# ── Lectura enrutada ──────────────────────────────────────────────────────────
+
+def leer_paginas(pdf, api_key: str, usar_cache: bool = True,
+                 paginas_info: list | None = None,
+                 cancelado: threading.Event | None = None) -> list[tuple[int, str]]:
+    """
+    (nº de página, texto) de un PdfSubido, en orden. Las páginas de imagen
+    se encolan a visión primero (cada tarea renderiza la suya), y mientras
+    responden se extraen las de texto con iter_texto_pdf; las vacías se
+    omiten.
+
+    Si hay más de VISION_MAX_PAGINAS páginas de imagen, o su coste estimado
+    no cabe en lo que queda del presupuesto del día (budget_ledger), no se
+    transcribe ninguna (un escaneado entero de 60 páginas no debe ir a
+    visión sin más): el documento se queda con su texto y el llamante
+    decide.
+
+    Args:
+        pdf:          PdfSubido (usa pdf.documento y pdf.stream()).
+        paginas_info: Si se pasa una lista, se le añade por página leída
+                      {pagina, motor, segundos, caracteres, motivo, ruta}
+                      (motor "vision" en las páginas de imagen). Una página
+                      cuya transcripción falla no se devuelve y aquí lleva
+                      motivo "error_vision".
+        cancelado:    Si se activa, se deja de leer y se vuelve sin esperar
+                      a las transcripciones en curso (su resultado se
+                      descarta); las pendientes no llegan a empezar.
+    """
+    rutas = clasificar(pdf.documento)
+    de_texto = [r["pagina"] for r in rutas if r["ruta"] == TEXTO]
+    de_imagen = [r["pagina"] for r in rutas if r["ruta"] == IMAGEN]
+    log.info(f"[RUTA] {len(de_texto)} páginas de texto, {len(de_imagen)} de imagen, "
+             f"{len(rutas) - len(de_texto) - len(de_imagen)} vacías")
+    if len(de_imagen) > VISION_MAX_PAGINAS:
+        log.warning(f"[RUTA] {len(de_imagen)} páginas de imagen > VISION_MAX_PAGINAS "
+                    f"({VISION_MAX_PAGINAS}); no se transcriben")
+        de_imagen = []
+    if de_imagen:
+        estimado = _coste_vision(len(de_imagen))
+        margen = budget_ledger.ledger.disponible(budget_ledger.usuario_actual())
+        if estimado > margen:
+            log.warning(f"[RUTA] {len(de_imagen)} páginas de imagen costarían ~{estimado:.2f} € "
+                        f"y quedan {margen:.2f} € de presupuesto; no se transcriben")
+            metrics.incrementar("modelia_presupuesto_rechazos_total", limite="vision")
+            de_imagen = []
+
+    def parado() -> bool:
+        return cancelado is not None and cancelado.is_set()
+
+    paginas, info = {}, {}
+    futuros = {}
+    render, parar = threading.Lock(), threading.Event()
+    pool = ThreadPoolExecutor(max_workers=max(1, VISION_CONCURRENCY),
+                              thread_name_prefix="vision")
+    try:
+        if de_imagen and not parado():
+            client = get_client(api_key, "vision")
+            for n in de_imagen:
+                futuro = profiler.encolar(pool, _transcribir, client, pdf.documento, n,
+                                          render, parar, usar_cache)
+                futuros[futuro] = n
+
+        if de_texto and not parado():
+            extraidas = [] if paginas_info is not None else None
+            for n, texto in iter_texto_pdf(pdf.stream(), extraidas, paginas=de_texto):
+                paginas[n] = texto
+                if extraidas:
+                    info[n] = dict(extraidas.pop(), ruta=TEXTO)
+                if parado():
+                    break
+
+        # Con `cancelado` se espera a ratos para enterarse a tiempo
+        espera = 0.25 if cancelado is not None else None
+        pendientes = set(futuros)
+        while pendientes and not parado():
+            hechos, pendientes = wait(pendientes, timeout=espera, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                n = futuros[futuro]
+                try:
+                    texto, segundos = futuro.result()
+                except Exception as exc:
+                    # Una página fallida no tira las demás: falta y el
+                    # llamante decide con el texto que queda
+                    log.warning(f"[RUTA] página {n} no transcrita: {type(exc).__name__}: {exc}")
+                    metrics.incrementar("modelia_errores_total", etapa="vision_pagina")
+                    info[n] = {"pagina": n, "motor": "vision", "segundos": None,
+                               "caracteres": 0, "motivo": "error_vision", "ruta": IMAGEN}
+                    continue
+                paginas[n] = texto
+                info[n] = {"pagina": n, "motor": "vision", "segundos": round(segundos, 5),
+                           "caracteres": len(texto.strip()), "motivo": None, "ruta": IMAGEN}
+    finally:
+        # Ninguna tarea vuelve a tocar pdf.documento (el llamante lo cierra al
+        # volver); las llamadas en vuelo terminan solas y se descartan
+        with render:
+            parar.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if paginas_info is not None:
+        paginas_info.extend(info[n] for n in sorted(info))
+    return sorted(paginas.items())
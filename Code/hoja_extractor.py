@@ -1,24 +1,42 @@
 """
 hoja_extractor.py
 Extracts structured data from Cardenas Real Estate visit reports (hojas de visita)
-using GPT-4o vision (image-based), for audit verification.
+using GPT-4o, for audit verification.
 
-These PDFs are scanned documents (images), so we convert each page to an image
-and send it to GPT-4o vision for extraction.
+Each page is routed on its own (see enrutador_paginas): scanned pages are
+rendered to an image and sent to GPT-4o vision, while pages generated by the
+CRM are sent as their text layer, which is much cheaper and faster, plus a
+small low-detail image of their signature area so vision still judges the
+client signature.
 
 Supports documents in Spanish, English, and German.
 """
 
-import base64
 import json
+import logging
+import os
 import re
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 
 import fitz  # PyMuPDF
 from openai import OpenAI
 
+import budget_ledger
+import enrutador_paginas
+import llm_cache
+import metrics
+import profiler
+from openai_clients import get_client
+
+log = logging.getLogger("hoja_extractor")
+
+# Max concurrent GPT-4o vision requests per batch PDF
+HOJA_CONCURRENCY = int(os.environ.get("HOJA_CONCURRENCY", 4))
+
 
 # ── Schema for GPT-4o function calling ──────────────────────────────────────
 
@@ -169,71 +187,128 @@ Return only the client's name, without any ID numbers or reference codes."""
 
 # ── PDF to images ───────────────────────────────────────────────────────────
 
-def pdf_to_base64_images(pdf_path: Path, dpi: int = 200) -> list[str]:
-    """Convert each page of a PDF to a base64-encoded PNG string."""
-    pdf_path = Path(pdf_path)
-    images = []
-    doc = fitz.open(pdf_path)
+@contextmanager
+def _open_document(pdf_path):
+    """``pdf_path`` is a path or an already open ``fitz.Document`` (e.g. the
+    one held by an ingested upload); a document passed in is left open."""
+    owned = not isinstance(pdf_path, fitz.Document)
+    doc = fitz.open(Path(pdf_path)) if owned else pdf_path
     try:
-        for page in doc:
-            # Render page to pixmap at given DPI
-            zoom = dpi / 72.0
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat)
-            png_bytes = pix.tobytes("png")
-            b64 = base64.b64encode(png_bytes).decode("utf-8")
-            images.append(b64)
+        yield doc
     finally:
-        doc.close()
-    return images
+        if owned:
+            doc.close()
 
 
-# ── Extraction via GPT-4o vision ────────────────────────────────────────────
+def iter_base64_images(pdf_path, dpi: int = 200):
+    """Yield each page of a PDF as a base64-encoded PNG string, one at a time."""
+    with _open_document(pdf_path) as doc:
+        for page in doc:
+            yield enrutador_paginas.renderizar_pagina(page, dpi)
 
-def extraer_datos_hoja(pdf_path: Path, api_key: str) -> dict:
-    """Extract structured data from a hoja de visita PDF using GPT-4o vision."""
-    images_b64 = pdf_to_base64_images(pdf_path)
 
-    if not images_b64:
-        raise RuntimeError("No se pudieron extraer paginas del PDF.")
+def pdf_to_base64_images(pdf_path, dpi: int = 200) -> list[str]:
+    """Convert each page of a PDF to a base64-encoded PNG string."""
+    return list(iter_base64_images(pdf_path, dpi))
 
-    client = OpenAI(api_key=api_key)
 
-    # Build the user message with images
-    content = [
-        {"type": "text", "text": "Extract the data from this property visit report (hoja de visita):"},
-    ]
-    for img_b64 in images_b64:
-        content.append({
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/png;base64,{img_b64}",
-                "detail": "high",
-            },
-        })
+# ── Extraction via GPT-4o vision ────────────────────────────────────────────
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        temperature=0,
-        max_tokens=2048,
-        messages=[
+def _hoja_request(content: list) -> dict:
+    """Chat completion kwargs for a hoja extraction; also the llm_cache key."""
+    return {
+        "model": "gpt-4o",
+        "temperature": 0,
+        "max_tokens": 2048,
+        "messages": [
             {"role": "system", "content": SYSTEM_HOJA},
             {"role": "user", "content": content},
         ],
-        tools=[EXTRACT_HOJA],
-        tool_choice={
+        "tools": [EXTRACT_HOJA],
+        "tool_choice": {
             "type": "function",
             "function": {"name": "extract_hoja_visita"},
         },
-    )
+    }
 
-    message = response.choices[0].message
-    if message.tool_calls:
-        for tool_call in message.tool_calls:
-            if tool_call.function.name == "extract_hoja_visita":
-                return json.loads(tool_call.function.arguments)
 
-    raise RuntimeError("GPT-4o did not return a function call for hoja extraction.")
+# Sent with text pages, each followed by an image of its signature area
+_TEXT_LAYER_NOTE = (
+    "Pages marked '(text layer)' were generated digitally and are given as their "
+    "text, followed by an image of the bottom of the page where the signatures "
+    "are: judge client_signature_present from the images."
+)
+
+
+def _image_part(img_b64: str) -> dict:
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:image/png;base64,{img_b64}",
+            "detail": "high",
+        },
+    }
+
+
+def _text_part(page_no: int, texto: str) -> dict:
+    return {"type": "text", "text": f"--- Page {page_no} (text layer) ---\n{texto}"}
+
+
+def _text_page_parts(page, page_no: int, texto: str) -> list[dict]:
+    """Text layer of a digital page plus its signature area, which only
+    needs a low-detail image."""
+    firma = _image_part(enrutador_paginas.renderizar_zona_firma(page))
+    firma["image_url"]["detail"] = "low"
+    return [_text_part(page_no, texto), firma]
+
+
+def extraer_datos_hoja(pdf_path, api_key: str, usar_cache: bool = True) -> dict:
+    """Extract structured data from a hoja de visita PDF using GPT-4o.
+
+    Scanned pages go as images, digitally generated pages as their text
+    layer and a low-detail image of their signature area. Results are cached
+    in llm_cache keyed by the message content; pass ``usar_cache=False`` to
+    force a fresh call.
+    """
+    parts = []
+    with _open_document(pdf_path) as doc:
+        for page in doc:
+            ruta = enrutador_paginas.clasificar_pagina(page)
+            if ruta["ruta"] == enrutador_paginas.IMAGEN:
+                parts.append(_image_part(enrutador_paginas.renderizar_pagina(page)))
+            elif ruta["ruta"] == enrutador_paginas.TEXTO:
+                parts.extend(_text_page_parts(page, ruta["pagina"], ruta["texto"]))
+
+    if not parts:
+        raise RuntimeError("No se pudieron extraer paginas del PDF.")
+
+    # Build the user message with images and/or text layers
+    intro = "Extract the data from this property visit report (hoja de visita):"
+    if any(p["type"] == "text" for p in parts):
+        intro += " " + _TEXT_LAYER_NOTE
+    content = [{"type": "text", "text": intro}] + parts
+
+    request = _hoja_request(content)
+
+    def call() -> dict:
+        client = get_client(api_key, "vision")
+        with metrics.cronometro("modelia_llm_llamada_segundos",
+                                modelo=request["model"], tipo="hoja"):
+            response = client.chat.completions.create(**request)
+        budget_ledger.ledger.registrar(response, request["model"])
+
+        message = response.choices[0].message
+        if message.tool_calls:
+            for tool_call in message.tool_calls:
+                if tool_call.function.name == "extract_hoja_visita":
+                    return json.loads(tool_call.function.arguments)
+
+        raise RuntimeError("GPT-4o did not return a function call for hoja extraction.")
+
+    return llm_cache.cache.obtener_o_calcular(
+        "hoja", llm_cache.clave(request["model"], request), call,
+        bypass=not usar_cache,
+    )
 
 
 # ── Verification ────────────────────────────────────────────────────────────
@@ -362,45 +437,39 @@ def verificar_hoja(extracted: dict, expected: dict) -> dict:
     }
 
 
-def extraer_datos_hoja_por_pagina(pdf_path: Path, api_key: str) -> list[dict]:
-    """Extract visit data from each page of a multi-page PDF independently.
+def _extraer_pagina(client: OpenAI, img_b64: str, usar_cache: bool = True) -> dict | None:
+    """One GPT-4o vision call for a single page. None if the page has no visit data.
 
-    Returns a list of extraction dicts, one per page that contains visit data.
-    Pages that don't appear to contain visit data are skipped.
+    Cached per page image, so re-sending a batch only pays for new pages.
     """
-    images_b64 = pdf_to_base64_images(pdf_path)
-    if not images_b64:
-        raise RuntimeError("No se pudieron extraer paginas del PDF.")
+    content = [
+        {"type": "text", "text": "Extract the data from this property visit report page:"},
+        _image_part(img_b64),
+    ]
+    return _extraer_contenido(client, content, usar_cache)
 
-    client = OpenAI(api_key=api_key)
-    extractions = []
-
-    for i, img_b64 in enumerate(images_b64):
-        content = [
-            {"type": "text", "text": "Extract the data from this property visit report page:"},
-            {
-                "type": "image_url",
-                "image_url": {
-                    "url": f"data:image/png;base64,{img_b64}",
-                    "detail": "high",
-                },
-            },
-        ]
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            temperature=0,
-            max_tokens=2048,
-            messages=[
-                {"role": "system", "content": SYSTEM_HOJA},
-                {"role": "user", "content": content},
-            ],
-            tools=[EXTRACT_HOJA],
-            tool_choice={
-                "type": "function",
-                "function": {"name": "extract_hoja_visita"},
-            },
-        )
+
+def _extraer_pagina_texto(client: OpenAI, parts: list[dict],
+                          usar_cache: bool = True) -> dict | None:
+    """Like ``_extraer_pagina`` for a digitally generated page: sends the
+    ``_text_page_parts`` of the page instead of a full-page image."""
+    content = [
+        {"type": "text", "text": "Extract the data from this property visit report page: "
+                                 + _TEXT_LAYER_NOTE},
+        *parts,
+    ]
+    return _extraer_contenido(client, content, usar_cache)
+
+
+def _extraer_contenido(client: OpenAI, content: list, usar_cache: bool) -> dict | None:
+    """Shared single-page call for ``_extraer_pagina`` and ``_extraer_pagina_texto``."""
+    request = _hoja_request(content)
+
+    def call() -> dict | None:
+        with metrics.cronometro("modelia_llm_llamada_segundos",
+                                modelo=request["model"], tipo="hoja_pagina"):
+            response = client.chat.completions.create(**request)
+        budget_ledger.ledger.registrar(response, request["model"])
 
         message = response.choices[0].message
         if message.tool_calls:
@@ -412,10 +481,77 @@ def extraer_datos_hoja_por_pagina(pdf_path: Path, api_key: str) -> list[dict]:
                         data.get(k)
                         for k in ("agent_name", "property_ref", "client_name")
                     )
-                    if has_data:
-                        data["_page"] = i + 1
-                        extractions.append(data)
+                    return data if has_data else None
+        return None
+
+    return llm_cache.cache.obtener_o_calcular(
+        "hoja_pagina", llm_cache.clave(request["model"], request), call,
+        bypass=not usar_cache,
+    )
+
+
+def extraer_datos_hoja_por_pagina(pdf_path, api_key: str,
+                                  max_workers: int | None = None,
+                                  failed_pages: list | None = None,
+                                  usar_cache: bool = True) -> list[dict]:
+    """Extract visit data from each page of a multi-page PDF independently.
+
+    Pages are sent to GPT-4o concurrently (at most ``max_workers`` requests
+    in flight, default HOJA_CONCURRENCY); each page is submitted as soon as
+    it is classified (see enrutador_paginas): scanned pages are rendered and
+    go to vision, digital pages go as text plus their signature area, blank
+    pages are not sent.
+    Results keep page order.
+
+    A page whose request fails is skipped and, if ``failed_pages`` is given,
+    recorded there as {"page", "error"}; the batch only fails if every page
+    does. Per-page results are cached (see ``_extraer_pagina``) unless
+    ``usar_cache`` is False.
 
+    Returns a list of extraction dicts, one per page that contains visit data.
+    Pages that don't appear to contain visit data are skipped.
+    """
+    client = get_client(api_key, "vision")
+    workers = max(1, max_workers or HOJA_CONCURRENCY)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hoja") as pool:
+        futures = []
+        with _open_document(pdf_path) as doc:
+            for page in doc:
+                ruta = enrutador_paginas.clasificar_pagina(page)
+                if ruta["ruta"] == enrutador_paginas.IMAGEN:
+                    future = profiler.encolar(pool, _extraer_pagina, client,
+                                              enrutador_paginas.renderizar_pagina(page), usar_cache)
+                elif ruta["ruta"] == enrutador_paginas.TEXTO:
+                    parts = _text_page_parts(page, ruta["pagina"], ruta["texto"])
+                    future = profiler.encolar(pool, _extraer_pagina_texto, client,
+                                              parts, usar_cache)
+                else:
+                    continue
+                futures.append((ruta["pagina"], ruta["ruta"], future))
+        if not futures:
+            raise RuntimeError("No se pudieron extraer paginas del PDF.")
+        routed = sum(route == enrutador_paginas.TEXTO for _, route, _ in futures)
+        log.info(f"[HOJA] {routed}/{len(futures)} pages sent as text, the rest to vision")
+
+        extractions = []
+        errors = []
+        for page_no, route, future in futures:
+            try:
+                data = future.result()
+            except Exception as exc:
+                log.warning(f"[HOJA] Page {page_no} failed: {type(exc).__name__}: {exc}")
+                errors.append((page_no, exc))
+                continue
+            if data is not None:
+                data["_page"] = page_no
+                data["_route"] = route
+                extractions.append(data)
+
+    if errors and len(errors) == len(futures):
+        raise errors[0][1]
+    if failed_pages is not None:
+        failed_pages.extend({"page": page, "error": str(exc)} for page, exc in errors)
     return extractions
 
 
@@ -435,9 +571,6 @@ def emparejar_hojas(extractions: list[dict], checks: list[dict]) -> dict:
     Returns:
         dict mapping check_id -> {match, score, fields, extracted, page} or None
     """
-    import logging
-    log = logging.getLogger("hoja_extractor")
-
     # Build a score matrix: (check_idx, extraction_idx) -> verification result
     score_matrix = []
     for ci, check in enumerate(checks):
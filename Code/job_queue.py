@@ -0,0 +1,246 @@
+"""
+job_queue.py
+Cola de trabajos en segundo plano para los pipelines largos (/process).
+
+Un pool de hilos por proceso ejecuta los trabajos y una tabla SQLite
+compartida guarda su estado, así que cualquier worker de gunicorn puede
+responder a /jobs/<id> aunque el trabajo corra en otro. El pipeline es
+casi todo espera de red (OpenAI), por eso bastan hilos.
+
+Estados: queued → running → done | error
+
+Tabla jobs:
+    id, owner, kind, status, etapa, created, started, finished,
+    result (JSON), error, http_status, pid
+
+Un trabajo sin terminar cuyo proceso murió (reinicio de gunicorn) se da
+por interrumpido al leerlo; la base es un fichero local, así que todos los
+pids que guarda son de esta máquina. Uno vivo solo se corta si lleva más
+de JOB_TIMEOUT_SECONDS corriendo (desde que empezó, no desde que se
+encoló) o, en cola, más de _ESPERA_COLA veces ese tiempo.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import metrics
+import profiler
+
+log = logging.getLogger("job_queue")
+
+MODELIA_DIR = Path(__file__).resolve().parent.parent
+
+JOB_DB          = Path(os.environ.get("JOB_DB", MODELIA_DIR / "Output" / "jobs.sqlite3"))
+JOB_WORKERS     = int(os.environ.get("JOB_WORKERS", 4))
+JOB_TTL         = int(os.environ.get("JOB_TTL_SECONDS", 24 * 3600))
+JOB_TIMEOUT     = int(os.environ.get("JOB_TIMEOUT_SECONDS", 15 * 60))
+
+_PURGE_INTERVAL = 300     # s entre purgas de trabajos caducados por proceso
+_ESPERA_COLA    = 4       # × JOB_TIMEOUT en cola con el proceso vivo (pid reutilizado)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    owner       TEXT,
+    kind        TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    etapa       TEXT,
+    created     REAL NOT NULL,
+    started     REAL,
+    finished    REAL,
+    result      TEXT,
+    error       TEXT,
+    http_status INTEGER,
+    pid         INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created);
+"""
+
+
+class JobError(Exception):
+    """Error esperado del pipeline: se muestra tal cual al usuario."""
+
+    def __init__(self, mensaje: str, http_status: int = 400):
+        super().__init__(mensaje)
+        self.http_status = http_status
+
+
+class Job:
+    """Asa que recibe la función del trabajo: su id y el aviso de etapa."""
+
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self.id = job_id
+        self._queue = queue
+
+    def etapa(self, texto: str) -> None:
+        """Actualiza la etapa visible en /jobs/<id> (informativa)."""
+        try:
+            self._queue._update(self.id, etapa=texto)
+        except sqlite3.Error:
+            pass
+
+
+class JobQueue:
+    def __init__(self, db_path: Path, workers: int = JOB_WORKERS,
+                 ttl: int = JOB_TTL, timeout: int = JOB_TIMEOUT):
+        self.db_path = Path(db_path)
+        self.workers = workers
+        self.ttl     = ttl
+        self.timeout = timeout
+        self._lock   = threading.Lock()
+        self._pool   = None
+        self._pool_pid = None
+        self._schema_ok = False
+        self._last_purge = 0.0
+
+    # ── SQLite ───────────────────────────────────────────────────────────────
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ok:
+                conn.executescript(_SCHEMA)
+                self._schema_ok = True
+            yield conn
+        finally:
+            conn.close()
+
+    def _update(self, job_id: str, **campos) -> None:
+        asignaciones = ", ".join(f"{k} = ?" for k in campos)
+        with self._conn() as conn:
+            conn.execute(f"UPDATE jobs SET {asignaciones} WHERE id = ?",
+                         (*campos.values(), job_id))
+
+    # ── Pool (perezoso y por proceso: sobrevive al fork de gunicorn) ─────────
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix="job")
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    # ── API ──────────────────────────────────────────────────────────────────
+
+    def submit(self, kind: str, fn, *args, owner: str | None = None) -> str:
+        """
+        Encola fn(job, *args) y devuelve el job_id (también en job.id).
+        El valor devuelto por fn (serializable a JSON) queda como resultado
+        del trabajo; JobError se guarda como error visible al usuario.
+        """
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        job_id = uuid.uuid4().hex
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, owner, kind, status, created, pid) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, owner, kind, time.time(), os.getpid()),
+            )
+        # El trabajo hereda el contexto de la petición (p. ej. a quién se
+        # atribuye el gasto en budget_ledger)
+        profiler.encolar(self._executor(), self._run, job_id, fn, args)
+        self.maybe_purge()
+        return job_id
+
+    def get(self, job_id: str, owner: str | None = None) -> dict | None:
+        """Estado del trabajo, o None si no existe o es de otro usuario."""
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        if row["owner"] is not None and row["owner"] != owner:
+            return None
+
+        job = {
+            "job_id":   row["id"],
+            "kind":     row["kind"],
+            "status":   row["status"],
+            "etapa":    row["etapa"],
+            "created":  row["created"],
+            "started":  row["started"],
+            "finished": row["finished"],
+        }
+        if row["status"] in ("queued", "running") and self._interrumpido(row):
+            job.update(status="error", error="El trabajo se interrumpió. Vuelve a intentarlo.",
+                       http_status=500)
+        elif row["status"] == "done":
+            job["result"] = json.loads(row["result"])
+        elif row["status"] == "error":
+            job["error"] = row["error"]
+            job["http_status"] = row["http_status"]
+        return job
+
+    def _interrumpido(self, row) -> bool:
+        """
+        True si el trabajo sin terminar ya no va a terminar: su proceso no
+        existe, lleva más de `timeout` corriendo o, en cola, más de
+        _ESPERA_COLA × `timeout` (el pool está ocupado, no perdido).
+        """
+        if not _proceso_vivo(row["pid"]):
+            return True
+        now = time.time()
+        if row["status"] == "running":
+            return now - (row["started"] or row["created"]) > self.timeout
+        return now - row["created"] > self.timeout * _ESPERA_COLA
+
+    # ── Ejecución ────────────────────────────────────────────────────────────
+
+    def _run(self, job_id: str, fn, args: tuple) -> None:
+        self._update(job_id, status="running", started=time.time(), pid=os.getpid())
+        try:
+            resultado = fn(Job(self, job_id), *args)
+        except JobError as exc:
+            self._update(job_id, status="error", finished=time.time(),
+                         error=str(exc), http_status=exc.http_status)
+            return
+        except Exception as exc:
+            log.exception(f"[JOBS] {job_id} falló")
+            metrics.incrementar("modelia_errores_total", etapa="job")
+            self._update(job_id, status="error", finished=time.time(),
+                         error=str(exc), http_status=500)
+            return
+        self._update(job_id, status="done", finished=time.time(),
+                     result=json.dumps(resultado, ensure_ascii=False))
+        log.info(f"[JOBS] {job_id} completado")
+
+    # ── Purga ────────────────────────────────────────────────────────────────
+
+    def maybe_purge(self) -> None:
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < _PURGE_INTERVAL:
+                return
+            self._last_purge = now
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM jobs WHERE created < ?", (now - self.ttl,))
+        except sqlite3.Error as exc:
+            log.warning(f"[JOBS] purga fallida: {exc}")
+
+
+def _proceso_vivo(pid: int | None) -> bool:
+    if not pid:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass                # existe, pero de otro usuario
+    return True
+
+
+queue = JobQueue(JOB_DB)
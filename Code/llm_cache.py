@@ -0,0 +1,199 @@
+"""
+llm_cache.py
+Caché persistente de resultados de extracción con LLM, direccionada por
+contenido.
+
+La clave es el SHA-256 de todo lo que determina la respuesta: modelo,
+parámetros, prompt de sistema, schema de la herramienta y contenido del
+usuario (texto extraído o imagen de la página). Cambiar el prompt o el
+schema cambia la clave, así que no hace falta versionarlos a mano.
+
+Una escritura re-subida (descarga fallida, /comprobacion repetida con un
+600 corregido...) devuelve el resultado en milisegundos en lugar de pagar
+otra llamada a GPT-4o.
+
+Almacenamiento: SQLite (WAL) compartido entre workers de gunicorn.
+    entradas(clave, tipo, valor JSON, size, created, last_access, hits)
+    contadores(tipo, hits, misses)
+Desalojo: LRU por last_access cuando el total supera LLM_CACHE_MAX_BYTES.
+
+Un fallo de la caché nunca rompe la extracción: se registra y se llama
+al LLM como si no existiera.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import metrics
+
+log = logging.getLogger("llm_cache")
+
+MODELIA_DIR = Path(__file__).resolve().parent.parent
+
+LLM_CACHE_DB        = Path(os.environ.get("LLM_CACHE_DB", MODELIA_DIR / "Output" / "llm_cache.sqlite3"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+LLM_CACHE_ENABLED   = os.environ.get("LLM_CACHE_DISABLED", "").strip().lower() not in ("1", "true", "yes")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entradas (
+    clave       TEXT PRIMARY KEY,
+    tipo        TEXT NOT NULL,
+    valor       TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    created     REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entradas_lru ON entradas (last_access);
+CREATE TABLE IF NOT EXISTS contadores (
+    tipo   TEXT PRIMARY KEY,
+    hits   INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def clave(modelo: str, *partes) -> str:
+    """
+    SHA-256 de modelo + partes (prompts, schemas, parámetros, contenido).
+    Los dicts se serializan con claves ordenadas para que la clave sea estable.
+    """
+    h = hashlib.sha256(modelo.encode("utf-8"))
+    for parte in partes:
+        if not isinstance(parte, (str, bytes)):
+            parte = json.dumps(parte, sort_keys=True, ensure_ascii=False)
+        if isinstance(parte, str):
+            parte = parte.encode("utf-8")
+        h.update(len(parte).to_bytes(8, "big"))     # separa las partes sin ambigüedad
+        h.update(parte)
+    return h.hexdigest()
+
+
+class LLMCache:
+    def __init__(self, db_path: Path, max_bytes: int = LLM_CACHE_MAX_BYTES,
+                 enabled: bool = LLM_CACHE_ENABLED):
+        self.db_path   = Path(db_path)
+        self.max_bytes = max_bytes
+        self.enabled   = enabled
+        self._schema_ok = False
+
+    @contextmanager
+    def _conn(self):
+        if not self._schema_ok:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ok:
+                conn.executescript(_SCHEMA)
+                self._schema_ok = True
+            yield conn
+        finally:
+            conn.close()
+
+    # ── API ──────────────────────────────────────────────────────────────────
+
+    def obtener_o_calcular(self, tipo: str, clave_: str, calcular, bypass: bool = False):
+        """
+        Devuelve el valor cacheado para `clave_` o lo calcula con calcular()
+        y lo guarda. Con bypass=True no se lee la caché pero el resultado
+        nuevo sí se guarda (refresca la entrada).
+        """
+        if not self.enabled:
+            return calcular()
+
+        if not bypass:
+            try:
+                encontrado, valor = self._leer(tipo, clave_)
+            except (sqlite3.Error, ValueError) as exc:
+                log.warning(f"[LLM-CACHE] lectura fallida ({exc}); se llama al LLM")
+                return calcular()
+            if encontrado:
+                log.info(f"[LLM-CACHE] hit {tipo} {clave_[:12]}")
+                metrics.incrementar("modelia_llm_cache_total", tipo=tipo, resultado="hit")
+                return valor
+            metrics.incrementar("modelia_llm_cache_total", tipo=tipo, resultado="miss")
+
+        valor = calcular()
+        try:
+            self._guardar(tipo, clave_, valor, miss=not bypass)
+        except (sqlite3.Error, TypeError, ValueError) as exc:
+            log.warning(f"[LLM-CACHE] escritura fallida ({exc})")
+        return valor
+
+    def estadisticas(self) -> dict:
+        """Contadores hit/miss por tipo, nº de entradas y tamaño total."""
+        with self._conn() as conn:
+            contadores = {
+                tipo: {"hits": hits, "misses": misses}
+                for tipo, hits, misses in conn.execute("SELECT tipo, hits, misses FROM contadores")
+            }
+            n, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entradas").fetchone()
+        return {"entradas": n, "bytes": total, "max_bytes": self.max_bytes,
+                "contadores": contadores}
+
+    def vaciar(self) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM entradas")
+
+    # ── Internos ─────────────────────────────────────────────────────────────
+
+    def _leer(self, tipo: str, clave_: str):
+        with self._conn() as conn:
+            row = conn.execute("SELECT valor FROM entradas WHERE clave = ?", (clave_,)).fetchone()
+            if row is None:
+                return False, None
+            conn.execute(
+                "UPDATE entradas SET last_access = ?, hits = hits + 1 WHERE clave = ?",
+                (time.time(), clave_),
+            )
+            self._contar(conn, tipo, "hits")
+        return True, json.loads(row[0])
+
+    def _guardar(self, tipo: str, clave_: str, valor, miss: bool) -> None:
+        texto = json.dumps(valor, ensure_ascii=False)
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entradas (clave, tipo, valor, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (clave_, tipo, texto, len(texto.encode("utf-8")), now, now),
+            )
+            if miss:
+                self._contar(conn, tipo, "misses")
+            self._desalojar(conn)
+
+    @staticmethod
+    def _contar(conn, tipo: str, campo: str) -> None:
+        conn.execute(
+            f"INSERT INTO contadores (tipo, {campo}) VALUES (?, 1) "
+            f"ON CONFLICT(tipo) DO UPDATE SET {campo} = {campo} + 1",
+            (tipo,),
+        )
+
+    def _desalojar(self, conn) -> None:
+        """LRU: borra las entradas menos usadas hasta quedar al 90 % del tope."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entradas").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        objetivo = int(self.max_bytes * 0.9)
+        borrados = 0
+        for clave_, size in conn.execute(
+            "SELECT clave, size FROM entradas ORDER BY last_access"
+        ).fetchall():
+            if total <= objetivo:
+                break
+            conn.execute("DELETE FROM entradas WHERE clave = ?", (clave_,))
+            total -= size
+            borrados += 1
+        log.info(f"[LLM-CACHE] desalojadas {borrados} entradas (LRU)")
+
+
+cache = LLMCache(LLM_CACHE_DB)
@@ -5,7 +5,12 @@ Usa function calling para obtener un JSON estructurado sin alucinaciones.
 """
 
 import json
-from openai import OpenAI
+
+import budget_ledger
+import llm_cache
+import metrics
+import texto_relevante
+from openai_clients import get_client
 
 
 # ── Helpers de schema ─────────────────────────────────────────────────────────
@@ -276,13 +281,19 @@ Instrucciones:
 
 # ── Función principal ─────────────────────────────────────────────────────────
 
-def extraer_campos_llm(texto: str, api_key: str) -> dict:
+def extraer_campos_llm(texto: str, api_key: str, usar_cache: bool = True,
+                       poda_info: dict | None = None) -> dict:
     """
     Extrae los campos del Modelo 211 del texto usando GPT-5 (OpenAI) con function calling.
+    Solo se envían las páginas con datos (texto_relevante.podar). El
+    resultado se guarda en llm_cache: el mismo texto no se vuelve a enviar.
 
     Args:
-        texto:   Texto extraído del PDF notarial.
-        api_key: API key de OpenAI.
+        texto:      Texto extraído del PDF notarial.
+        api_key:    API key de OpenAI.
+        usar_cache: False para ignorar la entrada cacheada y refrescarla.
+        poda_info:  Si se pasa un dict, se rellena con el informe de la
+                    poda (páginas enviadas, tokens ahorrados).
 
     Returns:
         Dict con estructura pagina_010 / pagina_020 / pagina_030.
@@ -290,24 +301,37 @@ def extraer_campos_llm(texto: str, api_key: str) -> dict:
     Raises:
         RuntimeError: Si el modelo no devuelve un function call válido.
     """
-    client = OpenAI(api_key=api_key)
-
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        temperature=0,
-        max_tokens=8192,
-        messages=[
+    texto, informe = texto_relevante.podar(texto, "modelo211")
+    if poda_info is not None:
+        poda_info.update(informe)
+    peticion = {
+        "model": "gpt-4o",
+        "temperature": 0,
+        "max_tokens": 8192,
+        "messages": [
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": f"Extrae los datos del siguiente documento notarial:\n\n{texto}"},
         ],
-        tools=[EXTRACT_FUNCTION],
-        tool_choice={"type": "function", "function": {"name": "extract_modelo211"}},
-    )
+        "tools": [EXTRACT_FUNCTION],
+        "tool_choice": {"type": "function", "function": {"name": "extract_modelo211"}},
+    }
 
-    message = response.choices[0].message
-    if message.tool_calls:
-        for tool_call in message.tool_calls:
-            if tool_call.function.name == "extract_modelo211":
-                return json.loads(tool_call.function.arguments)
+    def llamar() -> dict:
+        client = get_client(api_key, "extraccion")
+        with metrics.cronometro("modelia_llm_llamada_segundos",
+                                modelo=peticion["model"], tipo="modelo211"):
+            response = client.chat.completions.create(**peticion)
+        budget_ledger.ledger.registrar(response, peticion["model"])
 
-    raise RuntimeError("El modelo no devolvió ningún function call.")
+        message = response.choices[0].message
+        if message.tool_calls:
+            for tool_call in message.tool_calls:
+                if tool_call.function.name == "extract_modelo211":
+                    return json.loads(tool_call.function.arguments)
+
+        raise RuntimeError("El modelo no devolvió ningún function call.")
+
+    return llm_cache.cache.obtener_o_calcular(
+        "modelo211", llm_cache.clave(peticion["model"], peticion), llamar,
+        bypass=not usar_cache,
+    )
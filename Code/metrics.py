@@ -0,0 +1,281 @@
+"""
+metrics.py
+Métricas de latencia y contadores en formato de texto de Prometheus.
+
+Registro propio y sin dependencias: histogramas y contadores con
+etiquetas, en memoria y protegidos por un lock, así que observar cuesta
+unos microsegundos.
+
+Con varios workers de gunicorn cada proceso lleva su registro. Una vez
+que la app llama a activar_compartido(), un hilo vuelca la instantánea
+del proceso a una tabla SQLite cada METRICS_FLUSH_SECONDS, y /metrics
+suma las de todos los procesos vivos. La instantánea de un worker muerto
+se descarta pasado METRICS_TTL_SECONDS; para Prometheus eso es un reset
+de contador, que rate() ya sabe tratar. Sin activar (CLI, scripts) solo
+hay registro local.
+
+Uso:
+    with metrics.cronometro("modelia_llm_llamada_segundos", modelo="gpt-4o", tipo="hoja"):
+        ...
+    metrics.incrementar("modelia_errores_total", etapa="job")
+"""
+
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+log = logging.getLogger("metrics")
+
+MODELIA_DIR = Path(__file__).resolve().parent.parent
+
+METRICS_DB    = Path(os.environ.get("METRICS_DB", MODELIA_DIR / "Output" / "metrics.sqlite3"))
+METRICS_FLUSH = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+METRICS_TTL   = float(os.environ.get("METRICS_TTL_SECONDS", 3600))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "").strip()
+
+# Segundos: de lecturas de SQLite a extracciones de 8192 tokens
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HISTOGRAMAS = {
+    "modelia_http_peticion_segundos":  "Latencia de cada petición HTTP por ruta",
+    "modelia_pdf_extraccion_segundos": "Extracción de texto de un PDF completo",
+    "modelia_pdf_pagina_segundos":     "Extracción de texto de una página por motor",
+    "modelia_render_pagina_segundos":  "Renderizado de una página PDF a PNG",
+    "modelia_llm_llamada_segundos":    "Llamada a chat.completions (incluye stream completo)",
+    "modelia_normalizacion_segundos":  "normalizar_datos sobre la salida del LLM",
+    "modelia_generacion_segundos":     "Generación del 211 en memoria",
+    "modelia_supabase_segundos":       "Llamadas a Supabase por operación",
+    "modelia_chatbot_tool_segundos":   "Ejecución de herramientas del chatbot",
+}
+CONTADORES = {
+    "modelia_llm_tokens_total":            "Tokens facturados por modelo y clase",
+    "modelia_llm_cache_total":             "Consultas a llm_cache por tipo y resultado",
+    "modelia_llm_tokens_podados_total":    "Tokens de prompt ahorrados (estimados) por la poda de páginas",
+    "modelia_pdf_respaldo_total":          "Páginas reintentadas con el motor de respaldo, por motivo",
+    "modelia_paginas_ruta_total":          "Páginas clasificadas por ruta (texto, imagen, vacia)",
+    "modelia_rate_limit_rechazos_total":   "Peticiones rechazadas por el rate limiter",
+    "modelia_presupuesto_rechazos_total":  "Peticiones rechazadas por el presupuesto diario",
+    "modelia_errores_total":               "Errores por etapa",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    pid      INTEGER PRIMARY KEY,
+    snapshot TEXT NOT NULL,
+    updated  REAL NOT NULL
+);
+"""
+
+_lock = threading.Lock()
+_contadores: dict = {}      # (nombre, etiquetas) -> valor
+_histos: dict = {}          # (nombre, etiquetas) -> [cuentas por bucket..., +Inf, suma]
+_pid = os.getpid()
+
+_compartido = False
+_flusher_pid = None
+
+
+def _etiquetas(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _comprobar_fork() -> None:
+    """
+    Tras un fork el hijo no hereda las cuentas del padre y arranca su
+    propio volcado (gunicorn --preload importa la app antes del fork).
+    """
+    global _pid
+    if _pid != os.getpid():
+        _contadores.clear()
+        _histos.clear()
+        _pid = os.getpid()
+        _asegurar_flusher()
+
+
+# ── Registro ──────────────────────────────────────────────────────────────────
+
+def incrementar(nombre: str, valor: float = 1, **labels) -> None:
+    clave = (nombre, _etiquetas(labels))
+    with _lock:
+        _comprobar_fork()
+        _contadores[clave] = _contadores.get(clave, 0) + valor
+
+
+def observar(nombre: str, segundos: float, **labels) -> None:
+    clave = (nombre, _etiquetas(labels))
+    with _lock:
+        _comprobar_fork()
+        cuentas = _histos.get(clave)
+        if cuentas is None:
+            cuentas = _histos[clave] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, limite in enumerate(BUCKETS):
+            if segundos <= limite:
+                cuentas[i] += 1
+                break
+        else:
+            cuentas[len(BUCKETS)] += 1
+        cuentas[-1] += segundos
+
+
+@contextmanager
+def cronometro(nombre: str, **labels):
+    """
+    Observa la duración del bloque en el histograma `nombre`. Si el bloque
+    lanza, también cuenta un error con etapa = nombre sin prefijo/sufijo.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    except BaseException as exc:
+        if not isinstance(exc, GeneratorExit):
+            etapa = nombre.removeprefix("modelia_").removesuffix("_segundos")
+            incrementar("modelia_errores_total", etapa=etapa)
+        raise
+    finally:
+        observar(nombre, time.perf_counter() - inicio, **labels)
+
+
+def cronometrado(nombre: str, **labels):
+    """Decorador equivalente a envolver la función en cronometro()."""
+    def decorador(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with cronometro(nombre, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorador
+
+
+# ── Instantáneas compartidas entre workers ────────────────────────────────────
+
+def _instantanea() -> dict:
+    with _lock:
+        _comprobar_fork()
+        return {
+            "c": [[n, list(map(list, e)), v] for (n, e), v in _contadores.items()],
+            "h": [[n, list(map(list, e)), list(c)] for (n, e), c in _histos.items()],
+        }
+
+
+def _conectar() -> sqlite3.Connection:
+    METRICS_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(METRICS_DB, timeout=5, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def volcar() -> None:
+    """Guarda la instantánea de este proceso en la tabla compartida."""
+    conn = _conectar()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO snapshots (pid, snapshot, updated) VALUES (?, ?, ?)",
+            (os.getpid(), json.dumps(_instantanea()), time.time()),
+        )
+        conn.execute("DELETE FROM snapshots WHERE updated < ?", (time.time() - METRICS_TTL,))
+    finally:
+        conn.close()
+
+
+def _bucle_volcado() -> None:
+    while True:
+        time.sleep(METRICS_FLUSH)
+        try:
+            volcar()
+        except sqlite3.Error as exc:
+            log.warning(f"[METRICS] volcado fallido: {exc}")
+
+
+def activar_compartido() -> None:
+    """Agrega las métricas de todos los workers (llamar al arrancar la app)."""
+    global _compartido
+    _compartido = True
+    _asegurar_flusher()
+
+
+def _asegurar_flusher() -> None:
+    global _flusher_pid
+    if _compartido and _flusher_pid != os.getpid():
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_bucle_volcado, name="metrics-flush", daemon=True).start()
+
+
+def _combinar() -> tuple[dict, dict]:
+    """Suma las instantáneas de todos los procesos (o solo la local)."""
+    if not _compartido:
+        snaps = [_instantanea()]
+    else:
+        _asegurar_flusher()
+        try:
+            volcar()
+            conn = _conectar()
+            try:
+                snaps = [json.loads(s) for (s,) in conn.execute(
+                    "SELECT snapshot FROM snapshots WHERE updated >= ?",
+                    (time.time() - METRICS_TTL,),
+                )]
+            finally:
+                conn.close()
+        except sqlite3.Error as exc:
+            log.warning(f"[METRICS] lectura compartida fallida ({exc}); solo este proceso")
+            snaps = [_instantanea()]
+
+    contadores, histos = {}, {}
+    for snap in snaps:
+        for n, e, v in snap["c"]:
+            clave = (n, tuple(map(tuple, e)))
+            contadores[clave] = contadores.get(clave, 0) + v
+        for n, e, c in snap["h"]:
+            clave = (n, tuple(map(tuple, e)))
+            actual = histos.setdefault(clave, [0] * len(c))
+            histos[clave] = [a + b for a, b in zip(actual, c)]
+    return contadores, histos
+
+
+# ── Exposición ────────────────────────────────────────────────────────────────
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_etiquetas(etiquetas, extra: tuple = ()) -> str:
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _fmt_num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def exponer() -> str:
+    """Texto de exposición de Prometheus (version 0.0.4)."""
+    contadores, histos = _combinar()
+    lineas = []
+    for nombre, ayuda in CONTADORES.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} counter"]
+        for (n, e), v in sorted(contadores.items()):
+            if n == nombre:
+                lineas.append(f"{nombre}{_fmt_etiquetas(e)} {_fmt_num(v)}")
+    for nombre, ayuda in HISTOGRAMAS.items():
+        lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+        for (n, e), c in sorted(histos.items()):
+            if n != nombre:
+                continue
+            acumulado = 0
+            for limite, cuenta in zip(BUCKETS + ("+Inf",), c[:-1]):
+                acumulado += cuenta
+                le = limite if isinstance(limite, str) else _fmt_num(limite)
+                lineas.append(f"{nombre}_bucket{_fmt_etiquetas(e, (('le', le),))} {acumulado}")
+            lineas.append(f"{nombre}_sum{_fmt_etiquetas(e)} {_fmt_num(c[-1])}")
+            lineas.append(f"{nombre}_count{_fmt_etiquetas(e)} {acumulado}")
+    return "\n".join(lineas) + "\n"
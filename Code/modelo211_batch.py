@@ -0,0 +1,173 @@
+"""
+modelo211_batch.py
+Generación por lotes del Modelo 211 (campañas de cierre de año).
+
+Acepta un directorio de JSON normalizados, un fichero JSONL (una
+declaración por línea) o una lista de dicts, y reparte la generación en
+un pool de procesos. Cada declaración se escribe como
+211_<protocolo>_<NIF>.txt y el lote termina con un único
+resumen_lote.json.
+"""
+
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from modelo211_generator import MODELIA_DIR, generar_registros
+
+
+# ─────────────────────────────────────────────────────────────
+#  ENTRADA: directorio / JSONL / lista de dicts
+# ─────────────────────────────────────────────────────────────
+
+def _iterar_entrada(entrada):
+    """
+    Devuelve lista de (origen, datos_o_ruta).
+
+    Para directorios se pasan rutas: cada worker lee su propio JSON y no
+    hay que serializar los dicts hacia el pool.
+    """
+    if isinstance(entrada, (list, tuple)):
+        return [(f"item_{i + 1}", datos) for i, datos in enumerate(entrada)]
+
+    entrada = Path(entrada)
+    if entrada.is_dir():
+        return [(p.name, p) for p in sorted(entrada.glob("*.json"))]
+
+    items = []
+    with open(entrada, encoding="utf-8") as f:
+        for n_linea, linea in enumerate(f, 1):
+            linea = linea.strip()
+            if linea:
+                items.append((f"{entrada.name}:{n_linea}", linea))
+    return items
+
+
+def _cargar(datos_o_ruta) -> dict:
+    if isinstance(datos_o_ruta, Path):
+        with open(datos_o_ruta, encoding="utf-8") as f:
+            return json.load(f)
+    if isinstance(datos_o_ruta, str):
+        return json.loads(datos_o_ruta)
+    return datos_o_ruta
+
+
+# ─────────────────────────────────────────────────────────────
+#  NOMBRE DE FICHERO POR DECLARACIÓN
+# ─────────────────────────────────────────────────────────────
+
+def _limpiar(s) -> str:
+    return re.sub(r"[^A-Za-z0-9]", "", str(s or ""))
+
+
+def nombre_declaracion(datos: dict) -> str:
+    """211_<protocolo>_<NIF adquirente> (o la parte que esté informada)."""
+    p010 = datos.get("pagina_010") or {}
+    protocolo = _limpiar((p010.get("inmueble") or {}).get("num_protocolo"))
+    nif = _limpiar((p010.get("adquirente") or {}).get("nif"))
+    if protocolo.strip("0") == "":
+        protocolo = ""
+    partes = [p for p in (protocolo, nif) if p]
+    return "211_" + "_".join(partes) if partes else "211_sin_identificar"
+
+
+# ─────────────────────────────────────────────────────────────
+#  WORKER
+# ─────────────────────────────────────────────────────────────
+
+def _procesar(item) -> dict:
+    """Genera una declaración. Nunca lanza: los errores van al resumen."""
+    origen, datos_o_ruta = item
+    try:
+        datos = _cargar(datos_o_ruta)
+        registros, diagnosticos = generar_registros(datos)
+    except Exception as exc:
+        return {"origen": origen, "ok": False, "error": f"{type(exc).__name__}: {exc}"}
+
+    campos_error = [
+        {"pagina": d["pagina"], "num": c["num"], "descripcion": c["descripcion"],
+         "valor_formateado": c["valor_formateado"]}
+        for d in diagnosticos if not d["todos_ok"]
+        for c in d["campos"] if not c["ok"]
+    ]
+    return {
+        "origen":       origen,
+        "ok":           not campos_error,
+        "nombre":       nombre_declaracion(datos),
+        "texto":        "".join(registros),
+        "campos_error": campos_error,
+    }
+
+
+# ─────────────────────────────────────────────────────────────
+#  ORQUESTADOR DE LOTE
+# ─────────────────────────────────────────────────────────────
+
+def generar_lote(entrada, output_path=None, workers: int | None = None) -> dict:
+    """
+    Genera todas las declaraciones de `entrada` en `output_path`.
+
+    Args:
+        entrada     : directorio con *.json, fichero .jsonl o lista de dicts
+        output_path : directorio de salida (por defecto MODELIA/Output/lote_<ts>/)
+        workers     : procesos del pool (None = nº de CPUs, 1 = sin pool)
+
+    Returns:
+        Dict resumen (también guardado como resumen_lote.json).
+    """
+    if output_path is None:
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = MODELIA_DIR / "Output" / f"lote_{ts}"
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    items = _iterar_entrada(entrada)
+    workers = workers or os.cpu_count() or 1
+    inicio = datetime.now()
+
+    if workers == 1 or len(items) <= 1:
+        resultados = map(_procesar, items)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        chunksize = max(1, len(items) // (workers * 4))
+        resultados = pool.map(_procesar, items, chunksize=chunksize)
+
+    declaraciones = []
+    usados = set()
+    try:
+        for res in resultados:
+            texto = res.pop("texto", None)
+            if texto is not None:
+                nombre = res["nombre"]
+                n = 2
+                while nombre in usados:
+                    nombre = f"{res['nombre']}_{n}"
+                    n += 1
+                usados.add(nombre)
+                fichero = output_path / f"{nombre}.txt"
+                with open(fichero, "w", encoding="utf-8") as f:
+                    f.write(texto)
+                res["fichero"] = fichero.name
+            declaraciones.append(res)
+    finally:
+        if workers != 1 and len(items) > 1:
+            pool.shutdown()
+
+    ok = sum(1 for d in declaraciones if d["ok"])
+    resumen = {
+        "entrada":        str(entrada) if not isinstance(entrada, (list, tuple)) else "<lista>",
+        "salida":         str(output_path),
+        "inicio":         inicio.isoformat(timespec="seconds"),
+        "segundos":       round((datetime.now() - inicio).total_seconds(), 3),
+        "workers":        workers,
+        "total":          len(declaraciones),
+        "ok":             ok,
+        "con_errores":    len(declaraciones) - ok,
+        "declaraciones":  declaraciones,
+    }
+    with open(output_path / "resumen_lote.json", "w", encoding="utf-8") as f:
+        json.dump(resumen, f, ensure_ascii=False, indent=2)
+    return resumen
@@ -7,14 +7,22 @@ Genera SIEMPRE los 3 registros (010 + 020 + 030 = 6600 chars).
 """
 
 import csv
+import hashlib
+import io
 import json
+import logging
 import re
+import threading
 from pathlib import Path
+from types import MappingProxyType
+from typing import NamedTuple
 
 # ─────────────────────────────────────────────────────────────
 #  RUTAS Y CONSTANTES
 # ─────────────────────────────────────────────────────────────
 
+log = logging.getLogger("modelo211")
+
 BASE_DIR    = Path(__file__).parent        # MODELIA/Code/
 MODELIA_DIR = BASE_DIR.parent              # MODELIA/
 
@@ -55,17 +63,10 @@ def _detectar_decimales(contenido: str) -> bool:
     return "ent." in contenido.lower()
 
 
-def parse_csv_page(pagina: str) -> list:
-    """
-    Lee el CSV de la página y devuelve lista de field dicts.
-    Salta las 4 filas de cabecera y filtra filas sin Nº numérico.
-    """
-    csv_path = CSV_FILES[pagina]
+def _parse_csv_texto(texto: str) -> list:
+    """Parsea el contenido de un CSV de diseño de registro a field dicts."""
     fields = []
-
-    with open(csv_path, encoding="utf-8-sig", newline="") as f:
-        reader = csv.reader(f, delimiter=";")
-        rows = list(reader)
+    rows = list(csv.reader(io.StringIO(texto, newline=""), delimiter=";"))
 
     for row in rows[4:]:
         while len(row) < 7:
@@ -107,6 +108,135 @@ def parse_csv_page(pagina: str) -> list:
     return fields
 
 
+def parse_csv_page(pagina: str) -> list:
+    """
+    Lee el CSV de la página y devuelve lista de field dicts.
+    Salta las 4 filas de cabecera y filtra filas sin Nº numérico.
+    """
+    return _parse_csv_texto(CSV_FILES[pagina].read_bytes().decode("utf-8-sig"))
+
+
+# ─────────────────────────────────────────────────────────────
+#  PASO 1b: LAYOUTS COMPILADOS (una vez por proceso)
+# ─────────────────────────────────────────────────────────────
+#
+# parse_csv_page relee el CSV y reconstruye cientos de dicts en cada
+# llamada. El generador usa en su lugar un LayoutPagina inmutable por
+# página, compilado la primera vez y reutilizado mientras el checksum
+# del CSV no cambie.
+
+class CampoLayout(NamedTuple):
+    """Campo de un registro con todo lo necesario para formatearlo."""
+    num:             int
+    offset:          int             # posicion - 1 (base 0)
+    longitud:        int
+    tipo:            str             # "An", "A" o "Num"
+    descripcion:     str
+    es_constante:    bool
+    valor_constante: str | None
+    es_decimal:      bool            # ya corregido por RAW_INT_FIELDS
+    es_reservado:    bool
+    es_raw_int:      bool            # coef_part: entero en centésimas
+
+
+class LayoutPagina(NamedTuple):
+    """Diseño de registro compilado de una página (010, 020 o 030)."""
+    pagina:         str
+    checksum:       str                  # sha256 del CSV de origen
+    longitud_total: int
+    campos:         tuple                # tuple[CampoLayout, ...]
+    definiciones:   tuple                # field dicts (solo lectura) de parse_csv_page
+    raw_int_fields: frozenset
+    plantilla:      bytes                # registro en blanco con constantes y tags
+    nums_fijos:     frozenset            # campos ya resueltos en la plantilla
+    variables:      tuple                # CampoLayout que hay que rellenar
+    formateador:    object               # valores -> bytes (ver _compilar_formateador)
+
+
+_layout_lock  = threading.Lock()
+_layout_cache: dict = {}    # pagina -> (stat_key, LayoutPagina)
+
+
+def _compilar_layout(pagina: str, texto: str, checksum: str) -> LayoutPagina:
+    raw_int = frozenset(RAW_INT_FIELDS.get(pagina, ()))
+    definiciones = []
+    campos = []
+    for field in _parse_csv_texto(texto):
+        es_raw_int = (
+            field["num"] in raw_int and field["tipo"] == "Num" and field["es_decimal"]
+        )
+        definiciones.append(MappingProxyType(field))
+        campos.append(CampoLayout(
+            num=field["num"],
+            offset=field["posicion"] - 1,
+            longitud=field["longitud"],
+            tipo=field["tipo"],
+            descripcion=field["descripcion"],
+            es_constante=field["es_constante"],
+            valor_constante=field["valor_constante"],
+            es_decimal=field["es_decimal"] and not es_raw_int,
+            es_reservado=field["es_reservado"],
+            es_raw_int=es_raw_int,
+        ))
+    campos = tuple(campos)
+    longitud_total = TOTAL_LONGITUDES[pagina]
+    plantilla = bytearray(b" " * longitud_total)
+    for campo, field in zip(campos, definiciones):
+        if campo.es_constante:
+            valor = formatear_campo(field, None).encode("ascii", "replace")
+            plantilla[campo.offset:campo.offset + campo.longitud] = valor
+    nums_fijos = frozenset(c.num for c in campos if c.es_constante or c.es_reservado)
+    plantilla  = bytes(plantilla[:longitud_total])
+    variables  = tuple(c for c in campos if c.num not in nums_fijos)
+    return LayoutPagina(
+        pagina=pagina,
+        checksum=checksum,
+        longitud_total=longitud_total,
+        campos=campos,
+        definiciones=tuple(definiciones),
+        raw_int_fields=raw_int,
+        plantilla=plantilla,
+        nums_fijos=nums_fijos,
+        variables=variables,
+        formateador=_compilar_formateador(pagina, plantilla, variables),
+    )
+
+
+def get_layout(pagina: str) -> LayoutPagina:
+    """
+    Devuelve el layout compilado de la página.
+
+    Solo se relee el CSV si cambia su mtime/tamaño, y solo se recompila si
+    además cambia su checksum; en el caso normal es un lookup en memoria.
+    """
+    csv_path = CSV_FILES[pagina]
+    st = csv_path.stat()
+    stat_key = (st.st_mtime_ns, st.st_size)
+
+    cached = _layout_cache.get(pagina)
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+
+    with _layout_lock:
+        cached = _layout_cache.get(pagina)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
+        data = csv_path.read_bytes()
+        checksum = hashlib.sha256(data).hexdigest()
+        if cached is not None and cached[1].checksum == checksum:
+            layout = cached[1]
+        else:
+            layout = _compilar_layout(pagina, data.decode("utf-8-sig"), checksum)
+        _layout_cache[pagina] = (stat_key, layout)
+        return layout
+
+
+def precargar_layouts() -> None:
+    """Compila los layouts de las 3 páginas (p.ej. al arrancar cada worker)."""
+    for pagina in CSV_FILES:
+        get_layout(pagina)
+
+
 # ─────────────────────────────────────────────────────────────
 #  PASO 2: FORMATEADOR DE CAMPOS
 # ─────────────────────────────────────────────────────────────
@@ -336,52 +466,56 @@ def _build_valores_010(datos: dict) -> dict:
 
 # ─── Builders para páginas 020 y 030 ──────────────────────────
 
+# Offsets 0-34 de cada slot de adquirente → ruta dentro del dict del
+# adquirente. Se comparte con modelo211_reader para el camino inverso.
+SLOT_ADQUIRENTE = {
+    0:  ("nif",),
+    1:  ("fj",),
+    2:  ("apellidos_nombre",),
+    3:  ("nif_pais_residencia",),
+    4:  ("tipo_cuota",),                              # C/O
+    5:  ("coef_part_centesimas",),                    # RAW INT (ya en centésimas)
+    6:  ("domicilio_espana", "tipo_via"),
+    7:  ("domicilio_espana", "nombre_via"),
+    8:  ("domicilio_espana", "tipo_numeracion"),
+    9:  ("domicilio_espana", "num_casa"),
+    10: ("domicilio_espana", "calificador"),
+    11: ("domicilio_espana", "bloque"),
+    12: ("domicilio_espana", "portal"),
+    13: ("domicilio_espana", "escalera"),
+    14: ("domicilio_espana", "planta"),
+    15: ("domicilio_espana", "puerta"),
+    16: ("domicilio_espana", "datos_complementarios"),
+    17: ("domicilio_espana", "localidad"),
+    18: ("domicilio_espana", "codigo_postal"),
+    19: ("domicilio_espana", "municipio"),
+    20: ("domicilio_espana", "codigo_ine"),
+    21: ("domicilio_espana", "provincia"),
+    22: ("domicilio_espana", "telefono_fijo"),
+    23: ("domicilio_espana", "telefono_movil"),
+    24: ("domicilio_espana", "fax"),
+    25: ("direccion_extranjero", "domicilio"),
+    26: ("direccion_extranjero", "datos_complementarios"),
+    27: ("direccion_extranjero", "ciudad"),
+    28: ("direccion_extranjero", "email"),
+    29: ("direccion_extranjero", "codigo_postal_zip"),
+    30: ("direccion_extranjero", "provincia_region"),
+    31: ("direccion_extranjero", "codigo_pais"),
+    32: ("direccion_extranjero", "telefono_fijo"),
+    33: ("direccion_extranjero", "telefono_movil"),
+    34: ("direccion_extranjero", "fax"),
+}
+SLOT_BASES_020 = (6, 41, 76)
+
+
 def _slot_adquirente(adq: dict) -> dict:
     """
     Devuelve {offset: value} para un slot de adquirente (35 campos).
     Offsets 0-34 corresponden a los campos 6-40 del slot 1,
     41-75 del slot 2, 76-110 del slot 3.
     """
-    adq     = adq or {}
-    dom_esp = adq.get("domicilio_espana") or {}
-    dir_ext = adq.get("direccion_extranjero") or {}
-    return {
-        0:  adq.get("nif", ""),
-        1:  adq.get("fj", ""),
-        2:  adq.get("apellidos_nombre", ""),
-        3:  adq.get("nif_pais_residencia", ""),
-        4:  adq.get("tipo_cuota", ""),               # C/O
-        5:  adq.get("coef_part_centesimas", 0),       # RAW INT (ya en centésimas)
-        6:  dom_esp.get("tipo_via", ""),
-        7:  dom_esp.get("nombre_via", ""),
-        8:  dom_esp.get("tipo_numeracion", ""),
-        9:  dom_esp.get("num_casa", 0),
-        10: dom_esp.get("calificador", ""),
-        11: dom_esp.get("bloque", ""),
-        12: dom_esp.get("portal", ""),
-        13: dom_esp.get("escalera", ""),
-        14: dom_esp.get("planta", ""),
-        15: dom_esp.get("puerta", ""),
-        16: dom_esp.get("datos_complementarios", ""),
-        17: dom_esp.get("localidad", ""),
-        18: dom_esp.get("codigo_postal", 0),
-        19: dom_esp.get("municipio", ""),
-        20: dom_esp.get("codigo_ine", 0),
-        21: dom_esp.get("provincia", 0),
-        22: dom_esp.get("telefono_fijo", 0),
-        23: dom_esp.get("telefono_movil", 0),
-        24: dom_esp.get("fax", 0),
-        25: dir_ext.get("domicilio", ""),
-        26: dir_ext.get("datos_complementarios", ""),
-        27: dir_ext.get("ciudad", ""),
-        28: dir_ext.get("email", ""),
-        29: dir_ext.get("codigo_postal_zip", ""),
-        30: dir_ext.get("provincia_region", ""),
-        31: dir_ext.get("codigo_pais", ""),
-        32: dir_ext.get("telefono_fijo", ""),
-        33: dir_ext.get("telefono_movil", ""),
-        34: dir_ext.get("fax", ""),
-    }
+    adq = adq or {}
+    return {offset: _get_valor_raw(ruta, adq) for offset, ruta in SLOT_ADQUIRENTE.items()}
 
 
 def _build_valores_020(adquirentes: list) -> dict:
@@ -394,39 +528,42 @@ def _build_valores_020(adquirentes: list) -> dict:
     while len(slots) < 3:
         slots.append(None)
 
-    SLOT_BASES = [6, 41, 76]
     valores = {}
-    for i, base in enumerate(SLOT_BASES):
+    for i, base in enumerate(SLOT_BASES_020):
         for offset, val in _slot_adquirente(slots[i]).items():
             valores[base + offset] = val
     return valores
 
 
+# Offsets 0-15 de cada slot de transmitente → ruta dentro del dict.
+SLOT_TRANSMITENTE = {
+    0:  ("nif",),
+    1:  ("fj",),
+    2:  ("apellidos_nombre",),
+    3:  ("tipo_cuota",),                              # C/O
+    4:  ("coef_part_centesimas",),                    # RAW INT
+    5:  ("nif_pais_residencia",),
+    6:  ("fecha_nacimiento",),
+    7:  ("lugar_nacimiento_ciudad",),
+    8:  ("lugar_nacimiento_codigo_pais",),
+    9:  ("residencia_fiscal_codigo_pais",),
+    10: ("direccion_extranjero", "domicilio"),
+    11: ("direccion_extranjero", "datos_complementarios"),
+    12: ("direccion_extranjero", "ciudad"),
+    13: ("direccion_extranjero", "codigo_postal_zip"),
+    14: ("direccion_extranjero", "provincia_region"),
+    15: ("direccion_extranjero", "codigo_pais"),
+}
+SLOT_BASES_030 = (6, 22, 38, 54, 70)
+
+
 def _slot_transmitente(t: dict) -> dict:
     """
     Devuelve {offset: value} para un slot de transmitente (16 campos).
     Offsets 0-15 corresponden a los campos de cada slot en la página 030.
     """
-    t       = t or {}
-    dir_ext = t.get("direccion_extranjero") or {}
-    return {
-        0:  t.get("nif", ""),
-        1:  t.get("fj", ""),
-        2:  t.get("apellidos_nombre", ""),
-        3:  t.get("tipo_cuota", ""),               # C/O
-        4:  t.get("coef_part_centesimas", 0),       # RAW INT
-        5:  t.get("nif_pais_residencia", ""),
-        6:  t.get("fecha_nacimiento", ""),
-        7:  t.get("lugar_nacimiento_ciudad", ""),
-        8:  t.get("lugar_nacimiento_codigo_pais", ""),
-        9:  t.get("residencia_fiscal_codigo_pais", ""),
-        10: dir_ext.get("domicilio", ""),
-        11: dir_ext.get("datos_complementarios", ""),
-        12: dir_ext.get("ciudad", ""),
-        13: dir_ext.get("codigo_postal_zip", ""),
-        14: dir_ext.get("provincia_region", ""),
-        15: dir_ext.get("codigo_pais", ""),
-    }
+    t = t or {}
+    return {offset: _get_valor_raw(ruta, t) for offset, ruta in SLOT_TRANSMITENTE.items()}
 
 
 def _build_valores_030(transmitentes: list) -> dict:
@@ -439,9 +576,8 @@ def _build_valores_030(transmitentes: list) -> dict:
     while len(slots) < 5:
         slots.append(None)
 
-    SLOT_BASES = [6, 22, 38, 54, 70]
     valores = {}
-    for i, base in enumerate(SLOT_BASES):
+    for i, base in enumerate(SLOT_BASES_030):
         for offset, val in _slot_transmitente(slots[i]).items():
             valores[base + offset] = val
     return valores
@@ -459,7 +595,7 @@ def generar_json_formateado(pagina: str, field_defs: list,
 
     Args:
         pagina         : "010", "020" o "030"
-        field_defs     : salida de parse_csv_page
+        field_defs     : salida de parse_csv_page (o LayoutPagina.definiciones)
         valores        : {field_num: value} pre-construido
         raw_int_fields : set de field_num cuyo Num es ya entero (sin ×100)
     """
@@ -527,27 +663,161 @@ def generar_json_formateado(pagina: str, field_defs: list,
     }
 
 
+def formatear_pagina(layout: LayoutPagina, valores: dict) -> tuple:
+    """
+    Modo rápido de generar_json_formateado: formatea solo los campos
+    variables y devuelve ({field_num: str}, diagnóstico). El diagnóstico
+    tiene los mismos contadores pero en "campos" solo lista los que fallan.
+    """
+    formateados = {}
+    errores     = []
+    for campo, field in zip(layout.campos, layout.definiciones):
+        if campo.num in layout.nums_fijos:
+            continue
+        valor_raw = valores.get(campo.num)
+        if valor_raw is None:
+            valor_raw = "" if campo.tipo in ("An", "A") else 0
+        field_def = dict(field, es_decimal=False) if campo.es_raw_int else field
+        try:
+            valor_formateado = formatear_campo(field_def, valor_raw)
+            ok = len(valor_formateado) == campo.longitud
+        except Exception as e:
+            valor_formateado = f"ERROR: {e}"
+            ok = False
+        formateados[campo.num] = valor_formateado
+        if not ok:
+            errores.append({
+                "num":                 campo.num,
+                "posicion":            campo.offset + 1,
+                "longitud":            campo.longitud,
+                "tipo":                campo.tipo,
+                "descripcion":         campo.descripcion,
+                "valor_raw":           str(valor_raw),
+                "valor_formateado":    valor_formateado,
+                "longitud_verificada": len(valor_formateado),
+                "ok":                  False,
+            })
+
+    total = len(layout.campos)
+    return formateados, {
+        "pagina":            layout.pagina,
+        "longitud_total":    layout.longitud_total,
+        "longitud_generada": None,
+        "campos_ok":         total - len(errores),
+        "campos_error":      len(errores),
+        "todos_ok":          not errores,
+        "completo":          False,
+        "campos":            errores,
+    }
+
+
+# ─────────────────────────────────────────────────────────────
+#  PASO 4b: FORMATEADORES COMPILADOS POR PÁGINA
+# ─────────────────────────────────────────────────────────────
+#
+# formatear_campo decide el tipo de cada campo en cada llamada. Con el
+# layout ya conocido se genera una función Python por página con una sola
+# operación precalculada por campo, que escribe directamente sobre la
+# plantilla. Produce los mismos bytes que formatear_pagina +
+# ensamblar_registro (ver bench_211.diferencial_formateadores); si algún
+# valor lanza excepción (p.ej. float('inf')) el llamante vuelve al camino
+# genérico, que es el que sabe diagnosticar el campo.
+
+def _fuente_campo(campo: CampoLayout) -> list:
+    """Líneas de código que formatean un campo sobre `buf`."""
+    n, a, b = campo.longitud, campo.offset, campo.offset + campo.longitud
+    lineas = [f"v = get({campo.num})"]
+    if campo.tipo == "Num" and campo.es_decimal:
+        lineas += [
+            "try:",
+            "    f = float(v) if (v is not None and v != '') else 0.0",
+            "except (ValueError, TypeError):",
+            "    f = 0.0",
+            f"buf[{a}:{b}] = str(int(round(f * 100))).zfill({n})[-{n}:].encode('ascii')",
+        ]
+    elif campo.tipo == "Num":
+        lineas += [
+            "try:",
+            "    s = '0' if v is None else str(v).strip()",
+            "    i = int(s) if s != '' else 0",
+            "except (ValueError, TypeError):",
+            "    i = 0",
+            f"buf[{a}:{b}] = str(i).zfill({n})[-{n}:].encode('ascii')",
+        ]
+    else:
+        # An / A (y cualquier otro tipo): texto truncado y relleno a la derecha
+        lineas += [
+            "s = '' if v is None else str(v)",
+            f"buf[{a}:{b}] = s[:{n}].ljust({n}).encode('ascii', 'replace')",
+        ]
+    return lineas
+
+
+def _compilar_formateador(pagina: str, plantilla: bytes, variables: tuple):
+    """Genera y compila `formatear_<pagina>(valores) -> bytes`."""
+    cuerpo = ["buf = bytearray(plantilla)", "get = valores.get"]
+    for campo in variables:
+        cuerpo += _fuente_campo(campo)
+    cuerpo.append("return bytes(buf)")
+    fuente = (
+        f"def formatear_{pagina}(valores, plantilla=plantilla):\n"
+        + "".join(f"    {linea}\n" for linea in cuerpo)
+    )
+    namespace = {"plantilla": plantilla}
+    exec(compile(fuente, f"<formateador_211_{pagina}>", "exec"), namespace)
+    return namespace[f"formatear_{pagina}"]
+
+
 # ─────────────────────────────────────────────────────────────
 #  PASO 5: ENSAMBLADOR DE REGISTRO DE TEXTO
 # ─────────────────────────────────────────────────────────────
 
+def ensamblar_registro(layout: LayoutPagina, formateados: dict) -> bytes:
+    """
+    Copia la plantilla de la página y escribe por slice solo los campos
+    variables. formateados es {field_num: str} con cada valor ya formateado
+    a su longitud; los campos ausentes quedan en blanco.
+
+    Los caracteres no ASCII se sustituyen por '?' para que cada carácter
+    ocupe exactamente un byte (el normalizer ya los elimina de antemano).
+    """
+    registro = bytearray(layout.plantilla)
+    for campo in layout.variables:
+        valor = formateados.get(campo.num)
+        if valor is None:
+            continue
+        inicio = campo.offset
+        fin    = inicio + campo.longitud
+        datos  = valor.encode("ascii", "replace")
+        if len(datos) != campo.longitud:
+            datos = datos[:campo.longitud].ljust(campo.longitud)
+        registro[inicio:fin] = datos
+    return bytes(registro)
+
+
 def json_a_registro(diagnostico: dict) -> str:
     """
-    Construye el registro de longitud fija insertando cada campo en
-    posicion-1 (base 0). Verifica longitud, tag de inicio y tag de fin.
+    Construye el registro de longitud fija a partir de la plantilla de la
+    página, insertando cada campo variable en posicion-1 (base 0).
+    Verifica longitud, tag de inicio y tag de fin.
     """
-    pagina         = diagnostico["pagina"]
-    longitud_total = TOTAL_LONGITUDES[pagina]
+    pagina = diagnostico["pagina"]
+    layout = get_layout(pagina)
+
+    formateados = {
+        campo["num"]: campo["valor_formateado"]
+        for campo in diagnostico["campos"]
+        if campo["num"] not in layout.nums_fijos
+    }
+    texto = _verificar_registro(pagina, ensamblar_registro(layout, formateados))
+    diagnostico["longitud_generada"] = len(texto)
+    return texto
 
-    registro = list(" " * longitud_total)
-    for campo in diagnostico["campos"]:
-        pos_base0 = campo["posicion"] - 1
-        for i, ch in enumerate(campo["valor_formateado"]):
-            idx = pos_base0 + i
-            if idx < longitud_total:
-                registro[idx] = ch
 
-    texto  = "".join(registro)
+def _verificar_registro(pagina: str, registro: bytes) -> str:
+    """Verifica longitud, tag de inicio y tag de fin; devuelve el texto."""
+    longitud_total = TOTAL_LONGITUDES[pagina]
+    texto  = registro.decode("ascii")
     inicio = f"<T211{pagina}>"
     fin    = f"</T211{pagina}>"
 
@@ -561,8 +831,6 @@ def json_a_registro(diagnostico: dict) -> str:
         raise ValueError(
             f"Pág {pagina}: no termina con '{fin}'. Últimos 15: '{texto[-15:]}'"
         )
-
-    diagnostico["longitud_generada"] = len(texto)
     return texto
 
 
@@ -570,7 +838,113 @@ def json_a_registro(diagnostico: dict) -> str:
 #  PASO 6: ORQUESTADOR PRINCIPAL
 # ─────────────────────────────────────────────────────────────
 
-def generar_modelo211(datos_json_path, output_path=None):
+def _diagnostico_sin_errores(layout: LayoutPagina) -> dict:
+    return {
+        "pagina":            layout.pagina,
+        "longitud_total":    layout.longitud_total,
+        "longitud_generada": None,
+        "campos_ok":         len(layout.campos),
+        "campos_error":      0,
+        "todos_ok":          True,
+        "completo":          False,
+        "campos":            [],
+    }
+
+
+def generar_registros(datos_completos: dict, diagnostico_completo: bool = False) -> tuple:
+    """
+    Genera los 3 registros a partir del dict normalizado, sin tocar disco
+    ni consola.
+
+    Args:
+        datos_completos      : dict normalizado (salida de normalizar_datos)
+        diagnostico_completo : True → un dict por campo con descripción,
+                               valor_raw y valor_formateado (lento);
+                               False → solo se listan los campos con error.
+
+    Returns:
+        (registros, diagnosticos): listas paralelas para 010, 020 y 030.
+
+    Raises:
+        ValueError: si algún registro no cuadra en longitud o tags.
+    """
+    datos_010     = datos_completos.get("pagina_010", {})
+    adquirentes   = datos_completos.get("pagina_020", {}).get("adquirentes", [])
+    transmitentes = datos_completos.get("pagina_030", {}).get("transmitentes", [])
+
+    pipeline = [
+        ("010", get_layout("010"), _build_valores_010(datos_010)),
+        ("020", get_layout("020"), _build_valores_020(adquirentes)),
+        ("030", get_layout("030"), _build_valores_030(transmitentes)),
+    ]
+
+    registros    = []
+    diagnosticos = []
+    for pagina, layout, valores in pipeline:
+        if diagnostico_completo:
+            diag = generar_json_formateado(
+                pagina, layout.definiciones, valores, layout.raw_int_fields
+            )
+            diag["completo"] = True
+            registro = json_a_registro(diag)
+        else:
+            try:
+                contenido = layout.formateador(valores)
+                diag = _diagnostico_sin_errores(layout)
+            except Exception:
+                formateados, diag = formatear_pagina(layout, valores)
+                contenido = ensamblar_registro(layout, formateados)
+            registro = _verificar_registro(pagina, contenido)
+            diag["longitud_generada"] = len(registro)
+        registros.append(registro)
+        diagnosticos.append(diag)
+    return registros, diagnosticos
+
+
+def generar_modelo211_from_dict(datos_completos: dict,
+                                diagnostico_completo: bool = False) -> tuple:
+    """
+    Genera el Modelo 211 completamente en memoria.
+
+    Args:
+        datos_completos      : dict normalizado (salida de normalizar_datos)
+        diagnostico_completo : ver generar_registros
+
+    Returns:
+        (contenido, diagnosticos): los 6600 bytes ASCII del fichero y la
+        lista de diagnósticos por página. No escribe nada en disco; la
+        trazabilidad se guarda aparte con guardar_trazabilidad().
+    """
+    registros, diagnosticos = generar_registros(datos_completos, diagnostico_completo)
+    return "".join(registros).encode("ascii"), diagnosticos
+
+
+def guardar_trazabilidad(datos_completos: dict, diagnosticos: list,
+                         json_path, output_path, owner: str | None = None) -> None:
+    """
+    Persiste el JSON de entrada y los diagnostico_<pagina>.json de una
+    generación ya hecha en memoria. Pensado para ejecutarse fuera del
+    camino crítico de la petición (p.ej. en un hilo de fondo).
+
+    Al final escribe entrada.json {owner, json_guardado} en output_path:
+    /diagnostics/<job_id> solo sirve el JSON de entrada a su propietario.
+    """
+    json_path   = Path(json_path)
+    output_path = Path(output_path)
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(datos_completos, f, ensure_ascii=False, indent=2)
+    for diag in diagnosticos:
+        diag_path = output_path / f"diagnostico_{diag['pagina']}.json"
+        with open(diag_path, "w", encoding="utf-8") as f:
+            json.dump(diag, f, ensure_ascii=False, indent=2)
+    with open(output_path / "entrada.json", "w", encoding="utf-8") as f:
+        json.dump({"owner": owner, "json_guardado": json_path.name}, f)
+
+
+def generar_modelo211(datos_json_path, output_path=None, diagnostico_completo=False):
     """
     Orquestador principal.
 
@@ -578,8 +952,10 @@ def generar_modelo211(datos_json_path, output_path=None):
     Los slots vacíos en páginas 020 y 030 se rellenan con ceros/espacios.
 
     Args:
-        datos_json_path : ruta al JSON de entrada
-        output_path     : directorio de salida (por defecto MODELIA/Output/)
+        datos_json_path      : ruta al JSON de entrada
+        output_path          : directorio de salida (por defecto MODELIA/Output/)
+        diagnostico_completo : escribe diagnostico_<pagina>.json con todos los
+                               campos; por defecto solo con los que fallan
 
     Returns:
         Texto final completo (str, 6600 chars).
@@ -593,61 +969,48 @@ def generar_modelo211(datos_json_path, output_path=None):
     with open(datos_json_path, encoding="utf-8") as f:
         datos_completos = json.load(f)
 
-    datos_010     = datos_completos.get("pagina_010", {})
     adquirentes   = datos_completos.get("pagina_020", {}).get("adquirentes", [])
     transmitentes = datos_completos.get("pagina_030", {}).get("transmitentes", [])
 
-    print(f"\n{'='*60}")
-    print(f"  GENERADOR MODELO 211 - AEAT")
-    print(f"{'='*60}")
-    print(f"  Datos    : {datos_json_path.name}")
-    print(f"  Salida   : {output_path}")
-    print(f"  Páginas  : 010 + 020 + 030 (siempre, total 6600 chars)")
-    print(f"  Adqs p020: {len(adquirentes)} slot(s) informado(s) de 3")
-    print(f"  Trans p030: {len(transmitentes)} slot(s) informado(s) de 5")
-
-    # Pre-construir valores para cada página
-    pipeline = [
-        ("010", parse_csv_page("010"), _build_valores_010(datos_010),           None),
-        ("020", parse_csv_page("020"), _build_valores_020(adquirentes),   RAW_INT_FIELDS["020"]),
-        ("030", parse_csv_page("030"), _build_valores_030(transmitentes), RAW_INT_FIELDS["030"]),
-    ]
-
-    registros = []
-
-    for pagina, field_defs, valores, raw_int_flds in pipeline:
+    log.info(f"\n{'='*60}")
+    log.info(f"  GENERADOR MODELO 211 - AEAT")
+    log.info(f"{'='*60}")
+    log.info(f"  Datos    : {datos_json_path.name}")
+    log.info(f"  Salida   : {output_path}")
+    log.debug(f"  Páginas  : 010 + 020 + 030 (siempre, total 6600 chars)")
+    log.debug(f"  Adqs p020: {len(adquirentes)} slot(s) informado(s) de 3")
+    log.debug(f"  Trans p030: {len(transmitentes)} slot(s) informado(s) de 5")
+
+    try:
+        registros, diagnosticos = generar_registros(datos_completos, diagnostico_completo)
+    except ValueError as e:
+        log.error(f"  ERROR al ensamblar: {e}")
+        raise
+
+    for registro, diag in zip(registros, diagnosticos):
+        pagina  = diag["pagina"]
         lng_esp = TOTAL_LONGITUDES[pagina]
-        print(f"\n{'─'*60}")
-        print(f"  Pág {pagina}  ({lng_esp} chars, {len(field_defs)} campos)")
-
-        diag = generar_json_formateado(pagina, field_defs, valores, raw_int_flds)
-
-        try:
-            registro = json_a_registro(diag)
-        except ValueError as e:
-            print(f"  ERROR al ensamblar: {e}")
-            raise
-
-        registros.append(registro)
+        total_c = diag["campos_ok"] + diag["campos_error"]
+        log.debug(f"\n{'─'*60}")
+        log.debug(f"  Pág {pagina}  ({lng_esp} chars, {total_c} campos)")
 
         # Guardar diagnóstico
         diag_path = output_path / f"diagnostico_{pagina}.json"
         with open(diag_path, "w", encoding="utf-8") as f:
             json.dump(diag, f, ensure_ascii=False, indent=2)
 
-        total_c = diag["campos_ok"] + diag["campos_error"]
-        print(f"  Longitud  : {len(registro)} / {lng_esp} chars")
-        print(f"  Campos OK : {diag['campos_ok']} / {total_c}")
+        log.debug(f"  Longitud  : {len(registro)} / {lng_esp} chars")
+        log.debug(f"  Campos OK : {diag['campos_ok']} / {total_c}")
 
         if not diag["todos_ok"]:
-            print(f"  CAMPOS CON ERROR:")
+            log.warning(f"  Pág {pagina}: CAMPOS CON ERROR:")
             for c in diag["campos"]:
                 if not c["ok"]:
-                    print(
+                    log.warning(
                         f"    Campo {c['num']:3d} [pos={c['posicion']:5d} lon={c['longitud']:3d}] "
                         f"{c['descripcion'][:45]}"
                     )
-                    print(f"           raw='{c['valor_raw']}'  fmt='{c['valor_formateado']}'")
+                    log.warning(f"           raw='{c['valor_raw']}'  fmt='{c['valor_formateado']}'")
 
     # Fichero final (sin saltos de línea)
     texto_final = "".join(registros)
@@ -655,21 +1018,22 @@ def generar_modelo211(datos_json_path, output_path=None):
     with open(txt_path, "w", encoding="utf-8") as f:
         f.write(texto_final)
 
-    print(f"\n{'='*60}")
-    print(f"  COMPLETADO")
-    print(f"{'='*60}")
-    print(f"  Fichero : {txt_path}")
-    print(f"  Total   : {len(texto_final)} chars (esperado: 6600)")
-    print(f"\n  Verificaciones por página:")
-    for pagina, registro in zip(["010", "020", "030"], registros):
-        lng    = TOTAL_LONGITUDES[pagina]
-        ok_lng = len(registro) == lng
-        ok_ini = registro.startswith(f"<T211{pagina}>")
-        ok_fin = registro.endswith(f"</T211{pagina}>")
-        est    = "OK" if (ok_lng and ok_ini and ok_fin) else "ERROR"
-        print(
-            f"  [{est}] Pág {pagina}: len={len(registro)} "
-            f"inicio={'✓' if ok_ini else '✗'}  fin={'✓' if ok_fin else '✗'}"
-        )
+    log.info(f"\n{'='*60}")
+    log.info(f"  COMPLETADO")
+    log.info(f"{'='*60}")
+    log.info(f"  Fichero : {txt_path}")
+    log.info(f"  Total   : {len(texto_final)} chars (esperado: 6600)")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(f"\n  Verificaciones por página:")
+        for pagina, registro in zip(["010", "020", "030"], registros):
+            lng    = TOTAL_LONGITUDES[pagina]
+            ok_lng = len(registro) == lng
+            ok_ini = registro.startswith(f"<T211{pagina}>")
+            ok_fin = registro.endswith(f"</T211{pagina}>")
+            est    = "OK" if (ok_lng and ok_ini and ok_fin) else "ERROR"
+            log.debug(
+                f"  [{est}] Pág {pagina}: len={len(registro)} "
+                f"inicio={'✓' if ok_ini else '✗'}  fin={'✓' if ok_fin else '✗'}"
+            )
 
     return texto_final
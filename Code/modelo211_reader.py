@@ -0,0 +1,227 @@
+"""
+modelo211_reader.py
+Lector de ficheros 211.txt: registro de ancho fijo → JSON estructurado.
+
+Es el camino inverso de json_a_registro / generar_registros: recorta el
+registro de 6600 caracteres con memoryview (sin copias intermedias) según
+los layouts compilados de KB/ y reconstruye la misma estructura
+pagina_010/020/030 que produce normalizar_datos:
+
+  · Num con decimales implícitos → float (/100)
+  · Num en RAW_INT_FIELDS        → int tal cual (coef_part_centesimas)
+  · Num de fecha                 → string DDMMYYYY ("" si vale 0)
+  · resto de Num                 → int
+  · An / A                       → string sin el relleno de espacios
+
+Los slots vacíos de las páginas 020/030 se omiten, igual que las
+subsecciones de dirección sin ningún dato. La ida y vuelta
+generar_registros(leer_bytes(x)) reproduce x byte a byte.
+
+Uso:
+    from modelo211_reader import leer_fichero
+    datos = leer_fichero("Output/211.txt")
+"""
+
+import mmap
+import os
+from pathlib import Path
+
+from modelo211_generator import (
+    MAPPING_010,
+    SLOT_ADQUIRENTE,
+    SLOT_BASES_020,
+    SLOT_BASES_030,
+    SLOT_TRANSMITENTE,
+    TOTAL_LONGITUDES,
+    get_layout,
+)
+
+PAGINAS      = ("010", "020", "030")
+LONGITUD_211 = sum(TOTAL_LONGITUDES[p] for p in PAGINAS)     # 6600
+
+CAMPO_COMPLEMENTARIA = 105      # página 010: "X" si es complementaria
+
+
+# ─────────────────────────────────────────────────────────────
+#  CONVERSORES POR TIPO DE CAMPO
+# ─────────────────────────────────────────────────────────────
+
+def _texto(v: memoryview) -> str:
+    return str(v, "latin-1").rstrip()
+
+
+def _entero(v: memoryview) -> int:
+    s = str(v, "latin-1").strip()
+    return int(s) if s.isdigit() else 0
+
+
+def _decimal(v: memoryview) -> float:
+    return _entero(v) / 100
+
+
+def _fecha(v: memoryview) -> str:
+    s = str(v, "latin-1").strip()
+    return "" if s.strip("0") == "" else s
+
+
+def _conversor(campo, ruta: tuple):
+    """Elige el conversor de un campo según su tipo en el CSV."""
+    if campo.tipo != "Num":
+        return _texto
+    if campo.es_decimal:
+        return _decimal
+    if ruta[-1].startswith("fecha"):
+        return _fecha
+    return _entero
+
+
+# ─────────────────────────────────────────────────────────────
+#  PLAN DE LECTURA (precalculado por layout)
+# ─────────────────────────────────────────────────────────────
+
+_planes: dict = {}      # (pagina, checksum) -> plan
+
+
+def _plan_campos(pagina: str, rutas: dict) -> tuple:
+    """
+    ((inicio, fin, conversor, ruta), ...) para los campos de `rutas`
+    ({num: ruta}), con offsets relativos al inicio del registro.
+    """
+    layout = get_layout(pagina)
+    campos = {c.num: c for c in layout.campos}
+    plan = []
+    for num, ruta in rutas.items():
+        c = campos[num]
+        plan.append((c.offset, c.offset + c.longitud, _conversor(c, ruta), ruta))
+    return tuple(plan)
+
+
+def _plan(pagina: str):
+    layout = get_layout(pagina)
+    clave = (pagina, layout.checksum)
+    plan = _planes.get(clave)
+    if plan is None:
+        if pagina == "010":
+            campos = {c.num: c for c in layout.campos}
+            c = campos[CAMPO_COMPLEMENTARIA]
+            plan = (_plan_campos("010", MAPPING_010), (c.offset, c.offset + c.longitud))
+        elif pagina == "020":
+            plan = tuple(
+                _plan_campos("020", {base + off: ruta for off, ruta in SLOT_ADQUIRENTE.items()})
+                for base in SLOT_BASES_020
+            )
+        else:
+            plan = tuple(
+                _plan_campos("030", {base + off: ruta for off, ruta in SLOT_TRANSMITENTE.items()})
+                for base in SLOT_BASES_030
+            )
+        _planes[clave] = plan
+    return plan
+
+
+# ─────────────────────────────────────────────────────────────
+#  LECTURA DE CADA PÁGINA
+# ─────────────────────────────────────────────────────────────
+
+def _vacio(v) -> bool:
+    if isinstance(v, dict):
+        return all(_vacio(x) for x in v.values())
+    return v in ("", 0, 0.0)
+
+
+def _podar(obj: dict) -> dict:
+    """Omite las subsecciones (direcciones) sin ningún dato."""
+    for clave in [k for k, v in obj.items() if isinstance(v, dict) and _vacio(v)]:
+        del obj[clave]
+    return obj
+
+
+def _leer_campos(mv: memoryview, plan: tuple) -> dict:
+    obj: dict = {}
+    for inicio, fin, conversor, ruta in plan:
+        destino = obj
+        for clave in ruta[:-1]:
+            destino = destino.setdefault(clave, {})
+        destino[ruta[-1]] = conversor(mv[inicio:fin])
+    return obj
+
+
+def leer_pagina_010(mv: memoryview) -> dict:
+    campos, (ci, cf) = _plan("010")
+    datos = _leer_campos(mv, campos)
+    for seccion in datos.values():
+        if isinstance(seccion, dict):
+            _podar(seccion)
+    es_comp = str(mv[ci:cf], "latin-1") == "X"
+    datos.setdefault("complementaria", {})["es_complementaria"] = es_comp
+    datos["header"]["es_complementaria"] = es_comp
+    return datos
+
+
+def leer_pagina_020(mv: memoryview) -> dict:
+    slots = (_podar(_leer_campos(mv, plan)) for plan in _plan("020"))
+    return {"adquirentes": [s for s in slots if not _vacio(s)]}
+
+
+def leer_pagina_030(mv: memoryview) -> dict:
+    slots = (_podar(_leer_campos(mv, plan)) for plan in _plan("030"))
+    return {"transmitentes": [s for s in slots if not _vacio(s)]}
+
+
+_LECTORES = {"010": leer_pagina_010, "020": leer_pagina_020, "030": leer_pagina_030}
+
+
+# ─────────────────────────────────────────────────────────────
+#  API PÚBLICA
+# ─────────────────────────────────────────────────────────────
+
+def leer_bytes(datos) -> dict:
+    """
+    Reconstruye {pagina_010, pagina_020, pagina_030} desde un 211 completo
+    (bytes, bytearray, mmap o memoryview).
+
+    Lanza ValueError si la longitud no es 6600 o faltan los tags de página;
+    el contenido de los campos no se valida (ver modelo211_validator).
+    """
+    # Las vistas se liberan explícitamente (también al lanzar) para que el
+    # llamador pueda cerrar el mmap subyacente.
+    with memoryview(datos) as mv:
+        if len(mv) != LONGITUD_211:
+            raise ValueError(f"Longitud {len(mv)} != {LONGITUD_211}")
+
+        resultado, offset = {}, 0
+        for pagina in PAGINAS:
+            longitud = TOTAL_LONGITUDES[pagina]
+            tag = f"<T211{pagina}".encode("ascii")
+            with mv[offset:offset + longitud] as registro:
+                if registro[:len(tag)] != tag:
+                    raise ValueError(
+                        f"Página {pagina}: no empieza por {tag.decode()} en pos {offset + 1}"
+                    )
+                resultado[f"pagina_{pagina}"] = _LECTORES[pagina](registro)
+            offset += longitud
+    return resultado
+
+
+def leer_fichero(path) -> dict:
+    """Lee un fichero 211.txt vía mmap y devuelve el dict estructurado."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return leer_bytes(b"")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return leer_bytes(mm)
+
+
+def leer_archivo(rutas):
+    """
+    Generador de (ruta, datos | None, error | None) para cada fichero 211
+    de `rutas` (ficheros o directorios, recursivo *.txt).
+    """
+    for ruta in rutas:
+        ruta = Path(ruta)
+        ficheros = sorted(ruta.rglob("*.txt")) if ruta.is_dir() else [ruta]
+        for fichero in ficheros:
+            try:
+                yield fichero, leer_fichero(fichero), None
+            except (OSError, ValueError) as exc:
+                yield fichero, None, str(exc)
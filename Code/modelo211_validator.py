@@ -0,0 +1,171 @@
+"""
+modelo211_validator.py
+Validador de ficheros 211.txt ya generados (archivo histórico).
+
+Cada fichero se abre con mmap y se contrasta con los layouts compilados
+de los CSVs de KB/:
+  · longitud total 6600
+  · tags de inicio/fin y constantes de cada página
+  · bloques reservados en blanco
+  · campos Num solo con dígitos
+  · campos An en ASCII imprimible y campos A solo con letras/espacios
+
+Pensado para recorrer miles de ficheros: los chequeos son comparaciones
+de slices de bytes precalculadas por página, y los ficheros se reparten
+en un pool de procesos. Los resultados se devuelven en streaming.
+"""
+
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from modelo211_generator import TOTAL_LONGITUDES, get_layout
+
+PAGINAS      = ("010", "020", "030")
+LONGITUD_211 = sum(TOTAL_LONGITUDES[p] for p in PAGINAS)     # 6600
+MAX_ERRORES  = 50       # por fichero, para que un fichero roto no inunde el informe
+
+_IMPRIMIBLES = bytes(range(0x20, 0x7F))
+_LETRAS      = b" ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+# ─────────────────────────────────────────────────────────────
+#  PLAN DE VALIDACIÓN (precalculado por layout)
+# ─────────────────────────────────────────────────────────────
+
+_planes: dict = {}      # (pagina, checksum) -> plan
+
+
+def _plan(pagina: str, base: int) -> tuple:
+    """
+    (fijos, numericos, alfabeticos) con offsets absolutos en el fichero.
+    fijos = [(inicio, fin, bytes_esperados, num, motivo)], resto = [(inicio, fin, num)].
+    """
+    layout = get_layout(pagina)
+    clave = (pagina, layout.checksum)
+    plan = _planes.get(clave)
+    if plan is None:
+        fijos, numericos, alfabeticos = [], [], []
+        for c in layout.campos:
+            a, b = base + c.offset, base + c.offset + c.longitud
+            if c.num in layout.nums_fijos:
+                motivo = "reservado no vacío" if c.es_reservado else "constante/tag incorrecto"
+                esperado = layout.plantilla[c.offset:c.offset + c.longitud]
+                fijos.append((a, b, esperado, c.num, motivo))
+            elif c.tipo == "Num":
+                numericos.append((a, b, c.num))
+            elif c.tipo == "A":
+                alfabeticos.append((a, b, c.num))
+        plan = (tuple(fijos), tuple(numericos), tuple(alfabeticos))
+        _planes[clave] = plan
+    return plan
+
+
+def _bases() -> list:
+    bases, offset = [], 0
+    for pagina in PAGINAS:
+        bases.append((pagina, offset))
+        offset += TOTAL_LONGITUDES[pagina]
+    return bases
+
+
+# ─────────────────────────────────────────────────────────────
+#  VALIDACIÓN DE UN FICHERO
+# ─────────────────────────────────────────────────────────────
+
+def validar_bytes(datos) -> list:
+    """
+    Valida un 211 completo (bytes, bytearray o mmap). Devuelve la lista
+    de errores, vacía si el fichero es correcto.
+    """
+    errores = []
+
+    def error(pagina, num, inicio, motivo, valor=b""):
+        if len(errores) < MAX_ERRORES:
+            errores.append({
+                "pagina":   pagina,
+                "campo":    num,
+                "posicion": inicio + 1,
+                "motivo":   motivo,
+                "valor":    bytes(valor).decode("latin-1"),
+            })
+
+    if len(datos) != LONGITUD_211:
+        error(None, None, 0, f"longitud {len(datos)} != {LONGITUD_211}")
+        if len(datos) < LONGITUD_211:
+            return errores
+
+    for pagina, base in _bases():
+        fijos, numericos, alfabeticos = _plan(pagina, base)
+        registro = datos[base:base + TOTAL_LONGITUDES[pagina]]
+
+        # Fast path: registro entero en ASCII imprimible → solo faltan los
+        # chequeos por campo; si no, se localiza el campo culpable abajo.
+        imprimible = not registro.translate(None, _IMPRIMIBLES)
+
+        for a, b, esperado, num, motivo in fijos:
+            if datos[a:b] != esperado:
+                error(pagina, num, a, motivo, datos[a:b])
+        for a, b, num in numericos:
+            valor = datos[a:b]
+            if not valor.isdigit():
+                error(pagina, num, a, "Num con caracteres no numéricos", valor)
+        for a, b, num in alfabeticos:
+            valor = datos[a:b]
+            if valor.translate(None, _LETRAS):
+                error(pagina, num, a, "A con caracteres no alfabéticos", valor)
+
+        if not imprimible:
+            for i, byte in enumerate(registro):
+                if not 0x20 <= byte < 0x7F:
+                    error(pagina, None, base + i, "carácter no ASCII imprimible",
+                          registro[i:i + 1])
+    return errores
+
+
+def validar_fichero(path) -> dict:
+    """Valida un fichero 211 vía mmap. Devuelve {fichero, ok, errores}."""
+    path = Path(path)
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                errores = validar_bytes(b"")
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    errores = validar_bytes(mm)
+    except OSError as exc:
+        errores = [{"pagina": None, "campo": None, "posicion": 0,
+                    "motivo": f"no se pudo leer: {exc}", "valor": ""}]
+    return {"fichero": str(path), "ok": not errores, "errores": errores}
+
+
+# ─────────────────────────────────────────────────────────────
+#  VALIDACIÓN DE UN ARCHIVO COMPLETO
+# ─────────────────────────────────────────────────────────────
+
+def _expandir(rutas) -> list:
+    ficheros = []
+    for ruta in rutas:
+        ruta = Path(ruta)
+        if ruta.is_dir():
+            ficheros.extend(sorted(ruta.rglob("*.txt")))
+        else:
+            ficheros.append(ruta)
+    return ficheros
+
+
+def validar_archivo(rutas, workers: int | None = None):
+    """
+    Valida todos los ficheros 211 (rutas o directorios, recursivo *.txt).
+    Generador: va devolviendo el resultado de cada fichero según termina,
+    en el mismo orden de entrada.
+    """
+    ficheros = _expandir(rutas)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(ficheros) < 64:
+        yield from map(validar_fichero, ficheros)
+        return
+    chunksize = max(16, len(ficheros) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(validar_fichero, ficheros, chunksize=chunksize)
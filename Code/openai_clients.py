@@ -0,0 +1,106 @@
+"""
+openai_clients.py
+Registro de clientes OpenAI compartidos por todo el proceso.
+
+Cada llamada al LLM creaba su propio OpenAI(api_key=...) y con él un pool
+HTTP nuevo y un handshake TLS por petición. Aquí se mantiene un único
+cliente keep-alive por API key y proceso; los perfiles (timeouts y
+reintentos por tipo de llamada) son vistas with_options() sobre ese mismo
+pool de conexiones.
+
+El cliente de OpenAI (httpx) es seguro entre hilos, así que el mismo
+objeto sirve a todos los hilos de un worker de gunicorn. Tras un fork se
+crea uno nuevo: las conexiones abiertas no se comparten entre procesos.
+
+Configuración (variables de entorno):
+    OPENAI_MAX_CONNECTIONS     conexiones simultáneas por proceso (20)
+    OPENAI_MAX_KEEPALIVE       conexiones ociosas que se conservan (10)
+    OPENAI_KEEPALIVE_EXPIRY    s que vive una conexión ociosa (60)
+    OPENAI_CONNECT_TIMEOUT     s para conectar (10)
+    OPENAI_MAX_RETRIES         reintentos por defecto (2)
+
+Uso:
+    from openai_clients import get_client
+    client = get_client(api_key, "extraccion")
+"""
+
+import hashlib
+import os
+import threading
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+MAX_CONNECTIONS  = int(os.environ.get("OPENAI_MAX_CONNECTIONS", 20))
+MAX_KEEPALIVE    = int(os.environ.get("OPENAI_MAX_KEEPALIVE", 10))
+KEEPALIVE_EXPIRY = float(os.environ.get("OPENAI_KEEPALIVE_EXPIRY", 60))
+CONNECT_TIMEOUT  = float(os.environ.get("OPENAI_CONNECT_TIMEOUT", 10))
+MAX_RETRIES      = int(os.environ.get("OPENAI_MAX_RETRIES", 2))
+
+# Timeout de lectura y reintentos por tipo de llamada
+PERFILES = {
+    # llm_extractor / comprobacion: respuestas largas (hasta 8192 tokens)
+    "extraccion": {"timeout": 180.0, "max_retries": MAX_RETRIES},
+    # hoja_extractor: una imagen por petición en alta resolución
+    "vision":     {"timeout": 120.0, "max_retries": MAX_RETRIES},
+    # chatbot: el usuario está esperando; mejor fallar pronto
+    "chat":       {"timeout": 60.0,  "max_retries": 1},
+}
+
+_lock = threading.Lock()
+_clientes: dict = {}    # (pid, hash de la key) -> OpenAI base
+_vistas: dict = {}      # (pid, hash de la key, perfil) -> OpenAI con opciones
+
+
+def _huella(api_key: str) -> str:
+    """La key no se guarda como clave del registro, solo su hash."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def _nuevo_cliente(api_key: str) -> OpenAI:
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(PERFILES["extraccion"]["timeout"], connect=CONNECT_TIMEOUT),
+    )
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=MAX_RETRIES)
+
+
+def get_client(api_key: str, perfil: str = "extraccion") -> OpenAI:
+    """
+    Cliente OpenAI compartido para esta API key con el timeout y los
+    reintentos del perfil. Todas las vistas de una key comparten el pool.
+    """
+    if perfil not in PERFILES:
+        raise ValueError(f"Perfil OpenAI desconocido: {perfil!r}")
+    clave = (os.getpid(), _huella(api_key))
+    vista = _vistas.get(clave + (perfil,))
+    if vista is not None:
+        return vista
+
+    with _lock:
+        base = _clientes.get(clave)
+        if base is None:
+            base = _clientes[clave] = _nuevo_cliente(api_key)
+        vista = _vistas.get(clave + (perfil,))
+        if vista is None:
+            opciones = PERFILES[perfil]
+            vista = base.with_options(
+                timeout=httpx.Timeout(opciones["timeout"], connect=CONNECT_TIMEOUT),
+                max_retries=opciones["max_retries"],
+            )
+            _vistas[clave + (perfil,)] = vista
+    return vista
+
+
+def cerrar_clientes() -> None:
+    """Cierra los pools de este proceso (tests, apagado ordenado)."""
+    pid = os.getpid()
+    with _lock:
+        for clave in [c for c in _clientes if c[0] == pid]:
+            _clientes.pop(clave).close()
+        for clave in [c for c in _vistas if c[0] == pid]:
+            del _vistas[clave]
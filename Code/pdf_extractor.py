@@ -1,37 +1,389 @@
 """
 pdf_extractor.py
-Extrae texto limpio de un PDF notarial usando pdfplumber.
+Extrae texto limpio de un PDF notarial.
+
+Motores de texto (PDF_TEXT_ENGINE): PyMuPDF por defecto, mucho más rápido
+que pdfplumber para texto plano. Cada página se valida con una heurística
+de calidad (poco texto, caracteres irrecuperables, ligaduras sin resolver,
+orden de lectura roto) y, si falla, esa página se vuelve a extraer con el
+motor de respaldo (PDF_FALLBACK_ENGINE, pdfplumber). El motor usado y el
+tiempo de cada página se devuelven en `paginas_info` si se pide, y quedan
+en las métricas modelia_pdf_pagina_segundos / modelia_pdf_respaldo_total.
+
+Un motor es una clase en MOTORES que abre el PDF (ruta, bytes o el stream
+del llamante, sin copiarlo: ver _origen) y expone
+len(), texto(i) con i en base 0, close() y paralelo_desde (páginas a
+partir de las que compensa repartir el documento en procesos).
+
+extract_text de pdfplumber es CPU puro y retiene el GIL: en una escritura
+de 30-60 páginas bloquea al resto de hilos del worker durante segundos. A
+partir de PDF_PARALLEL_MIN_PAGES páginas el documento se reparte en
+rangos contiguos de páginas entre un pool de procesos (PDF_WORKERS) y los
+textos se unen en orden, con el mismo formato "--- Página N ---" que la
+versión secuencial. Por debajo del umbral, o si el pool falla, se extrae
+en el propio proceso.
+
+Configuración:
+    PDF_TEXT_ENGINE           motor principal (pymupdf | pdfplumber)
+    PDF_FALLBACK_ENGINE       motor de respaldo por página (pdfplumber; vacío = ninguno)
+    PDF_MIN_CHARS_PAGINA      por debajo, la página se reintenta con el respaldo (20)
+    PDF_WORKERS               procesos del pool (min(4, nº de CPUs); 1 = nunca en paralelo)
+    PDF_PARALLEL_MIN_PAGES    páginas a partir de las que se reparte (por defecto el
+                              umbral del motor: 16 con pdfplumber, 400 con PyMuPDF,
+                              que extrae 60 páginas en ~0,15 s y no compensa el pool)
+    PDF_PAGES_PER_SHARD       páginas mínimas por rango (4)
 """
 
+import io
+import logging
+import mmap
+import multiprocessing
+import os
 import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 
+import fitz  # PyMuPDF
 import pdfplumber
 
+import metrics
+
+log = logging.getLogger("pdf_extractor")
+
+PDF_TEXT_ENGINE        = os.environ.get("PDF_TEXT_ENGINE", "pymupdf").strip().lower()
+PDF_FALLBACK_ENGINE    = os.environ.get("PDF_FALLBACK_ENGINE", "pdfplumber").strip().lower()
+PDF_MIN_CHARS_PAGINA   = int(os.environ.get("PDF_MIN_CHARS_PAGINA", 20))
+PDF_WORKERS            = int(os.environ.get("PDF_WORKERS", min(4, os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", 0))      # 0 = el del motor
+PDF_PAGES_PER_SHARD    = int(os.environ.get("PDF_PAGES_PER_SHARD", 4))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+# ── Motores ───────────────────────────────────────────────────────────────────
 
-def extraer_texto_pdf(pdf_path: Path) -> str:
+class MotorPyMuPDF:
+    """
+    Texto con PyMuPDF en el orden del content stream. No se usa sort=True:
+    multiplica el coste por ~20 y los PDFs notariales ya vienen en orden
+    de lectura; si no, la heurística lo detecta y responde pdfplumber.
     """
-    Extrae todo el texto del PDF, página a página.
 
-    Args:
-        pdf_path: Ruta al fichero PDF.
+    nombre = "pymupdf"
+    paralelo_desde = 400
+    # Sin TEXT_PRESERVE_LIGATURES: "ﬁ" sale como "fi"
+    _FLAGS = fitz.TEXT_PRESERVE_WHITESPACE
+    # Sin recorte a la página: como pdfplumber, conserva el final de las
+    # líneas que se salen del margen
+    _CLIP = fitz.INFINITE_RECT()
 
-    Returns:
-        Texto plano concatenado de todas las páginas, listo para el LLM.
+    def __init__(self, origen):
+        self._mmap = self._vista = None
+        if isinstance(origen, Path):
+            self._doc = fitz.open(origen)
+            return
+        if isinstance(origen, bytes):
+            datos = origen
+        elif isinstance(origen, io.BytesIO):
+            datos = self._vista = origen.getbuffer()
+        else:
+            # Fichero temporal (subida grande): mmap en vez de read()
+            self._mmap = mmap.mmap(origen.fileno(), 0, access=mmap.ACCESS_READ)
+            datos = self._vista = memoryview(self._mmap)
+        try:
+            self._doc = fitz.open(stream=datos, filetype="pdf")
+        except Exception:
+            self._soltar()
+            raise
+
+    def __len__(self) -> int:
+        return self._doc.page_count
+
+    def texto(self, i: int) -> str:
+        return self._doc[i].get_text("text", flags=self._FLAGS, clip=self._CLIP)
+
+    def _soltar(self) -> None:
+        # Orden: el documento referencia la vista, la vista el mmap/BytesIO
+        if self._vista is not None:
+            self._vista.release()
+            self._vista = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def close(self) -> None:
+        self._doc.close()
+        self._soltar()
+
+
+class MotorPdfplumber:
+    """Texto con pdfplumber (más lento, más tolerante con PDFs raros)."""
+
+    nombre = "pdfplumber"
+    paralelo_desde = 16
+
+    def __init__(self, origen):
+        if isinstance(origen, bytes):
+            origen = io.BytesIO(origen)     # comparte el buffer de bytes
+        # Un stream del llamante se lee tal cual y pdfplumber no lo cierra
+        self._pdf = pdfplumber.open(origen)
+
+    def __len__(self) -> int:
+        return len(self._pdf.pages)
+
+    def texto(self, i: int) -> str:
+        page = self._pdf.pages[i]
+        try:
+            return page.extract_text(x_tolerance=3, y_tolerance=3) or ""
+        finally:
+            page.close()      # suelta la caché de objetos de la página
+
+    def close(self) -> None:
+        self._pdf.close()
+
+
+MOTORES = {m.nombre: m for m in (MotorPyMuPDF, MotorPdfplumber)}
+
+_CID       = re.compile(r"\(cid:\d+\)")
+_LIGADURAS = re.compile("[\ufb00-\ufb06]")   # ﬀ ﬁ ﬂ ﬃ ﬄ ﬅ ﬆ
+
+
+def motivo_respaldo(texto: str) -> str | None:
+    """
+    Heurística de calidad de una página: None si el texto es utilizable,
+    o el motivo por el que conviene reintentarla con otro motor.
     """
-    pdf_path = Path(pdf_path)
-    partes = []
+    limpio = texto.strip()
+    if len(limpio) < PDF_MIN_CHARS_PAGINA:
+        return "poco_texto"
+    if "\ufffd" in limpio or _CID.search(limpio):
+        return "caracteres"
+    if _LIGADURAS.search(limpio):
+        return "ligaduras"
+    lineas = [l.strip() for l in limpio.splitlines() if l.strip()]
+    # Texto en columnas o girado mal ordenado: muchas "líneas" de 1-2 letras
+    if len(lineas) >= 10 and sum(len(l) <= 2 for l in lineas) / len(lineas) > 0.4:
+        return "desordenado"
+    return None
+
+
+# ── Extracción por páginas ────────────────────────────────────────────────────
+
+def _iter_rango(origen, inicio: int, fin: int, motor: str, respaldo: str,
+                doc=None, solo: frozenset | None = None):
+    """
+    Texto de las páginas [inicio, fin) (base 0), una entrada por página:
+    {pagina, motor, segundos, caracteres, motivo, texto}. `origen` es una
+    ruta, los bytes del PDF o un stream (ver _origen); `doc`, el documento ya abierto con `motor`;
+    `solo`, si se pasa, los números de página (base 1) que se extraen.
+    """
+    propio = doc is None
+    if propio:
+        doc = MOTORES[motor](origen)
+    doc_respaldo = None
+    try:
+        for i in range(inicio, fin):
+            if solo is not None and i + 1 not in solo:
+                continue
+            t0 = time.perf_counter()
+            texto, usado = doc.texto(i), motor
+            motivo = motivo_respaldo(texto) if respaldo else None
+            if motivo:
+                if doc_respaldo is None:
+                    doc_respaldo = MOTORES[respaldo](origen)
+                alternativo = doc_respaldo.texto(i)
+                if motivo_respaldo(alternativo) is None or len(alternativo.strip()) > len(texto.strip()):
+                    texto, usado = alternativo, respaldo
+            yield {"pagina": i + 1, "motor": usado,
+                   "segundos": round(time.perf_counter() - t0, 5),
+                   "caracteres": len(texto.strip()), "motivo": motivo, "texto": texto}
+    finally:
+        if propio:
+            doc.close()
+        if doc_respaldo is not None:
+            doc_respaldo.close()
+
 
-    with pdfplumber.open(pdf_path) as pdf:
-        for i, page in enumerate(pdf.pages, 1):
-            texto = page.extract_text(x_tolerance=3, y_tolerance=3)
-            if texto and texto.strip():
-                partes.append(f"--- Página {i} ---\n{texto}")
+def _extraer_rango(origen, inicio: int, fin: int, motor: str, respaldo: str,
+                   solo: frozenset | None = None) -> list[dict]:
+    """_iter_rango en un proceso hijo del pool."""
+    return list(_iter_rango(origen, inicio, fin, motor, respaldo, solo=solo))
 
+
+def _get_pool() -> ProcessPoolExecutor:
+    """
+    Pool por proceso, creado la primera vez que hace falta. forkserver (o
+    spawn): hacer fork de un worker de gunicorn con hilos vivos no es seguro.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                        mp_context=multiprocessing.get_context(metodo))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _descartar_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _rangos(n_paginas: int, workers: int, minimo: int) -> list[tuple[int, int]]:
+    """Rangos contiguos [inicio, fin) de tamaño parecido, uno por worker."""
+    n = max(1, min(workers, n_paginas // max(1, minimo)))
+    base, resto = divmod(n_paginas, n)
+    rangos, inicio = [], 0
+    for i in range(n):
+        fin = inicio + base + (1 if i < resto else 0)
+        rangos.append((inicio, fin))
+        inicio = fin
+    return rangos
+
+
+def _origen(pdf_path):
+    """
+    Lo que abren los motores: la ruta, o el propio stream del llamante
+    (BytesIO o fichero temporal), que se lee sin copiarlo.
+    """
+    if not isinstance(pdf_path, Path):
+        pdf_path.seek(0)
+    return pdf_path
+
+
+def _origen_hijos(origen):
+    """
+    Ruta o bytes para los procesos del pool: un stream no se puede enviar
+    y el pickle copiaría el buffer de todos modos, así que solo aquí se
+    copia (una vez por documento, no por rango).
+    """
+    if isinstance(origen, (Path, bytes)):
+        return origen
+    if isinstance(origen, io.BytesIO):
+        return origen.getvalue()
+    origen.seek(0)
+    return origen.read()
+
+
+def _iter_paralelo(origen, n_paginas: int, motor: str, respaldo: str,
+                   solo: frozenset | None = None):
+    """
+    Páginas repartidas en el pool, en orden: cada rango se entrega en
+    cuanto está listo y los anteriores también. Si el pool falla, sigue en
+    secuencial desde la primera página aún no entregada; si el consumidor
+    para, se cancelan los rangos pendientes.
+    """
+    origen = _origen_hijos(origen)
+    rangos = _rangos(n_paginas, PDF_WORKERS, PDF_PAGES_PER_SHARD)
+    siguiente = 0
+    futuros = []
+    try:
+        try:
+            pool = _get_pool()
+            futuros = [pool.submit(_extraer_rango, origen, inicio, fin, motor, respaldo, solo)
+                       for inicio, fin in rangos]
+            log.info(f"[PDF] {n_paginas} páginas en {len(rangos)} rangos paralelos")
+            for futuro in futuros:
+                for pagina in futuro.result():
+                    yield pagina
+                    siguiente = pagina["pagina"]
+        except (BrokenProcessPool, OSError) as exc:
+            log.warning(f"[PDF] pool de procesos no disponible ({exc}); extracción secuencial")
+            _descartar_pool()
+            yield from _iter_rango(origen, siguiente, n_paginas, motor, respaldo, solo=solo)
+    finally:
+        for futuro in futuros:
+            futuro.cancel()
+
+
+def iter_texto_pdf(pdf_path, paginas_info: list | None = None, paginas=None):
+    """
+    Genera (nº de página, texto) a medida que se extraen las páginas, en
+    orden y también las que no tienen texto (texto ""). El consumidor
+    puede empezar con las primeras páginas y parar cuando quiera: al cerrar
+    el generador se liberan los documentos y se cancela el trabajo pendiente.
+
+    Args:
+        pdf_path:     Ruta al fichero PDF o stream binario ya abierto
+                      (p. ej. PdfSubido.stream(); no se cierra).
+        paginas_info: Si se pasa una lista, se le añade por página entregada
+                      {pagina, motor, segundos, caracteres, motivo}
+                      (motivo: por qué se probó el motor de respaldo, o None).
+        paginas:      Números de página (base 1) a extraer; None = todas. El
+                      resto ni se lee ni pasa por el respaldo (ver
+                      enrutador_paginas: las escaneadas van por visión).
+    """
+    solo = frozenset(paginas) if paginas is not None else None
+    if isinstance(pdf_path, str):
+        pdf_path = Path(pdf_path)
+    motor, respaldo = PDF_TEXT_ENGINE, PDF_FALLBACK_ENGINE
+    if respaldo == motor:
+        respaldo = ""
+
+    # El histograma mide solo el tiempo de extracción, no el del consumidor
+    activo, t0 = 0.0, time.perf_counter()
+    respaldadas = entregadas = 0
+    try:
+        origen = _origen(pdf_path)
+        doc = MOTORES[motor](origen)
+        try:
+            n_paginas = len(doc)
+            umbral = PDF_PARALLEL_MIN_PAGES or MOTORES[motor].paralelo_desde
+            if PDF_WORKERS < 2 or (n_paginas if solo is None else len(solo)) < umbral:
+                extraidas = _iter_rango(origen, 0, n_paginas, motor, respaldo, doc=doc, solo=solo)
+            else:
+                extraidas = _iter_paralelo(origen, n_paginas, motor, respaldo, solo)
+            for p in extraidas:
+                metrics.observar("modelia_pdf_pagina_segundos", p["segundos"], motor=p["motor"])
+                if p["motivo"]:
+                    metrics.incrementar("modelia_pdf_respaldo_total", motivo=p["motivo"])
+                respaldadas += p["motor"] != motor
+                entregadas += 1
+                if paginas_info is not None:
+                    paginas_info.append({k: v for k, v in p.items() if k != "texto"})
+                activo, t0 = activo + time.perf_counter() - t0, None
+                yield p["pagina"], p["texto"]
+                t0 = time.perf_counter()
+        finally:
+            doc.close()
+    except Exception:
+        metrics.incrementar("modelia_errores_total", etapa="pdf_extraccion")
+        raise
+    finally:
+        if t0 is not None:
+            activo += time.perf_counter() - t0
+        metrics.observar("modelia_pdf_extraccion_segundos", activo, motor=motor)
+        if respaldadas:
+            log.info(f"[PDF] {respaldadas}/{entregadas} páginas con {respaldo}")
+
+
+def unir_paginas(paginas) -> str:
+    """(nº de página, texto) → texto para el LLM con marcas "--- Página N ---"."""
+    partes = [f"--- Página {n} ---\n{texto}" for n, texto in paginas if texto.strip()]
     texto_completo = "\n\n".join(partes)
 
     # Limpiar espacios múltiples y líneas vacías excesivas
     texto_completo = re.sub(r" {2,}", " ", texto_completo)
+    texto_completo = re.sub(r"[ \t]+\n", "\n", texto_completo)
     texto_completo = re.sub(r"\n{3,}", "\n\n", texto_completo)
 
     return texto_completo.strip()
+
+
+def extraer_texto_pdf(pdf_path, paginas_info: list | None = None) -> str:
+    """
+    Extrae todo el texto del PDF, página a página (ver iter_texto_pdf).
+
+    Returns:
+        Texto plano concatenado de todas las páginas, listo para el LLM.
+    """
+    return unir_paginas(iter_texto_pdf(pdf_path, paginas_info))
@@ -0,0 +1,130 @@
+"""
+pdf_ingest.py
+Ingesta de PDFs subidos: una sola lectura por fichero.
+
+Cada subida se lee una vez, por bloques, a un buffer en memoria que pasa a
+un fichero temporal anónimo si supera INGEST_MEMORY_BYTES. En la misma
+pasada se calcula el SHA-256; al terminar se abre el documento con PyMuPDF
+una única vez para contar páginas, y ese mismo documento es el que luego
+se renderiza. pdf_extractor recibe un stream sobre el mismo buffer.
+
+Nada se escribe con nombre en disco ni se vuelve a abrir por ruta.
+
+Uso:
+    with leer_subida(request.files["pdf"]) as pdf:
+        log(pdf.sha256, pdf.paginas)
+        texto = extraer_texto_pdf(pdf.stream())      # pdf_extractor
+        imagenes = iter_base64_images(pdf.documento) # PyMuPDF
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+
+INGEST_MEMORY_BYTES = int(os.environ.get("INGEST_MEMORY_BYTES", 8 * 1024 * 1024))
+
+_BLOQUE    = 1024 * 1024
+_CABECERA  = b"%PDF-"
+_MARGEN_CABECERA = 1024      # el estándar tolera basura antes de %PDF-
+
+
+class PdfInvalido(ValueError):
+    """La subida no es un PDF legible."""
+
+
+class PdfSubido:
+    """
+    PDF ya leído: sha256, tamaño, páginas y acceso sin copias para
+    pdf_extractor (stream()) y PyMuPDF (documento). Cerrar al terminar.
+    """
+
+    def __init__(self, nombre: str, fichero, sha256: str, size: int):
+        self.nombre = nombre
+        self.sha256 = sha256
+        self.size   = size
+        self._fichero = fichero     # BytesIO o TemporaryFile anónimo
+        self._mmap = None
+        self._vista = None
+        try:
+            self.documento = fitz.open(stream=self._buffer(), filetype="pdf")
+        except Exception as exc:
+            self.close()
+            raise PdfInvalido(f"El archivo '{nombre}' no es un PDF válido ({exc}).") from exc
+        self.paginas = self.documento.page_count
+
+    def _buffer(self) -> memoryview:
+        if isinstance(self._fichero, io.BytesIO):
+            self._vista = self._fichero.getbuffer()
+        else:
+            self._mmap = mmap.mmap(self._fichero.fileno(), 0, access=mmap.ACCESS_READ)
+            self._vista = memoryview(self._mmap)
+        return self._vista
+
+    @property
+    def en_memoria(self) -> bool:
+        return self._mmap is None
+
+    def stream(self):
+        """Stream binario desde el principio (pdf_extractor no lo cierra)."""
+        self._fichero.seek(0)
+        return self._fichero
+
+    def close(self) -> None:
+        # Orden: el documento referencia la vista, la vista el mmap/BytesIO
+        documento = getattr(self, "documento", None)
+        if documento is not None and not documento.is_closed:
+            documento.close()
+        if self._vista is not None:
+            self._vista.release()
+            self._vista = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._fichero.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def leer_subida(fichero, nombre: str | None = None,
+                limite_memoria: int = INGEST_MEMORY_BYTES) -> PdfSubido:
+    """
+    Lee una subida (FileStorage de Flask o cualquier objeto con .read /
+    .stream) en una sola pasada. Lanza PdfInvalido si no es un PDF.
+    """
+    origen = getattr(fichero, "stream", fichero)
+    nombre = nombre or getattr(fichero, "filename", None) or "documento.pdf"
+
+    sha = hashlib.sha256()
+    destino = io.BytesIO()
+    size = 0
+    try:
+        while True:
+            bloque = origen.read(_BLOQUE)
+            if not bloque:
+                break
+            if size == 0 and _CABECERA not in bloque[:_MARGEN_CABECERA]:
+                raise PdfInvalido(f"El archivo '{nombre}' no es un PDF válido.")
+            sha.update(bloque)
+            size += len(bloque)
+            if isinstance(destino, io.BytesIO) and size > limite_memoria:
+                volcado = tempfile.TemporaryFile(prefix="upload_")
+                volcado.write(destino.getbuffer())
+                destino.close()
+                destino = volcado
+            destino.write(bloque)
+    except BaseException:
+        destino.close()
+        raise
+    if size == 0:
+        destino.close()
+        raise PdfInvalido(f"El archivo '{nombre}' está vacío.")
+    destino.flush()
+    return PdfSubido(nombre, destino, sha.hexdigest(), size)
@@ -0,0 +1,284 @@
+"""
+profiler.py
+Perfilado por muestreo de una petición concreta, bajo demanda.
+
+Un admin añade la cabecera "X-Profile: 1" (o ?profile=1) a una petición
+autenticada y esa petición se perfila de principio a fin: un hilo
+muestreador lee la pila de los hilos que trabajan para ella cada
+PROFILE_INTERVAL_MS y cuenta las pilas repetidas. Al terminar se guarda
+el perfil con un id que la respuesta devuelve en X-Profile-Id, y se
+consulta en /admin/profiles/<id> como árbol de llamadas (JSON) o como
+pilas plegadas ("a;b;c 42"), que flamegraph.pl y speedscope convierten en
+flamegraph.
+
+/process termina su trabajo en la cola de jobs y /comprobacion y las
+hojas reparten documentos o páginas en pools: esos hilos se suman al
+perfil porque se encolan con encolar(). El perfil se cierra cuando la
+petición y todo lo encolado desde ella han terminado (o a los
+PROFILE_MAX_SECONDS).
+
+Sin la cabecera el coste es leer un ContextVar al encolar; no hay hilo
+muestreador ni hooks de sys.setprofile.
+
+Tabla perfiles:
+    id, ruta, usuario, creado, duracion, muestras, pilas (texto plegado)
+"""
+
+import collections
+import contextvars
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+log = logging.getLogger("profiler")
+
+MODELIA_DIR = Path(__file__).resolve().parent.parent
+
+PROFILE_DB           = Path(os.environ.get("PROFILE_DB", MODELIA_DIR / "Output" / "profiles.sqlite3"))
+PROFILE_INTERVAL_MS  = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_SECONDS  = float(os.environ.get("PROFILE_MAX_SECONDS", 600))
+PROFILE_MAX_ENTRIES  = int(os.environ.get("PROFILE_MAX_ENTRIES", 200))
+
+CABECERA  = "X-Profile"
+PARAMETRO = "profile"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS perfiles (
+    id       TEXT PRIMARY KEY,
+    ruta     TEXT NOT NULL,
+    usuario  TEXT,
+    creado   REAL NOT NULL,
+    duracion REAL NOT NULL,
+    muestras INTEGER NOT NULL,
+    pilas    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS perfiles_creado ON perfiles (creado);
+"""
+
+_actual: contextvars.ContextVar = contextvars.ContextVar("perfil_actual", default=None)
+
+
+def pedido(request) -> bool:
+    """True si la petición pide perfilarse (cabecera o parámetro)."""
+    valor = request.headers.get(CABECERA) or request.args.get(PARAMETRO)
+    return bool(valor) and valor.strip().lower() in ("1", "true", "yes")
+
+
+def _marco(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# ── Perfil en curso ───────────────────────────────────────────────────────────
+
+class Perfil:
+    """
+    Muestreo de los hilos apuntados con entrar_hilo(). La petición y cada
+    tarea encolada toman una referencia (reservar) y la sueltan al acabar;
+    con cero referencias se para el muestreador y se guarda.
+    """
+
+    def __init__(self, ruta: str, usuario: str | None, almacen_: "ProfileStore"):
+        self.id      = uuid.uuid4().hex
+        self.ruta    = ruta
+        self.usuario = usuario
+        self._almacen = almacen_
+        self._lock = threading.Lock()
+        self._hilos: collections.Counter = collections.Counter()   # ident -> nº de entradas
+        self._refs = 0
+        self._pilas: collections.Counter = collections.Counter()
+        self._muestras = 0
+        self._fin = threading.Event()
+        self._inicio = time.perf_counter()
+        self._creado = time.time()
+        self._muestreador = threading.Thread(target=self._muestrear, name=f"profile-{self.id[:8]}",
+                                             daemon=True)
+
+    def iniciar(self) -> None:
+        log.info(f"[PROFILE] {self.id} {self.ruta} ({self.usuario})")
+        self._muestreador.start()
+
+    def reservar(self) -> None:
+        """Una referencia más, antes de saber en qué hilo correrá."""
+        with self._lock:
+            self._refs += 1
+
+    def soltar(self) -> None:
+        with self._lock:
+            self._refs -= 1
+            terminado = self._refs <= 0
+        if terminado:
+            self._fin.set()
+
+    def entrar_hilo(self) -> None:
+        with self._lock:
+            self._hilos[threading.get_ident()] += 1
+
+    def salir_hilo(self) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            self._hilos[ident] -= 1
+            if self._hilos[ident] <= 0:
+                del self._hilos[ident]
+
+    def _muestrear(self) -> None:
+        intervalo = PROFILE_INTERVAL_MS / 1000
+        limite = self._inicio + PROFILE_MAX_SECONDS
+        nombres = {}
+        while not self._fin.wait(intervalo):
+            if time.perf_counter() > limite:
+                log.warning(f"[PROFILE] {self.id} cortado a los {PROFILE_MAX_SECONDS:.0f} s")
+                break
+            with self._lock:
+                hilos = list(self._hilos)
+            frames = sys._current_frames()
+            for ident in hilos:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                pila = []
+                while frame is not None:
+                    pila.append(_marco(frame))
+                    frame = frame.f_back
+                if ident not in nombres:
+                    vivos = {h.ident: h.name for h in threading.enumerate()}
+                    nombres[ident] = f"hilo {vivos.get(ident, ident)}"
+                pila.append(nombres[ident])
+                self._pilas[";".join(reversed(pila))] += 1
+            self._muestras += 1
+        self._guardar()
+
+    def _guardar(self) -> None:
+        duracion = time.perf_counter() - self._inicio
+        plegado = "\n".join(f"{pila} {n}" for pila, n in self._pilas.most_common())
+        try:
+            self._almacen.guardar(self.id, self.ruta, self.usuario, self._creado,
+                                  duracion, self._muestras, plegado)
+            log.info(f"[PROFILE] {self.id} guardado: {self._muestras} muestras en {duracion:.2f} s")
+        except sqlite3.Error as exc:
+            log.warning(f"[PROFILE] {self.id} no guardado ({exc})")
+
+
+@contextmanager
+def perfilar(ruta: str, usuario: str | None = None):
+    """Perfila el bloque (y lo que se encole con encolar()) en el hilo actual."""
+    perfil = Perfil(ruta, usuario, almacen)
+    perfil.reservar()
+    perfil.entrar_hilo()
+    token = _actual.set(perfil)
+    perfil.iniciar()
+    try:
+        yield perfil
+    finally:
+        _actual.reset(token)
+        perfil.salir_hilo()
+        perfil.soltar()
+
+
+def _en_hilo(perfil: Perfil, fn, *args):
+    perfil.entrar_hilo()
+    try:
+        return fn(*args)
+    finally:
+        perfil.salir_hilo()
+        perfil.soltar()
+
+
+def encolar(pool, fn, *args):
+    """
+    pool.submit(fn, *args) en una copia del contexto actual (como
+    contextvars.copy_context().run). Si hay un perfil en curso, el hilo que
+    ejecute fn también se muestrea y el perfil espera a que termine; un
+    futuro cancelado antes de empezar lo libera.
+    """
+    ctx = contextvars.copy_context()
+    perfil = _actual.get()
+    if perfil is None:
+        return pool.submit(ctx.run, fn, *args)
+    perfil.reservar()
+    futuro = pool.submit(ctx.run, _en_hilo, perfil, fn, *args)
+    futuro.add_done_callback(lambda f: f.cancelled() and perfil.soltar())
+    return futuro
+
+
+# ── Almacén ───────────────────────────────────────────────────────────────────
+
+def arbol(plegado: str) -> dict:
+    """Árbol de llamadas {nombre, total, propio, hijos} a partir de pilas plegadas."""
+    raiz = {"nombre": "total", "total": 0, "propio": 0, "hijos": {}}
+    for linea in plegado.splitlines():
+        pila, _, n = linea.rpartition(" ")
+        n = int(n)
+        raiz["total"] += n
+        nodo = raiz
+        for marco in pila.split(";"):
+            nodo = nodo["hijos"].setdefault(marco, {"nombre": marco, "total": 0,
+                                                    "propio": 0, "hijos": {}})
+            nodo["total"] += n
+        nodo["propio"] += n
+
+    def ordenar(nodo):
+        nodo["hijos"] = sorted((ordenar(h) for h in nodo["hijos"].values()),
+                               key=lambda h: h["total"], reverse=True)
+        return nodo
+    return ordenar(raiz)
+
+
+class ProfileStore:
+    def __init__(self, db_path: Path, max_entries: int = PROFILE_MAX_ENTRIES):
+        self.db_path     = Path(db_path)
+        self.max_entries = max_entries
+        self._schema_ok = False
+
+    @contextmanager
+    def _conn(self):
+        if not self._schema_ok:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._schema_ok:
+                conn.executescript(_SCHEMA)
+                self._schema_ok = True
+            yield conn
+        finally:
+            conn.close()
+
+    def guardar(self, id_: str, ruta: str, usuario: str | None, creado: float,
+                duracion: float, muestras: int, pilas: str) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO perfiles (id, ruta, usuario, creado, duracion, muestras, pilas) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (id_, ruta, usuario, creado, duracion, muestras, pilas),
+            )
+            conn.execute(
+                "DELETE FROM perfiles WHERE id NOT IN "
+                "(SELECT id FROM perfiles ORDER BY creado DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def listar(self, limite: int = 50) -> list[dict]:
+        with self._conn() as conn:
+            rows = conn.execute(
+                "SELECT id, ruta, usuario, creado, duracion, muestras FROM perfiles "
+                "ORDER BY creado DESC LIMIT ?",
+                (limite,),
+            ).fetchall()
+        return [dict(r, duracion=round(r["duracion"], 3)) for r in rows]
+
+    def obtener(self, id_: str) -> dict | None:
+        with self._conn() as conn:
+            row = conn.execute("SELECT * FROM perfiles WHERE id = ?", (id_,)).fetchone()
+        return dict(row) if row else None
+
+
+almacen = ProfileStore(PROFILE_DB)
@@ -0,0 +1,181 @@
+"""
+rate_limiter.py
+Limitador de peticiones por token bucket, compartido entre workers.
+
+Cada clave (IP, usuario) tiene un cubo de RATE_LIMIT_BURST fichas que se
+rellena a RATE_LIMIT_PER_MINUTE fichas por minuto. Una petición consume
+una ficha de cada una de sus claves y solo pasa si todas tienen ficha.
+Cada actualización es O(1): el estado por clave es (fichas, instante).
+
+Un cubo que lleva más tiempo inactivo del que tarda en llenarse equivale a
+uno nuevo, así que se borra en la purga periódica; el estado no crece con
+el número de IPs vistas.
+
+Backends (RATE_LIMIT_BACKEND):
+    sqlite   tabla compartida en WAL: todos los workers de gunicorn
+             aplican un único límite (por defecto)
+    memoria  dict en proceso: cada worker lleva su propia cuenta
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import metrics
+
+log = logging.getLogger("rate_limiter")
+
+MODELIA_DIR = Path(__file__).resolve().parent.parent
+
+RATE_LIMIT_BACKEND    = os.environ.get("RATE_LIMIT_BACKEND", "sqlite").strip().lower()
+RATE_LIMIT_DB         = Path(os.environ.get("RATE_LIMIT_DB", MODELIA_DIR / "Output" / "ratelimit.sqlite3"))
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", 5))
+RATE_LIMIT_BURST      = float(os.environ.get("RATE_LIMIT_BURST", RATE_LIMIT_PER_MINUTE))
+
+_PURGE_INTERVAL = 60      # s entre purgas de cubos inactivos por proceso
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    clave   TEXT PRIMARY KEY,
+    fichas  REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated);
+"""
+
+
+def _rellenar(fichas: float, updated: float, ahora: float,
+              capacidad: float, tasa: float) -> float:
+    return min(capacidad, fichas + (ahora - updated) * tasa)
+
+
+# ── Backends ──────────────────────────────────────────────────────────────────
+
+class MemoriaBackend:
+    """Cubos en un dict del proceso."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cubos: dict[str, tuple[float, float]] = {}   # clave -> (fichas, updated)
+
+    def consumir(self, claves, ahora: float, capacidad: float, tasa: float) -> bool:
+        with self._lock:
+            niveles = [
+                _rellenar(*self._cubos.get(c, (capacidad, ahora)), ahora, capacidad, tasa)
+                for c in claves
+            ]
+            permitido = all(n >= 1 for n in niveles)
+            for c, n in zip(claves, niveles):
+                self._cubos[c] = (n - 1 if permitido else n, ahora)
+            return permitido
+
+    def purgar(self, antes: float) -> int:
+        with self._lock:
+            viejas = [c for c, (_, updated) in self._cubos.items() if updated < antes]
+            for c in viejas:
+                del self._cubos[c]
+        return len(viejas)
+
+
+class SQLiteBackend:
+    """Cubos en una tabla SQLite (WAL) compartida por todos los procesos."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        """
+        Una conexión por hilo y proceso, reutilizada: esto corre en cada
+        petición y abrir la base cuesta más que la propia actualización.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def consumir(self, claves, ahora: float, capacidad: float, tasa: float) -> bool:
+        conn = self._conn()
+        # BEGIN IMMEDIATE: lectura y escritura de los cubos sin carreras
+        # entre workers
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            niveles = []
+            for c in claves:
+                row = conn.execute(
+                    "SELECT fichas, updated FROM buckets WHERE clave = ?", (c,)
+                ).fetchone()
+                niveles.append(_rellenar(*(row or (capacidad, ahora)), ahora, capacidad, tasa))
+            permitido = all(n >= 1 for n in niveles)
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (clave, fichas, updated) VALUES (?, ?, ?)",
+                [(c, n - 1 if permitido else n, ahora) for c, n in zip(claves, niveles)],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return permitido
+
+    def purgar(self, antes: float) -> int:
+        return self._conn().execute("DELETE FROM buckets WHERE updated < ?", (antes,)).rowcount
+
+
+# ── Limitador ─────────────────────────────────────────────────────────────────
+
+class RateLimiter:
+    def __init__(self, backend, por_minuto: float = RATE_LIMIT_PER_MINUTE,
+                 rafaga: float = RATE_LIMIT_BURST):
+        self.backend   = backend
+        self.capacidad = rafaga
+        self.tasa      = por_minuto / 60.0
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def permitir(self, *claves: str) -> bool:
+        """
+        Consume una ficha de cada clave si todas tienen; True si la
+        petición pasa. Un fallo del backend no bloquea el servicio.
+        """
+        ahora = time.time()
+        try:
+            permitido = self.backend.consumir(claves, ahora, self.capacidad, self.tasa)
+        except sqlite3.Error as exc:
+            log.warning(f"[RATE] backend no disponible ({exc}); petición permitida")
+            return True
+        self._maybe_purge(ahora)
+        if not permitido:
+            log.info(f"[RATE] limitado: {', '.join(claves)}")
+            metrics.incrementar("modelia_rate_limit_rechazos_total")
+        return permitido
+
+    def _maybe_purge(self, ahora: float) -> None:
+        with self._lock:
+            if ahora - self._last_purge < _PURGE_INTERVAL:
+                return
+            self._last_purge = ahora
+        # Tras capacidad/tasa segundos sin uso el cubo está lleno: sobra
+        try:
+            self.backend.purgar(ahora - self.capacidad / self.tasa)
+        except sqlite3.Error as exc:
+            log.warning(f"[RATE] purga fallida: {exc}")
+
+
+def crear_backend(nombre: str = RATE_LIMIT_BACKEND):
+    if nombre == "memoria":
+        return MemoriaBackend()
+    if nombre == "sqlite":
+        return SQLiteBackend(RATE_LIMIT_DB)
+    raise ValueError(f"RATE_LIMIT_BACKEND desconocido: {nombre!r}")
+
+
+limiter = RateLimiter(crear_backend())
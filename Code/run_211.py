@@ -6,11 +6,22 @@ Uso (desde la raíz del proyecto MODELIA/):
     python3 Code/run_211.py
     python3 Code/run_211.py Input/datos_211.json
     python3 Code/run_211.py Input/datos_211.json Output/
+    python3 Code/run_211.py Input/datos_211.json Output/ --diagnostico -v
+    python3 Code/run_211.py --batch Input/campana_2025/ --workers 8
+    python3 Code/run_211.py --batch declaraciones.jsonl Output/lote/
+    python3 Code/run_211.py validate Archivo/2024/ Archivo/2025/ --workers 8
+    python3 Code/run_211.py read Archivo/2025/211_2914_Y5732237F.txt > datos.json
 """
 
+import argparse
+import json
+import logging
 import sys
 from pathlib import Path
 
+from modelo211_batch import generar_lote
+from modelo211_reader import leer_archivo
+from modelo211_validator import validar_archivo
 from modelo211_generator import (
     parse_csv_page,
     generar_modelo211,
@@ -116,17 +127,130 @@ def verificar_spot(texto_final: str, datos_json_path: Path):
 #  PUNTO DE ENTRADA
 # ─────────────────────────────────────────────────────────────
 
+def _entero_positivo(texto: str) -> int:
+    """Tipo de argparse para --workers: entero >= 1."""
+    try:
+        n = int(texto)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"no es un entero: {texto!r}")
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"debe ser al menos 1: {n}")
+    return n
+
+
+def ejecutar_lote(entrada: Path, output_path: Path | None, workers: int | None):
+    print("\n" + "=" * 60)
+    print("  GENERACIÓN POR LOTES — MODELO 211")
+    print("=" * 60)
+    resumen = generar_lote(entrada, output_path, workers=workers)
+
+    for d in resumen["declaraciones"]:
+        if not d["ok"]:
+            detalle = d.get("error") or f"{len(d['campos_error'])} campo(s) con error"
+            print(f"  [✗] {d['origen']}: {detalle}")
+
+    print(f"\n  Declaraciones : {resumen['total']}")
+    print(f"  Correctas     : {resumen['ok']}")
+    print(f"  Con errores   : {resumen['con_errores']}")
+    print(f"  Workers       : {resumen['workers']}")
+    print(f"  Tiempo        : {resumen['segundos']} s")
+    print(f"  Salida        : {resumen['salida']}")
+    print(f"  Resumen       : resumen_lote.json")
+    print("=" * 60)
+
+
+def validar(argv: list) -> int:
+    """Subcomando validate: valida ficheros 211 existentes y emite informe."""
+    parser = argparse.ArgumentParser(prog="run_211.py validate",
+                                     description="Valida ficheros 211.txt contra los CSVs de KB/")
+    parser.add_argument("rutas", nargs="+", type=Path,
+                        help="ficheros 211 o directorios (se recorren *.txt)")
+    parser.add_argument("--workers", type=_entero_positivo, default=None, metavar="N",
+                        help="procesos del pool (por defecto: nº de CPUs)")
+    parser.add_argument("--jsonl", action="store_true",
+                        help="una línea JSON por fichero en lugar del informe de texto")
+    args = parser.parse_args(argv)
+
+    total = erroneos = 0
+    for res in validar_archivo(args.rutas, workers=args.workers):
+        total += 1
+        if not res["ok"]:
+            erroneos += 1
+        if args.jsonl:
+            print(json.dumps(res, ensure_ascii=False))
+        elif not res["ok"]:
+            print(f"  [✗] {res['fichero']}")
+            for e in res["errores"]:
+                campo = f"campo {e['campo']:3d}" if e["campo"] is not None else "        "
+                pagina = f"pág {e['pagina']}" if e["pagina"] else "       "
+                print(f"        {pagina} {campo} pos={e['posicion']:5d}  {e['motivo']}  '{e['valor']}'")
+
+    if not args.jsonl:
+        print(f"\n  Ficheros validados : {total}")
+        print(f"  Correctos          : {total - erroneos}")
+        print(f"  Con errores        : {erroneos}")
+    return 1 if erroneos else 0
+
+
+def leer(argv: list) -> int:
+    """Subcomando read: 211.txt → JSON (JSONL si se leen varios ficheros)."""
+    parser = argparse.ArgumentParser(prog="run_211.py read",
+                                     description="Convierte ficheros 211 de vuelta a JSON")
+    parser.add_argument("rutas", nargs="+", type=Path,
+                        help="ficheros 211 o directorios (se recorren *.txt)")
+    args = parser.parse_args(argv)
+    un_fichero = len(args.rutas) == 1 and args.rutas[0].is_file()
+
+    fallos = 0
+    for fichero, datos, error in leer_archivo(args.rutas):
+        if error:
+            fallos += 1
+            print(f"  [✗] {fichero}: {error}", file=sys.stderr)
+        elif un_fichero:
+            print(json.dumps(datos, ensure_ascii=False, indent=2))
+        else:
+            print(json.dumps({"fichero": str(fichero), "datos": datos}, ensure_ascii=False))
+    return 1 if fallos else 0
+
+
 def main():
-    datos_path  = Path(sys.argv[1]) if len(sys.argv) > 1 \
-                  else MODELIA_DIR / "Input" / "datos_211_poulsen_perkins.json"
-    output_path = Path(sys.argv[2]) if len(sys.argv) > 2 \
-                  else MODELIA_DIR / "Output"
+    if len(sys.argv) > 1 and sys.argv[1] == "validate":
+        sys.exit(validar(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "read":
+        sys.exit(leer(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(description="Generador del Modelo 211 (AEAT)")
+    parser.add_argument("datos", nargs="?", type=Path, default=None,
+                        help="JSON de entrada (en modo --batch: directorio de salida)")
+    parser.add_argument("output", nargs="?", type=Path, default=None,
+                        help="directorio de salida")
+    parser.add_argument("--batch", type=Path, metavar="ENTRADA",
+                        help="directorio con *.json o fichero .jsonl a generar en lote")
+    parser.add_argument("--workers", type=_entero_positivo, default=None, metavar="N",
+                        help="procesos del pool en modo --batch (por defecto: nº de CPUs)")
+    parser.add_argument("--diagnostico", action="store_true",
+                        help="diagnostico_<pagina>.json con todos los campos, no solo los erróneos")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="detalle por página del generador")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(message)s",
+    )
+
+    if args.batch is not None:
+        ejecutar_lote(args.batch, args.output or args.datos, args.workers)
+        return
+
+    datos_path  = args.datos or MODELIA_DIR / "Input" / "datos_211_poulsen_perkins.json"
+    output_path = args.output or MODELIA_DIR / "Output"
 
     # 1. Verificar parseo de CSVs
     verificar_csvs()
 
     # 2. Generar modelo
-    texto_final = generar_modelo211(datos_path, output_path)
+    texto_final = generar_modelo211(datos_path, output_path, args.diagnostico)
 
     # 3. Verificaciones spot (si aplica)
     verificar_spot(texto_final, datos_path)
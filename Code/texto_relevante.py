@@ -0,0 +1,171 @@
+"""
+texto_relevante.py
+Poda de páginas sin datos antes de enviar una escritura al LLM.
+
+Una escritura de 30-60 páginas lleva advertencias legales, anexos,
+certificaciones catastrales y cláusulas de protección de datos que nunca
+contienen un campo del 211, y el tamaño del prompt es lo que más pesa en
+la latencia y en la factura de GPT-4o.
+
+Cada página ("--- Página N ---", ver pdf_extractor.unir_paginas) se puntúa
+con señales locales: NIF/NIE, referencia catastral, IBAN, "comparecen",
+"precio", "protocolo", "no residente"... Se envían las páginas que llegan
+a PODA_UMBRAL, más PODA_MARGEN páginas a cada lado (un dato puede empezar
+al final de la página anterior); toda página con algún IDENTIFICADOR
+(NIF/NIE, referencia catastral, IBAN, importe, "comparece", "precio"),
+puntúe lo que puntúe; siempre las PODA_PAGINAS_INICIO primeras (notario,
+fecha, protocolo, comparecientes) y el texto anterior a la primera marca.
+Los huecos se marcan en el texto para que el modelo sepa que falta
+contenido.
+
+Salvaguardas: no se poda por debajo de PODA_MIN_PAGINAS páginas, ni si
+ninguna página puntúa, ni si el ahorro no llega a PODA_AHORRO_MINIMO.
+
+Configuración:
+    LLM_PODA_DISABLED        1 = enviar siempre el texto completo
+    PODA_UMBRAL              puntuación a partir de la que se conservan
+                             también las páginas vecinas (3)
+    PODA_MARGEN              páginas vecinas que se conservan (1)
+    PODA_PAGINAS_INICIO      primeras páginas que se envían siempre (2)
+    PODA_MIN_PAGINAS         documentos más cortos no se podan (5)
+    PODA_AHORRO_MINIMO       fracción mínima de texto ahorrado (0.15)
+"""
+
+import logging
+import os
+import re
+
+import metrics
+
+log = logging.getLogger("texto_relevante")
+
+PODA_ENABLED        = os.environ.get("LLM_PODA_DISABLED", "").strip().lower() not in ("1", "true", "yes")
+PODA_UMBRAL         = int(os.environ.get("PODA_UMBRAL", 3))
+PODA_MARGEN         = int(os.environ.get("PODA_MARGEN", 1))
+PODA_PAGINAS_INICIO = int(os.environ.get("PODA_PAGINAS_INICIO", 2))
+PODA_MIN_PAGINAS    = int(os.environ.get("PODA_MIN_PAGINAS", 5))
+PODA_AHORRO_MINIMO  = float(os.environ.get("PODA_AHORRO_MINIMO", 0.15))
+
+# Estimación para español con el tokenizador de GPT-4o (sin tiktoken)
+CARACTERES_POR_TOKEN = 4
+
+_MARCA_PAGINA = re.compile(r"^--- Página (\d+) ---$", re.MULTILINE)
+
+# Identificadores y datos que el 211 necesita: una página con alguno no se
+# poda nunca, puntúe lo que puntúe (ver con_datos)
+IDENTIFICADORES = [
+    (re.compile(r"\b[XYZ][-\s]?\d{7}[-\s]?[A-Z]\b"), 3),                     # NIE
+    (re.compile(r"\b\d{8}[-\s]?[A-Z]\b"), 3),                                 # NIF
+    (re.compile(r"\b[ABCDEFGHJNPQRSUVW]\d{7}[0-9A-J]\b"), 2),                 # CIF
+    (re.compile(r"\b\d{7}[A-Z]{2}\d{4}[A-Z]\d{4}[A-Z]{2}\b"), 3),             # ref. catastral
+    (re.compile(r"\b[A-Z]{2}\d{2}(?:\s?[A-Z0-9]{4}){4,7}\b"), 3),             # IBAN
+    (re.compile(r"\d{1,3}(?:\.\d{3})+(?:,\d{2})?\s*(?:€|euros)", re.I), 2),   # importes
+    (re.compile(r"\bcomparece", re.I), 3),
+    (re.compile(r"\bprecio\b", re.I), 3),
+]
+# (patrón, peso); cada patrón puntúa una vez por página. Las palabras
+# sueltas (notario, finca, vender...) salen en casi todas las páginas de
+# una escritura: solo cuentan para la puntuación
+SENALES = IDENTIFICADORES + [
+    (re.compile(r"referencia\s+catastral", re.I), 3),
+    (re.compile(r"\bprotocolo\b", re.I), 2),
+    (re.compile(r"\bno\s+residente", re.I), 2),
+    (re.compile(r"\breten(ción|cion|er)\b", re.I), 2),
+    (re.compile(r"\bpasaporte\b", re.I), 2),
+    (re.compile(r"\bnacid[oa]\b|fecha\s+de\s+nacimiento", re.I), 2),
+    (re.compile(r"\b(vend|compr|transmit|adquir)\w*", re.I), 1),
+    (re.compile(r"\b(domicili|residen)\w*", re.I), 1),
+    (re.compile(r"\b(finca|urbana|vivienda|inmueble)\b", re.I), 1),
+    (re.compile(r"\bnotari[oa]\b", re.I), 1),
+]
+# Texto de relleno: resta aunque mencione de pasada a las partes
+RUIDO = [
+    (re.compile(r"protecci[oó]n\s+de\s+datos", re.I), -3),
+    (re.compile(r"reglamento\s+\(?ue\)?", re.I), -2),
+    (re.compile(r"certificaci[oó]n\s+catastral\s+descriptiva", re.I), -2),
+]
+
+
+def tokens_estimados(texto: str) -> int:
+    return -(-len(texto) // CARACTERES_POR_TOKEN)
+
+
+def puntuar(texto: str) -> int:
+    """Puntuación de relevancia de una página."""
+    return sum(peso for patron, peso in SENALES + RUIDO if patron.search(texto))
+
+
+def con_datos(texto: str) -> bool:
+    """True si la página tiene algún IDENTIFICADOR, pese al ruido."""
+    return any(patron.search(texto) for patron, _ in IDENTIFICADORES)
+
+
+def _paginas(texto: str) -> list[tuple[int, str]]:
+    """(nº de página, bloque con su marca) en orden; [] si no hay marcas."""
+    marcas = list(_MARCA_PAGINA.finditer(texto))
+    if not marcas:
+        return []
+    fines = [m.start() for m in marcas[1:]] + [len(texto)]
+    return [(int(m.group(1)), texto[m.start():fin].strip()) for m, fin in zip(marcas, fines)]
+
+
+def _hueco(desde: int, hasta: int) -> str:
+    rango = f"{desde}" if desde == hasta else f"{desde}-{hasta}"
+    return f"[... página(s) {rango} omitida(s): sin datos relevantes ...]"
+
+
+def podar(texto: str, tipo: str = "") -> tuple[str, dict]:
+    """
+    Devuelve (texto a enviar, informe). El informe lleva paginas,
+    paginas_enviadas, tokens_originales, tokens_enviados y
+    tokens_ahorrados (estimados); si no se poda, el texto es el original.
+    """
+    paginas = _paginas(texto)
+    informe = {
+        "paginas": len(paginas),
+        "paginas_enviadas": len(paginas),
+        "tokens_originales": tokens_estimados(texto),
+        "tokens_enviados": tokens_estimados(texto),
+        "tokens_ahorrados": 0,
+    }
+    if not PODA_ENABLED or len(paginas) < PODA_MIN_PAGINAS:
+        return texto, informe
+
+    relevantes = [i for i, (_, bloque) in enumerate(paginas) if puntuar(bloque) >= PODA_UMBRAL]
+    if not relevantes:
+        log.info(f"[PODA] {tipo}: ninguna página puntúa; se envía completo")
+        return texto, informe
+
+    conservar = set(range(min(PODA_PAGINAS_INICIO, len(paginas))))
+    conservar.update(i for i, (_, bloque) in enumerate(paginas) if con_datos(bloque))
+    for i in relevantes:
+        conservar.update(range(max(0, i - PODA_MARGEN), min(len(paginas), i + PODA_MARGEN + 1)))
+
+    # Lo que va antes de la primera marca (p. ej. una cabecera) no se poda
+    preambulo = texto[:_MARCA_PAGINA.search(texto).start()].strip()
+    partes, omitidas = [preambulo] if preambulo else [], []
+    for i, (numero, bloque) in enumerate(paginas):
+        if i in conservar:
+            if omitidas:
+                partes.append(_hueco(omitidas[0], omitidas[-1]))
+                omitidas = []
+            partes.append(bloque)
+        else:
+            omitidas.append(numero)
+    if omitidas:
+        partes.append(_hueco(omitidas[0], omitidas[-1]))
+    podado = "\n\n".join(partes)
+
+    if len(podado) > len(texto) * (1 - PODA_AHORRO_MINIMO):
+        return texto, informe
+
+    informe.update(
+        paginas_enviadas=len(conservar),
+        tokens_enviados=tokens_estimados(podado),
+    )
+    informe["tokens_ahorrados"] = informe["tokens_originales"] - informe["tokens_enviados"]
+    metrics.incrementar("modelia_llm_tokens_podados_total", informe["tokens_ahorrados"], tipo=tipo)
+    log.info(f"[PODA] {tipo}: {len(conservar)}/{len(paginas)} páginas, "
+             f"~{informe['tokens_ahorrados']} tokens ahorrados "
+             f"({informe['tokens_originales']} → {informe['tokens_enviados']})")
+    return podado, informe
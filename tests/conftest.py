@@ -0,0 +1,6 @@
+"""Los módulos de Code/ se importan por nombre, como en app.py."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Code"))
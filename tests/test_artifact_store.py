@@ -0,0 +1,70 @@
+import os
+import time
+
+import pytest
+
+import artifact_store
+from artifact_store import ArtifactStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(tmp_path, ttl=3600, max_bytes=1024 * 1024)
+
+
+def _envejecer(path, segundos):
+    t = time.time() - segundos
+    os.utime(path, (t, t))
+
+
+def test_get_caducado_por_ttl(store, tmp_path):
+    job_id = store.put(b"211 contenido")
+    assert store.get(job_id) is not None
+
+    _envejecer(tmp_path / "jobs" / f"{job_id}.json", 3601)
+    assert store.get(job_id) is None
+
+
+def test_evict_borra_el_job_caducado_y_su_blob(store, tmp_path):
+    job_id = store.put(b"211 contenido")
+    blob, meta = store.get(job_id)
+    _envejecer(tmp_path / "jobs" / f"{job_id}.json", 3601)
+    _envejecer(blob, artifact_store._BLOB_GRACE + 1)
+
+    store.evict()
+    assert not (tmp_path / "jobs" / f"{job_id}.json").exists()
+    assert not blob.exists()
+
+
+def test_evict_respeta_la_gracia_de_un_blob_sin_job(store, tmp_path):
+    job_id = store.put(b"211 contenido")
+    blob, _ = store.get(job_id)
+    # El blob ya está escrito pero su .json aún no (put en curso en otro worker)
+    (tmp_path / "jobs" / f"{job_id}.json").unlink()
+
+    store.evict()
+    assert blob.exists()
+
+    _envejecer(blob, artifact_store._BLOB_GRACE + 1)
+    store.evict()
+    assert not blob.exists()
+
+
+def test_blob_compartido_sobrevive_mientras_otro_job_lo_use(store, tmp_path):
+    viejo = store.put(b"mismo 211")
+    nuevo = store.put(b"mismo 211")
+    blob, _ = store.get(nuevo)
+    _envejecer(tmp_path / "jobs" / f"{viejo}.json", 3601)
+    _envejecer(blob, artifact_store._BLOB_GRACE + 1)
+
+    store.evict()
+    assert store.get(viejo) is None
+    assert store.get(nuevo) is not None
+
+
+def test_get_solo_devuelve_el_artefacto_a_su_dueno(store):
+    job_id = store.put(b"211 contenido", owner="ana")
+
+    assert store.get(job_id, "ana") is not None
+    assert store.get(job_id, "luis") is None
+    assert store.get(job_id) is None
@@ -0,0 +1,10 @@
+import auth
+
+
+def test_es_admin_ignora_mayusculas_y_espacios(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", {"ana@notaria.es"})
+
+    assert auth.es_admin({"email": "Ana@Notaria.ES "})
+    assert not auth.es_admin({"email": "luis@notaria.es"})
+    assert not auth.es_admin({"email": None})
+    assert not auth.es_admin(None)
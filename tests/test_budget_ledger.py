@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+import budget_ledger
+from budget_ledger import BudgetLedger
+
+
+def _respuesta(prompt: int, completion: int = 0, cached: int = 0):
+    """Respuesta de chat.completions con solo lo que lee registrar()."""
+    return SimpleNamespace(
+        model="gpt-4o",
+        usage=SimpleNamespace(
+            prompt_tokens=prompt,
+            completion_tokens=completion,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+        ),
+    )
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return BudgetLedger(tmp_path / "budget.sqlite3", diario_eur=1.0, usuario_eur=0.5)
+
+
+def _gastar(ledger, usuario, prompt):
+    with budget_ledger.contexto("/process", usuario):
+        return ledger.registrar(_respuesta(prompt), "gpt-4o")
+
+
+def test_coste_con_tokens_cacheados():
+    # gpt-4o: 2.30 € por millón de entrada, 1.15 cacheada, 9.20 de salida
+    coste = budget_ledger.coste_eur("gpt-4o", 1_000_000, 100_000, cached=500_000)
+    assert coste == pytest.approx(1.15 + 0.575 + 0.92)
+
+
+def test_limite_por_usuario(ledger):
+    assert _gastar(ledger, "ana", 250_000) == pytest.approx(0.575)
+
+    assert not ledger.permitir("ana")
+    assert ledger.permitir("luis")
+    assert ledger.gastado_hoy("ana") == pytest.approx(0.575)
+    assert ledger.gastado_hoy("luis") == 0
+
+
+def test_limite_global_para_todos(ledger):
+    _gastar(ledger, "ana", 200_000)
+    _gastar(ledger, "luis", 200_000)
+    _gastar(ledger, "marta", 100_000)
+
+    assert ledger.gastado_hoy() == pytest.approx(1.15)
+    assert not ledger.permitir("pedro")
+    assert not ledger.permitir()
+
+
+def test_sin_limite_por_usuario(tmp_path):
+    ledger = BudgetLedger(tmp_path / "budget.sqlite3", diario_eur=1.0, usuario_eur=0)
+    _gastar(ledger, "ana", 300_000)
+    assert ledger.permitir("ana")
+
+
+def test_disponible_es_el_menor_margen(ledger):
+    _gastar(ledger, "ana", 100_000)         # 0.23 €
+    _gastar(ledger, "luis", 150_000)        # 0.345 €
+
+    assert ledger.disponible("ana") == pytest.approx(0.5 - 0.23)
+    assert ledger.disponible("marta") == pytest.approx(1.0 - 0.575)
+    _gastar(ledger, "luis", 100_000)
+    assert ledger.disponible("luis") == 0
@@ -0,0 +1,72 @@
+import io
+
+import fitz
+import pytest
+
+import budget_ledger
+import enrutador_paginas
+from enrutador_paginas import IMAGEN, TEXTO, leer_paginas
+from pdf_ingest import leer_subida
+
+
+class _Subida(io.BytesIO):
+    filename = "escritura.pdf"
+
+
+def _pdf_mixto() -> bytes:
+    """Dos páginas con capa de texto y tres escaneadas (una imagen a página completa)."""
+    doc = fitz.open()
+    for n in (1, 2):
+        page = doc.new_page(width=595, height=842)
+        page.insert_textbox(fitz.Rect(50, 50, 545, 800),
+                            f"Página digital {n}. " + "Texto notarial de la escritura. " * 20)
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 60, 80), False)
+    pix.set_rect(pix.irect, (200, 200, 200))
+    for _ in range(3):
+        page = doc.new_page(width=595, height=842)
+        page.insert_image(page.rect, pixmap=pix)
+    datos = doc.tobytes()
+    doc.close()
+    return datos
+
+
+@pytest.fixture
+def subida(tmp_path, monkeypatch):
+    monkeypatch.setattr(budget_ledger, "ledger",
+                        budget_ledger.BudgetLedger(tmp_path / "budget.sqlite3"))
+    monkeypatch.setattr(enrutador_paginas, "renderizar_pagina",
+                        lambda page, dpi=72: f"png-{page.number + 1}")
+    pdf = leer_subida(_Subida(_pdf_mixto()))
+    yield pdf
+    pdf.close()
+
+
+def test_una_pagina_de_vision_fallida_no_tira_el_documento(subida, monkeypatch):
+    def transcribir(client, img_b64, usar_cache=True):
+        if img_b64 == "png-4":
+            raise TimeoutError("OpenAI no respondió")
+        return f"transcripción de {img_b64}"
+    monkeypatch.setattr(enrutador_paginas, "transcribir_pagina", transcribir)
+
+    info = []
+    paginas = dict(leer_paginas(subida, "sk-test", paginas_info=info))
+
+    assert sorted(paginas) == [1, 2, 3, 5]
+    assert paginas[5] == "transcripción de png-5"
+    assert "Página digital 1" in paginas[1]
+    por_pagina = {i["pagina"]: i for i in info}
+    assert [por_pagina[n]["ruta"] for n in (1, 2, 3)] == [TEXTO, TEXTO, IMAGEN]
+    assert por_pagina[4]["motivo"] == "error_vision"
+    assert por_pagina[4]["caracteres"] == 0
+
+
+def test_sin_presupuesto_no_se_transcribe_ninguna(subida, monkeypatch):
+    budget_ledger.ledger.diario_eur = 0.01
+    llamadas = []
+    monkeypatch.setattr(enrutador_paginas, "transcribir_pagina",
+                        lambda client, img_b64, usar_cache=True: llamadas.append(img_b64))
+
+    paginas = dict(leer_paginas(subida, "sk-test"))
+
+    assert sorted(paginas) == [1, 2]
+    assert llamadas == []
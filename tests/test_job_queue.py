@@ -0,0 +1,101 @@
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import job_queue
+from job_queue import JobError, JobQueue
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj de job_queue controlado por el test."""
+    ahora = [1_000_000.0]
+    monkeypatch.setattr(job_queue, "time", SimpleNamespace(time=lambda: ahora[0]))
+    return ahora
+
+
+@pytest.fixture
+def cola(tmp_path):
+    cola = JobQueue(tmp_path / "jobs.sqlite3", workers=1, timeout=60)
+    yield cola
+    if cola._pool is not None:
+        cola._pool.shutdown(wait=True)
+
+
+def _esperar(cola, job_id, owner=None, estado="done"):
+    for _ in range(200):
+        job = cola.get(job_id, owner)
+        if job["status"] == estado:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"{job_id} no llegó a {estado}: {job}")
+
+
+def test_trabajo_pasado_el_timeout_se_da_por_interrumpido(cola, reloj):
+    suelta = threading.Event()
+    job_id = cola.submit("211", lambda job: suelta.wait(5) and {"ok": True})
+
+    _esperar(cola, job_id, estado="running")
+    reloj[0] += 61
+    job = cola.get(job_id)
+    assert job["status"] == "error"
+    assert job["http_status"] == 500
+
+    # Uno terminado no caduca por el timeout
+    suelta.set()
+    assert _esperar(cola, job_id)["result"] == {"ok": True}
+
+
+def test_en_cola_con_el_proceso_vivo_no_se_interrumpe(cola, reloj):
+    suelta = threading.Event()
+    primero = cola.submit("211", lambda job: suelta.wait(5) and 1)
+    _esperar(cola, primero, estado="running")
+    segundo = cola.submit("211", lambda job: 2)     # espera al único hilo del pool
+
+    reloj[0] += 61
+    assert cola.get(segundo)["status"] == "queued"
+
+    # Corriendo, el timeout cuenta desde que empezó, no desde que se encoló
+    suelta.set()
+    assert _esperar(cola, segundo)["result"] == 2
+    assert cola.get(primero)["result"] == 1
+
+
+def test_trabajo_de_un_proceso_muerto_se_da_por_interrumpido(cola):
+    muerto = subprocess.Popen([sys.executable, "-c", "pass"])
+    muerto.wait()
+    job_id = cola.submit("211", lambda job: 1)
+    _esperar(cola, job_id)
+    cola._update(job_id, status="running", pid=muerto.pid)
+
+    job = cola.get(job_id)
+    assert job["status"] == "error"
+    assert job["http_status"] == 500
+
+
+def test_get_solo_devuelve_el_trabajo_a_su_dueno(cola):
+    job_id = cola.submit("211", lambda job: {"ok": True}, owner="ana")
+
+    assert _esperar(cola, job_id, "ana")["result"] == {"ok": True}
+    assert cola.get(job_id, "luis") is None
+    assert cola.get(job_id) is None
+
+
+def test_trabajo_sin_dueno_es_visible_para_todos(cola):
+    job_id = cola.submit("211", lambda job: 1)
+
+    assert _esperar(cola, job_id)["result"] == 1
+    assert cola.get(job_id, "luis")["result"] == 1
+
+
+def test_job_error_guarda_mensaje_y_status(cola):
+    def falla(job):
+        raise JobError("PDF ilegible", http_status=422)
+
+    job = _esperar(cola, cola.submit("211", falla), estado="error")
+    assert job["error"] == "PDF ilegible"
+    assert job["http_status"] == 422
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache
+
+# json.dumps("x" * 100) ocupa 102 bytes
+VALOR = "x" * 100
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = [1_000_000.0]
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=lambda: ahora[0]))
+    return ahora
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMCache(tmp_path / "cache.sqlite3", max_bytes=350, enabled=True)
+
+
+def _consultar(cache, clave_, llamadas):
+    def calcular():
+        llamadas.append(clave_)
+        return VALOR
+    return cache.obtener_o_calcular("hoja", clave_, calcular)
+
+
+def test_hit_no_vuelve_a_llamar(cache, reloj):
+    llamadas = []
+    assert _consultar(cache, "a", llamadas) == VALOR
+    assert _consultar(cache, "a", llamadas) == VALOR
+    assert llamadas == ["a"]
+    assert cache.estadisticas()["contadores"]["hoja"] == {"hits": 1, "misses": 1}
+
+
+def test_desalojo_lru_por_ultimo_acceso(cache, reloj):
+    llamadas = []
+    for clave_ in ("a", "b", "c"):
+        _consultar(cache, clave_, llamadas)
+        reloj[0] += 1
+    _consultar(cache, "a", llamadas)        # hit: "a" pasa a ser la más reciente
+    reloj[0] += 1
+
+    # 4 × 102 bytes > 350: se borra la menos usada hasta quedar al 90 %
+    _consultar(cache, "d", llamadas)
+    assert cache.estadisticas()["entradas"] == 3
+
+    llamadas.clear()
+    for clave_ in ("a", "c", "d", "b"):
+        _consultar(cache, clave_, llamadas)
+    assert llamadas == ["b"]
+
+
+def test_bypass_recalcula_y_refresca(cache, reloj):
+    llamadas = []
+    _consultar(cache, "a", llamadas)
+    cache.obtener_o_calcular("hoja", "a", lambda: "nuevo", bypass=True)
+    assert _consultar(cache, "a", llamadas) == "nuevo"
+    assert llamadas == ["a"]
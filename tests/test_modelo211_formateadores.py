@@ -0,0 +1,20 @@
+import bench_211
+from modelo211_generator import get_layout
+
+
+def test_formateadores_compilados_igual_que_el_camino_generico():
+    caidas = []
+    assert bench_211.diferencial_formateadores(300, semilla=211, caidas=caidas) == 0
+    # Las caídas al genérico son solo de valores que el genérico da por erróneos
+    assert all(pagina == "010" for pagina, _ in caidas)
+
+
+def test_un_formateador_que_siempre_lanza_es_discrepancia(monkeypatch):
+    def roto(valores):
+        raise RuntimeError("codegen roto")
+
+    layouts = {p: get_layout(p) for p in ("010", "020", "030")}
+    layouts["020"] = layouts["020"]._replace(formateador=roto)
+    monkeypatch.setattr(bench_211, "get_layout", layouts.__getitem__)
+
+    assert bench_211.diferencial_formateadores(50, semilla=211) > 0
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+from rate_limiter import MemoriaBackend, RateLimiter, SQLiteBackend
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = [1_000_000.0]
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(time=lambda: ahora[0]))
+    return ahora
+
+
+@pytest.fixture(params=["memoria", "sqlite"])
+def limiter(request, tmp_path):
+    """Ráfaga de 2 fichas que se rellena a 1 ficha por segundo."""
+    if request.param == "memoria":
+        backend = MemoriaBackend()
+    else:
+        backend = SQLiteBackend(tmp_path / "ratelimit.sqlite3")
+    return RateLimiter(backend, por_minuto=60, rafaga=2)
+
+
+def test_agota_la_rafaga_y_deniega(limiter, reloj):
+    assert limiter.permitir("ip:1")
+    assert limiter.permitir("ip:1")
+    assert not limiter.permitir("ip:1")
+    # Otra clave tiene su propio cubo
+    assert limiter.permitir("ip:2")
+
+
+def test_rellena_segun_la_tasa(limiter, reloj):
+    limiter.permitir("ip:1")
+    limiter.permitir("ip:1")
+
+    reloj[0] += 0.5
+    assert not limiter.permitir("ip:1")
+    reloj[0] += 0.5
+    assert limiter.permitir("ip:1")
+    assert not limiter.permitir("ip:1")
+
+
+def test_el_relleno_no_pasa_de_la_rafaga(limiter, reloj):
+    reloj[0] += 3600
+    assert limiter.permitir("ip:1")
+    assert limiter.permitir("ip:1")
+    assert not limiter.permitir("ip:1")
+
+
+def test_varias_claves_solo_consumen_si_todas_tienen_ficha(limiter, reloj):
+    limiter.permitir("user:ana")
+    limiter.permitir("user:ana")
+
+    # Denegada por el cubo del usuario: la IP no pierde su ficha
+    assert not limiter.permitir("ip:1", "user:ana")
+    assert limiter.permitir("ip:1")
+    assert limiter.permitir("ip:1")
+    assert not limiter.permitir("ip:1")
@@ -0,0 +1,71 @@
+import pytest
+
+import texto_relevante
+from pdf_extractor import unir_paginas
+from texto_relevante import podar
+
+ADVERTENCIAS = (
+    "ADVERTENCIAS LEGALES. El notario advierte a los otorgantes de las obligaciones "
+    "y responsabilidades tributarias que les incumben, y de las consecuencias de "
+    "toda índole que se derivarían de la inexactitud de sus declaraciones. "
+) * 8
+CATASTRO = (
+    "Certificación catastral descriptiva y gráfica. Inmueble: clase urbano, uso "
+    "residencial. Superficie construida según catastro, año de construcción y "
+    "coeficiente de participación en el régimen de propiedad horizontal. "
+) * 8
+PLANO = "ANEXO. Plano de la finca y de su situación en la parcela, a escala. " * 12
+RGPD = (
+    "Protección de datos: conforme al Reglamento (UE) 2016/679 los datos de los "
+    "otorgantes se incorporan a los ficheros de la notaría. "
+) * 8
+
+# Escritura de 10 páginas: las de datos con identificadores y el resto relleno
+ESCRITURA = [
+    (1, "En Las Palmas, ante mí, Notario, número de protocolo 1234. COMPARECEN:"),
+    (2, "DON HANS MÜLLER con NIE X1234567L, no residente, con domicilio en Berlín."),
+    (3, ADVERTENCIAS),
+    (4, ADVERTENCIAS),
+    (5, ADVERTENCIAS),
+    (6, "PRECIO.- 250.000,00 euros, retención del 3 % por no residente."),
+    (7, PLANO),
+    (8, CATASTRO),
+    (9, CATASTRO),
+    (10, RGPD),
+]
+
+
+@pytest.fixture(autouse=True)
+def poda_activa(monkeypatch):
+    monkeypatch.setattr(texto_relevante, "PODA_ENABLED", True)
+
+
+def _enviadas(texto: str) -> set[int]:
+    return {n for n, _ in ESCRITURA if f"--- Página {n} ---" in texto}
+
+
+def test_poda_el_relleno_de_una_escritura():
+    podado, informe = podar(unir_paginas(ESCRITURA), "escritura")
+
+    # Inicio, datos y una página de margen a cada lado de los datos
+    assert _enviadas(podado) == {1, 2, 3, 5, 6, 7}
+    assert "[... página(s) 4 omitida(s)" in podado
+    assert "[... página(s) 8-10 omitida(s)" in podado
+    assert informe["paginas_enviadas"] == 6
+    assert informe["tokens_ahorrados"] > 0
+
+
+def test_nunca_poda_una_pagina_con_identificadores():
+    paginas = list(ESCRITURA)
+    paginas[9] = (10, RGPD + " Cesionario: DOÑA ANNA SCHMIDT, NIE Y7654321K.")
+
+    podado, _ = podar(unir_paginas(paginas), "escritura")
+    assert 10 in _enviadas(podado)
+    assert 9 not in _enviadas(podado)
+
+
+def test_conserva_el_texto_anterior_a_la_primera_pagina():
+    texto = "NOTARÍA DE LAS PALMAS - COPIA SIMPLE\n\n" + unir_paginas(ESCRITURA)
+
+    podado, _ = podar(texto, "escritura")
+    assert podado.startswith("NOTARÍA DE LAS PALMAS - COPIA SIMPLE")